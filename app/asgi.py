@@ -0,0 +1,194 @@
+"""Async webhook server as a plain ASGI application (no framework needed).
+
+The bot is built and started in the server's lifespan and runs on the
+server's own event loop, so a webhook request only parses the update and
+puts it on PTB's ``update_queue`` — one worker process can hold hundreds of
+requests at once.  Run it with any ASGI server, e.g. ``uvicorn asgi:app``.
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from app.bot import get_application, start_application, stop_application
+from app.config import WEBHOOK_SECRET, INLINE_REPLIES
+from app.dedup import deduplicator
+from app.inline_reply import process_with_inline_reply
+from app.metrics import CONTENT_TYPE, UPDATES, WEBHOOK_SECONDS, render
+from app.profiling import admin_endpoint
+from app.recorder import recorder
+from app.status import health_status
+from app.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Telegram updates are a few KB; anything far larger is not from Telegram
+MAX_BODY = 1 << 20
+
+WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}"
+
+
+async def _respond(send, status: int, payload: dict | str, content_type: bytes = b"") -> None:
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), content_type or b"text/plain; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload).encode(), b"application/json"
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> bytes | None:
+    """The request body, or ``None`` once it exceeds :data:`MAX_BODY`."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def webhook(scope, receive, send) -> None:
+    """Receive updates from Telegram via webhook."""
+    with WEBHOOK_SECONDS.labels("asgi").time():
+        await _webhook(scope, receive, send)
+
+
+async def _webhook(scope, receive, send) -> None:
+    if _header(scope, b"content-type").split(";")[0].strip() != "application/json":
+        await _respond(send, 415, "Unsupported Media Type")
+        return
+
+    raw = await _read_body(receive)
+    if raw is None:
+        await _respond(send, 413, "Payload Too Large")
+        return
+    try:
+        data = json.loads(raw) if raw else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not data:
+        UPDATES.labels("rejected").inc()
+        await _respond(send, 400, "Bad Request")
+        return
+
+    # Acknowledge redeliveries straight away, without building an Update
+    update_id = data.get("update_id")
+    if isinstance(update_id, int) and await asyncio.to_thread(deduplicator.seen, update_id):
+        UPDATES.labels("duplicate").inc()
+        await _respond(send, 200, "OK")
+        return
+
+    handed_off = False
+    try:
+        handed_off = await _hand_off(data, send)
+    finally:
+        # Let Telegram's redelivery through instead of acknowledging it as a duplicate
+        if not handed_off and isinstance(update_id, int):
+            await asyncio.to_thread(deduplicator.forget, update_id)
+
+
+async def _hand_off(data: dict, send) -> bool:
+    """Queue (or, with inline replies, process) *data*; ``False`` if it was rejected."""
+    ptb_app = get_application()
+    try:
+        update = tracer.decode(data, ptb_app.bot)
+    except Exception as exc:
+        logger.error("Dropping malformed update: %s", exc)
+        UPDATES.labels("rejected").inc()
+        await _respond(send, 400, "Bad Request")
+        return False
+    UPDATES.labels("accepted").inc()
+    recorder.arrived(data)
+    if INLINE_REPLIES:
+        body = await process_with_inline_reply(ptb_app, update)
+        await _respond(send, 200, body if body is not None else "OK")
+        return True
+    await ptb_app.update_queue.put(update)
+    await _respond(send, 200, "OK")
+    return True
+
+
+async def health(scope, receive, send) -> None:
+    await _respond(send, 200, health_status(get_application()))
+
+
+async def metrics(scope, receive, send) -> None:
+    await _respond(send, 200, render(health_status(get_application())), CONTENT_TYPE.encode())
+
+
+async def debug_profile(scope, receive, send) -> None:
+    params = {k: v[-1] for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()}
+    token = _header(scope, b"x-admin-token") or params.pop("token", "")
+    status, body, headers = admin_endpoint(scope["method"], params, token)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+        + [(b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def index(scope, receive, send) -> None:
+    await _respond(send, 200, {"message": "Email Telegram Bot is running!"})
+
+
+ROUTES = {
+    WEBHOOK_PATH: (("POST",), webhook),
+    "/health": (("GET",), health),
+    "/metrics": (("GET",), metrics),
+    "/debug/profile": (("GET", "POST"), debug_profile),
+    "/": (("GET",), index),
+}
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await start_application(get_application())
+            except Exception as exc:
+                logger.exception("Bot startup failed")
+                await send({"type": "lifespan.startup.failed", "message": str(exc)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await stop_application(get_application())
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    route = ROUTES.get(scope["path"])
+    if route is None:
+        await _respond(send, 404, "Not Found")
+        return
+    methods, handler = route
+    if scope["method"] not in methods and not ("GET" in methods and scope["method"] == "HEAD"):
+        await _respond(send, 405, "Method Not Allowed")
+        return
+    await handler(scope, receive, send)
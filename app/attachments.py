@@ -0,0 +1,146 @@
+"""Files attached to a draft: described on upload, fetched only when sending.
+
+A draft — and the outbox or schedule row made from it — keeps just each
+file's Telegram ``file_id``, name, type and size, so ``user_data`` stays
+small JSON.  The bytes are fetched when the email is actually sent, in the
+mail thread: streamed from the Bot API file endpoint into a
+:class:`~tempfile.SpooledTemporaryFile` (in memory up to
+``ATTACHMENT_SPOOL_BYTES``, a temp file beyond that) which is closed, and so
+deleted, as soon as the send is over.  A retry, another worker or a send
+scheduled for next week simply fetches the file again.
+
+Size caps are checked when a file is attached, from the size Telegram
+reports, and again while downloading, since that size is optional.
+"""
+import mimetypes
+import tempfile
+from contextlib import ExitStack, contextmanager
+from typing import BinaryIO, Iterator
+
+import httpx
+from telegram import Bot, Message
+from telegram.error import BadRequest, NetworkError
+
+from app.config import (
+    ATTACHMENT_MAX_BYTES,
+    ATTACHMENT_MAX_FILES,
+    ATTACHMENT_MAX_TOTAL,
+    ATTACHMENT_SPOOL_BYTES,
+    ATTACHMENT_TIMEOUT,
+)
+from app.tracing import span
+from app.transport import ssl_context
+
+_CHUNK = 64 * 1024
+
+
+class AttachmentError(Exception):
+    """An attachment that cannot be sent; the email fails without retries."""
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def describe(message: Message) -> dict | None:
+    """The file a document or photo message carries, as draft metadata."""
+    if message.document is not None:
+        document = message.document
+        name = document.file_name or f"file-{document.file_unique_id}"
+        mime = document.mime_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        file, size = document, document.file_size
+    elif message.photo:
+        file = message.photo[-1]   # the largest size Telegram kept
+        name, mime, size = f"photo-{file.file_unique_id}.jpg", "image/jpeg", file.file_size
+    else:
+        return None
+    return {
+        "file_id": file.file_id,
+        "file_unique_id": file.file_unique_id,
+        "name": name,
+        "mime": mime,
+        "size": size or 0,
+    }
+
+
+def check(attached: list[dict], new: dict) -> str | None:
+    """Why *new* cannot join the *attached* files, or ``None`` if it can."""
+    if len(attached) >= ATTACHMENT_MAX_FILES:
+        return f"At most {ATTACHMENT_MAX_FILES} files can be attached."
+    if new["size"] > ATTACHMENT_MAX_BYTES:
+        return f"That file is too large (max {format_size(ATTACHMENT_MAX_BYTES)})."
+    if sum(a["size"] for a in attached) + new["size"] > ATTACHMENT_MAX_TOTAL:
+        return f"Attachments can total at most {format_size(ATTACHMENT_MAX_TOTAL)}."
+    return None
+
+
+def key_fields(attachments: list[dict]) -> dict:
+    """Idempotency-key fields for *attachments* — none at all without any."""
+    return {"files": [a["file_unique_id"] for a in attachments]} if attachments else {}
+
+
+# ── Sending ───────────────────────────────────────────────────────────────────
+
+async def resolve(bot: Bot, attachments: list[dict]) -> list[str]:
+    """Download URLs for *attachments*; ``getFile`` links stay valid for an hour."""
+    urls = []
+    for attachment in attachments:
+        try:
+            file = await bot.get_file(attachment["file_id"])
+        except BadRequest as exc:
+            raise AttachmentError(f"{attachment['name']} is no longer available: {exc}") from exc
+        except NetworkError as exc:
+            # An OSError, so the outbox retries it
+            raise ConnectionError(f"Could not look up {attachment['name']}: {exc}") from exc
+        urls.append(file.file_path)
+    return urls
+
+
+def download(url: str, name: str, limit: int) -> tempfile.SpooledTemporaryFile:
+    """Stream *url* into a spooled temp file, rewound; the caller closes it.
+
+    Errors never include *url*: it contains the bot token.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_BYTES)
+    try:
+        with (
+            span("attachment.download", client=True),
+            httpx.Client(verify=ssl_context(False), timeout=ATTACHMENT_TIMEOUT) as client,
+            client.stream("GET", url) as response,
+        ):
+            if response.status_code >= 500:
+                raise ConnectionError(f"Could not download {name}: HTTP {response.status_code}")
+            if response.status_code != 200:
+                raise AttachmentError(f"Could not download {name}: HTTP {response.status_code}")
+            size = 0
+            for chunk in response.iter_bytes(_CHUNK):
+                size += len(chunk)
+                if size > limit:
+                    raise AttachmentError(f"{name} is larger than {format_size(limit)}")
+                spool.write(chunk)
+    except httpx.TransportError as exc:
+        spool.close()
+        raise ConnectionError(f"Could not download {name}: {type(exc).__name__}") from None
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+@contextmanager
+def fetched(attachments: list[dict], urls: list[str]) -> Iterator[list[tuple[str, str, BinaryIO]]]:
+    """``(name, mime, file)`` for each attachment; every file is deleted on exit."""
+    with ExitStack() as stack:
+        files, remaining = [], ATTACHMENT_MAX_TOTAL
+        for attachment, url in zip(attachments, urls):
+            limit = min(ATTACHMENT_MAX_BYTES, remaining)
+            file = stack.enter_context(download(url, attachment["name"], limit))
+            remaining -= file.seek(0, 2)
+            file.seek(0)
+            files.append((attachment["name"], attachment["mime"], file))
+        yield files
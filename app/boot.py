@@ -0,0 +1,74 @@
+"""Startup timing, and the logging setup every entry point shares.
+
+:data:`boot` times this process's startup from when it began (read from
+``/proc`` on Linux, so the interpreter's own start counts) to four marks:
+
+* ``imported`` — the entry point has imported the app
+* ``built`` — the :class:`~telegram.ext.Application` is constructed
+* ``ready`` — it is initialized and started
+* ``first_update`` — the first update has been handled
+
+Each mark is logged once and shows up under ``boot`` in ``/health`` (and so
+as gauges in ``/metrics``).  Under gunicorn ``--preload`` the imports happen
+once in the master; a forked worker starts its clock at the fork and
+reports ``preloaded`` instead of an ``imported`` mark.
+
+This module imports nothing heavy, so entry points import it first.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("imported", "built", "ready", "first_update")
+
+
+def configure_logging() -> None:
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO
+    )
+
+
+def _process_started() -> float:
+    """Wall-clock start of this process, or now where ``/proc`` is unavailable."""
+    try:
+        with open("/proc/self/stat") as file:
+            # Field 22, counted after the parenthesised command name
+            ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return time.time()
+    return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+
+
+class BootTimer:
+    def __init__(self) -> None:
+        self.started = _process_started()
+        self.preloaded = False
+        self.marks: dict[str, float] = {}
+        os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self) -> None:
+        self.started = time.time()
+        self.preloaded = "imported" in self.marks or self.preloaded
+        self.marks = {}
+
+    def mark(self, phase: str) -> None:
+        """Record *phase* the first time it is reached in this process."""
+        if phase in self.marks:
+            return
+        self.marks[phase] = elapsed = (time.time() - self.started) * 1000
+        logger.info("Boot: %s after %.0f ms (pid %d)", phase, elapsed, os.getpid())
+
+    def stats(self) -> dict:
+        return {
+            "preloaded": self.preloaded,
+            **{f"{phase}_ms": round(self.marks[phase], 1)
+               for phase in PHASES if phase in self.marks},
+        }
+
+
+boot = BootTimer()
@@ -0,0 +1,160 @@
+"""Build the PTB application — shared by the webhook and polling entry points."""
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    MessageHandler,
+    filters,
+)
+from telegram.request import HTTPXRequest
+
+from app.boot import boot
+from app.config import (
+    BOT_TOKEN,
+    FLOOD_CONTROL,
+    TELEGRAM_API_URL,
+    TELEGRAM_FILE_URL,
+    UPDATE_CONCURRENCY,
+)
+from app.handlers.commands import start_command
+from app.handlers.flow import button_callback, handle_document, handle_message
+from app.inline_reply import InlineReplyBot
+from app.lanes import LaneUpdateProcessor
+from app.lifecycle import on_startup, on_shutdown
+from app.persistence import SharedPersistence, build_persistence, write_through
+from app.profiling import profiler
+from app.ratelimit import FloodControlLimiter
+from app.recorder import recorder
+from app.tracing import tracer
+from app.transport import InstrumentedRequest, ssl_context
+from app.utils.keyboards import serialized
+
+
+class ObservedApplication(Application):
+    """:class:`Application` with the recording, tracing and profiling hooks,
+    and the user-state write-through of :class:`SharedPersistence`.
+
+    ``process_update`` is the one path every serving mode (webhook, inline
+    replies, per-request, polling) takes.  With recording, tracing and
+    profiling off it adds a few attribute checks per update.
+    """
+
+    async def process_update(self, update: object) -> None:
+        root = tracer.begin(update)
+        profiled = profiler.should_profile()
+        started = time.perf_counter()
+        ok = False
+        try:
+            with (
+                root.activate() if root else nullcontext(),
+                profiler.profile() if profiled else nullcontext(),
+                self._persisting(update),
+            ):
+                await super().process_update(update)
+            ok = True
+        finally:
+            if root:
+                root.end()
+            if recorder.enabled and isinstance(update, Update):
+                recorder.finished(update, started, time.perf_counter(), ok)
+            boot.mark("first_update")
+
+    def _persisting(self, update: object):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None or not isinstance(self.persistence, SharedPersistence):
+            return nullcontext()
+        return self.persistence.handling(user.id, self.user_data[user.id])
+
+
+class ApplicationBot(InlineReplyBot):
+    """The bot every serving mode uses: stores user state before each request
+    and sends shared keyboards in their pre-serialized form."""
+
+    async def _do_post(self, endpoint: str, data: dict, **timeouts):
+        write_through()
+        markup = serialized(data.get("reply_markup"))
+        if markup is not None:
+            data["reply_markup"] = markup
+        return await super()._do_post(endpoint=endpoint, data=data, **timeouts)
+
+
+def register_handlers(application: Application) -> None:
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.Document.ALL | filters.PHOTO, handle_document))
+    application.add_handler(CallbackQueryHandler(button_callback))
+
+
+def build_application() -> Application:
+    """A fully configured, not yet initialized :class:`Application`."""
+    bot = ApplicationBot(
+        BOT_TOKEN,
+        base_url=TELEGRAM_API_URL,
+        base_file_url=TELEGRAM_FILE_URL,
+        request=InstrumentedRequest(),
+        get_updates_request=HTTPXRequest(httpx_kwargs={"verify": ssl_context(False)}),
+        rate_limiter=FloodControlLimiter() if FLOOD_CONTROL else None,
+    )
+    builder = (
+        Application.builder()
+        .application_class(ObservedApplication)
+        .bot(bot)
+        .post_init(on_startup)
+        .post_stop(on_shutdown)
+    )
+    if UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(LaneUpdateProcessor())
+    persistence = build_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+    register_handlers(application)
+    boot.mark("built")
+    return application
+
+
+_application: Application | None = None
+_application_pid = 0
+_application_lock = threading.Lock()
+
+
+def get_application() -> Application:
+    """This process's :class:`Application`, built on first use.
+
+    Nothing is built at import, so a gunicorn ``--preload`` master can
+    import the app and fork: each worker builds its own HTTP clients and
+    persistence connection, and starts its event loop later still.
+    """
+    global _application, _application_pid
+    if _application_pid != os.getpid():
+        with _application_lock:
+            if _application_pid != os.getpid():
+                _application = build_application()
+                _application_pid = os.getpid()
+    return _application
+
+
+async def start_application(application: Application) -> None:
+    """Initialize and start *application*, running its ``post_init`` hook."""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    boot.mark("ready")
+
+
+async def stop_application(application: Application) -> None:
+    """Reverse of :func:`start_application`, running the stop/shutdown hooks."""
+    if application.running:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
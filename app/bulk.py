@@ -0,0 +1,229 @@
+"""Bulk send: one draft to many recipients, merged and sent concurrently.
+
+Recipients come from the selected receiver groups and/or a pasted or
+uploaded list — plain addresses, or CSV with a header row containing an
+``email`` column (plus an optional ``cc`` column; every other column is a
+merge field).  ``{field}`` in the subject or body is replaced per recipient;
+``{email}`` and, for groups, ``{group}`` are always available.
+
+Each recipient is recorded in the outbox under its own idempotency key, so a
+double tap sends nothing twice and transient failures are retried by the
+dispatcher like any other mail.  Sends stream through a fixed number of
+workers sharing the SMTP pool, and a single status message is edited at
+most every ``BULK_PROGRESS_INTERVAL`` seconds.
+"""
+import asyncio
+import csv
+import logging
+import re
+import time
+
+from telegram import Bot
+
+from app import config
+from app.config import BULK_MAX_RECIPIENTS, BULK_CONCURRENCY, BULK_PROGRESS_INTERVAL
+from app.dispatch import MailJob, mail_dispatcher
+from app.outbox import FAILED, PENDING, SENT, idempotency_key
+from app.ratelimit import BACKGROUND, USER, priority_args
+from app.utils.keyboards import post_send_keyboard
+
+logger = logging.getLogger(__name__)
+
+# Uploaded recipient lists larger than this are refused
+MAX_LIST_BYTES = 256 * 1024
+
+_EMAIL_RE = re.compile(r"[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+")
+_SPLIT_RE = re.compile(r"[\s,;]+")
+_FIELD_RE = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+# ── Recipients ────────────────────────────────────────────────────────────────
+
+def _recipient(to: str, cc: list[str] | None = None, fields: dict | None = None) -> dict:
+    # Plain dicts: recipients live in user_data, which is persisted as JSON
+    return {"to": to, "cc": cc or [], "fields": {**(fields or {}), "email": to}}
+
+
+def parse_recipients(text: str) -> tuple[list[dict], list[str]]:
+    """Parse a pasted/uploaded list; returns ``(recipients, skipped entries)``."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return [], []
+    header = [column.strip().lower() for column in next(csv.reader(lines[:1]))]
+    recipients, skipped = [], []
+    if "email" in header:
+        for row in csv.DictReader(lines[1:], fieldnames=header, restval=""):
+            to = (row.pop("email") or "").strip()
+            cc = [e for e in _SPLIT_RE.split(row.pop("cc", "") or "") if e]
+            if not _EMAIL_RE.fullmatch(to) or not all(_EMAIL_RE.fullmatch(e) for e in cc):
+                skipped.append(to or "(no email)")
+                continue
+            fields = {k: v.strip() for k, v in row.items() if k and isinstance(v, str)}
+            recipients.append(_recipient(to, cc, fields))
+    else:
+        for token in _SPLIT_RE.split(text):
+            if not token:
+                continue
+            if _EMAIL_RE.fullmatch(token):
+                recipients.append(_recipient(token))
+            else:
+                skipped.append(token)
+    return recipients, skipped
+
+
+def group_recipients(keys: list[str]) -> list[dict]:
+    """One recipient per selected group (its receiver, with the group's CCs)."""
+    return [
+        _recipient(group["receiver"], list(group["cc"]), {"group": group["name"]})
+        for group in (config.RECEIVER_GROUPS.get(key) for key in keys)
+        if group
+    ]
+
+
+def collect(user_data: dict) -> list[dict]:
+    """Selected groups plus the pasted list, de-duplicated and capped."""
+    merged, seen = [], set()
+    for recipient in group_recipients(user_data.get("bulk_groups", [])) + user_data.get(
+        "bulk_list", []
+    ):
+        address = recipient["to"].lower()
+        if address not in seen:
+            seen.add(address)
+            merged.append(recipient)
+    return merged[:BULK_MAX_RECIPIENTS]
+
+
+def merge(text: str, fields: dict) -> str:
+    """Replace ``{field}`` with the recipient's value; unknown fields stay as is."""
+    return _FIELD_RE.sub(lambda m: fields.get(m.group(1).lower(), m.group(0)), text)
+
+
+def record(
+    user_id: int,
+    draft_id: str,
+    subject: str,
+    body: str,
+    recipients: list[dict],
+    html_template: str = "",
+) -> list[int]:
+    """Write one outbox row per recipient; returns the ids of rows not already queued."""
+    # A field some recipients have and others lack merges as empty text
+    blank = {name: "" for recipient in recipients for name in recipient["fields"]}
+    rows = []
+    for recipient in recipients:
+        fields = {**blank, **recipient["fields"]}
+        job = MailJob(
+            receiver=recipient["to"],
+            subject=merge(subject, fields),
+            body=merge(body, fields),
+            cc_list=list(recipient["cc"]),
+            html_template=html_template,
+        )
+        key = idempotency_key(
+            user_id,
+            draft_id,
+            {"to": job.receiver, "cc": job.cc_list, "subject": job.subject, "body": job.body},
+        )
+        row_id = mail_dispatcher.record(job, key)
+        if row_id is not None:
+            rows.append(row_id)
+    return rows
+
+
+# ── Sending ───────────────────────────────────────────────────────────────────
+
+class BulkSend:
+    """Send recorded rows through a few workers and report progress in one message."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        rows: list[int],
+        chat_id: int,
+        message_id: int,
+        *,
+        concurrency: int = BULK_CONCURRENCY,
+        interval: float = BULK_PROGRESS_INTERVAL,
+    ) -> None:
+        self.bot = bot
+        self.rows = rows
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.concurrency = max(1, concurrency)
+        self.interval = interval
+        self.counts = {SENT: 0, FAILED: 0, PENDING: 0}
+        self.done = 0
+        self._reported = -1
+
+    async def run(self) -> None:
+        started = time.monotonic()
+        pending = iter(self.rows)
+        finished = asyncio.Event()
+        reporter = asyncio.create_task(self._report_progress(finished))
+        try:
+            await asyncio.gather(*(self._worker(pending) for _ in range(self.concurrency)))
+        finally:
+            finished.set()
+            await reporter
+        logger.info(
+            "Bulk send of %d rows finished in %.1fs: %s",
+            len(self.rows), time.monotonic() - started, self.counts,
+        )
+        await self._edit(self._summary(), USER, reply_markup=post_send_keyboard())
+
+    async def _worker(self, pending) -> None:
+        # Workers share one iterator, so rows are taken strictly one at a time
+        for row_id in pending:
+            try:
+                status = await mail_dispatcher.run_row(row_id, self.bot)
+            except Exception as exc:
+                logger.error("Bulk send of row %s failed: %s", row_id, exc)
+                status = FAILED
+            if status in self.counts:
+                self.counts[status] += 1
+            self.done += 1
+
+    async def _report_progress(self, finished: asyncio.Event) -> None:
+        while not finished.is_set():
+            try:
+                await asyncio.wait_for(finished.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if not finished.is_set() and self.done != self._reported:
+                self._reported = self.done
+                await self._edit(self._progress(), BACKGROUND)
+
+    def _progress(self) -> str:
+        total = len(self.rows)
+        filled = round(10 * self.done / total) if total else 10
+        return (
+            f"⏳ **Bulk send:** {self.done}/{total}\n"
+            f"{'▓' * filled}{'░' * (10 - filled)}\n\n"
+            f"✅ {self.counts[SENT]}   ❌ {self.counts[FAILED]}   🔁 {self.counts[PENDING]}"
+        )
+
+    def _summary(self) -> str:
+        lines = [
+            "📨 **Bulk send finished**\n",
+            f"✅ Sent: {self.counts[SENT]}",
+            f"❌ Failed: {self.counts[FAILED]}",
+        ]
+        if self.counts[PENDING]:
+            lines.append(f"🔁 Retrying later: {self.counts[PENDING]}")
+        others = len(self.rows) - sum(self.counts.values())
+        if others:
+            lines.append(f"📬 Handled by the mail queue: {others}")
+        return "\n".join(lines) + "\n\nWhat's next?"
+
+    async def _edit(self, text: str, priority: int, **kwargs) -> None:
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                text=text,
+                parse_mode="Markdown",
+                rate_limit_args=priority_args(priority),
+                **kwargs,
+            )
+        except Exception as exc:
+            logger.error("Could not report bulk progress to chat %s: %s", self.chat_id, exc)
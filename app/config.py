@@ -9,12 +9,158 @@ BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
 EMAIL_ADDRESS: str = os.getenv("EMAIL_ADDRESS", "")
 EMAIL_PASSWORD: str = os.getenv("EMAIL_PASSWORD", "")
 
+# Bot API server (a self-hosted Bot API server, or the fake in bench/)
+TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+TELEGRAM_FILE_URL: str = os.getenv(
+    "TELEGRAM_FILE_URL", TELEGRAM_API_URL.removesuffix("bot") + "file/bot"
+)
+
+# ── SMTP ──────────────────────────────────────────────────────────────────────
+SMTP_HOST: str = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS: bool = os.getenv("SMTP_STARTTLS", "1") == "1"   # 0 for a local sink
+SMTP_POOL_SIZE: int = int(os.getenv("SMTP_POOL_SIZE", "4"))     # max open sessions
+SMTP_MAX_IDLE: float = float(os.getenv("SMTP_MAX_IDLE", "60"))  # seconds before reconnect
+SMTP_TIMEOUT: float = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+# Background send workers per process and how many jobs may wait for them
+MAIL_WORKERS: int = int(os.getenv("MAIL_WORKERS", str(SMTP_POOL_SIZE)))
+MAIL_QUEUE_SIZE: int = int(os.getenv("MAIL_QUEUE_SIZE", "100"))
+
+# ── Outbox (durable send queue) ───────────────────────────────────────────────
+OUTBOX_DB_PATH: str = os.getenv("OUTBOX_DB_PATH", "data/outbox.sqlite3")
+OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BASE: float = float(os.getenv("OUTBOX_RETRY_BASE", "10"))    # seconds
+OUTBOX_RETRY_MAX: float = float(os.getenv("OUTBOX_RETRY_MAX", "900"))     # seconds
+OUTBOX_LEASE: float = float(os.getenv("OUTBOX_LEASE", "300"))             # reclaim stuck sends
+OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "30"))
+
+# ── Bulk send ─────────────────────────────────────────────────────────────────
+BULK_MAX_RECIPIENTS: int = int(os.getenv("BULK_MAX_RECIPIENTS", "200"))
+BULK_CONCURRENCY: int = int(os.getenv("BULK_CONCURRENCY", str(SMTP_POOL_SIZE)))  # sends in flight
+BULK_PROGRESS_INTERVAL: float = float(os.getenv("BULK_PROGRESS_INTERVAL", "3"))  # s between edits
+
+# ── Attachments ───────────────────────────────────────────────────────────────
+# Bots can download at most 20 MB per file; 18 MB in total stays under
+# Gmail's 25 MB message limit once base64-encoded
+ATTACHMENT_MAX_BYTES: int = int(os.getenv("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024)))
+ATTACHMENT_MAX_TOTAL: int = int(os.getenv("ATTACHMENT_MAX_TOTAL", str(18 * 1024 * 1024)))
+ATTACHMENT_MAX_FILES: int = int(os.getenv("ATTACHMENT_MAX_FILES", "5"))
+ATTACHMENT_SPOOL_BYTES: int = int(os.getenv("ATTACHMENT_SPOOL_BYTES", str(1024 * 1024)))  # then disk
+ATTACHMENT_TIMEOUT: float = float(os.getenv("ATTACHMENT_TIMEOUT", "60"))   # connect / read, s
+
+# ── Scheduled sends ───────────────────────────────────────────────────────────
+SCHEDULE_DB_PATH: str = os.getenv("SCHEDULE_DB_PATH", "data/schedule.sqlite3")
+TIMEZONE: str = os.getenv("TIMEZONE", "Asia/Kolkata")            # for times users type
+SCHEDULE_MORNING: str = os.getenv("SCHEDULE_MORNING", "09:00")   # "morning of the date"
+SCHEDULE_MAX_DAYS: int = int(os.getenv("SCHEDULE_MAX_DAYS", "90"))
+SCHEDULE_POLL_INTERVAL: float = float(os.getenv("SCHEDULE_POLL_INTERVAL", "30"))
+SCHEDULE_LEASE: float = float(os.getenv("SCHEDULE_LEASE", "60"))  # reclaim a crashed firing
+
 # ── Webhook ───────────────────────────────────────────────────────────────────
 # A random secret token that forms part of the webhook URL, e.g.:
 #   https://yourdomain.com/webhook/<WEBHOOK_SECRET>
 WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "supersecrettoken")
 WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "")   # e.g. https://yourdomain.com
 
+# How the webhook route drives the bot:
+#   "background"  — one Application per worker, initialized once on a
+#                   background event loop; the route returns immediately
+#   "per_request" — legacy: initialize/shutdown the Application per update
+BOT_RUNTIME: str = os.getenv("BOT_RUNTIME", "background")
+
+# Return the first Bot API call a handler makes as the webhook's HTTP response
+# instead of a separate request; later calls go out as usual (see
+# app/inline_reply.py). Off by default.
+INLINE_REPLIES: bool = os.getenv("INLINE_REPLIES", "0") == "1"
+INLINE_REPLY_WAIT: float = float(os.getenv("INLINE_REPLY_WAIT", "2"))   # seconds
+# Methods that may be held. A held call returns True to the handler, which is
+# only the real result for answerCallbackQuery: adding e.g. sendMessage saves
+# more requests, but handlers then get True instead of a Message, and the
+# message reaches the chat after the response, possibly after later edits.
+INLINE_REPLY_METHODS: frozenset[str] = frozenset(
+    m.strip() for m in os.getenv("INLINE_REPLY_METHODS", "answerCallbackQuery").split(",")
+    if m.strip()
+)
+
+# ── Outbound flood control ────────────────────────────────────────────────────
+# Queue Bot API calls to stay under Telegram's limits instead of hitting
+# RetryAfter; user-facing replies are served before background edits.
+FLOOD_CONTROL: bool = os.getenv("FLOOD_CONTROL", "1") == "1"
+RATE_GLOBAL: float = float(os.getenv("RATE_GLOBAL", "30"))                  # requests/s, all chats
+RATE_CHAT: float = float(os.getenv("RATE_CHAT", "1"))                      # messages/s, private chat
+RATE_GROUP_PER_MINUTE: float = float(os.getenv("RATE_GROUP_PER_MINUTE", "20"))
+RATE_CHAT_BURST: float = float(os.getenv("RATE_CHAT_BURST", "3"))          # short bursts per chat
+RATE_MAX_RETRIES: int = int(os.getenv("RATE_MAX_RETRIES", "3"))            # RetryAfter retries
+
+# ── Bot API HTTP pool ─────────────────────────────────────────────────────────
+# Connections to api.telegram.org are kept alive and reused; HTTP/2 needs the
+# python-telegram-bot[http2] extra.
+BOT_API_POOL_SIZE: int = int(os.getenv("BOT_API_POOL_SIZE", "256"))           # max open connections
+BOT_API_KEEPALIVE: int = int(os.getenv("BOT_API_KEEPALIVE", "32"))            # idle connections kept
+BOT_API_KEEPALIVE_EXPIRY: float = float(os.getenv("BOT_API_KEEPALIVE_EXPIRY", "60"))  # seconds idle
+BOT_API_HTTP2: bool = os.getenv("BOT_API_HTTP2", "0") == "1"
+BOT_API_CONNECT_TIMEOUT: float = float(os.getenv("BOT_API_CONNECT_TIMEOUT", "5"))
+BOT_API_READ_TIMEOUT: float = float(os.getenv("BOT_API_READ_TIMEOUT", "5"))
+BOT_API_WRITE_TIMEOUT: float = float(os.getenv("BOT_API_WRITE_TIMEOUT", "5"))
+BOT_API_POOL_TIMEOUT: float = float(os.getenv("BOT_API_POOL_TIMEOUT", "1"))  # wait for a free connection
+
+# ── Update processing ─────────────────────────────────────────────────────────
+# Updates from different chats run concurrently, up to UPDATE_CONCURRENCY at a
+# time; one chat's updates always run in arrival order. 1 = strictly serial.
+UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "8"))
+UPDATE_MAX_PENDING: int = int(os.getenv("UPDATE_MAX_PENDING", "256"))   # accepted before intake waits
+
+# ── Long polling ──────────────────────────────────────────────────────────────
+# Used by ``python app.py --polling`` instead of the webhook route
+POLL_TIMEOUT: int = int(os.getenv("POLL_TIMEOUT", "50"))     # seconds Telegram holds getUpdates open
+POLL_LIMIT: int = int(os.getenv("POLL_LIMIT", "100"))        # updates per batch (Telegram max: 100)
+POLL_OFFSET_DB_PATH: str = os.getenv("POLL_OFFSET_DB_PATH", "data/polling.sqlite3")
+
+# ── Conversation state ────────────────────────────────────────────────────────
+# Where per-user flow state lives so every gunicorn worker sees the same data:
+#   "sqlite" (default), "redis" (local key-value server) or "memory" (per process)
+STATE_BACKEND: str = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "data/bot_state.sqlite3")
+STATE_REDIS_URL: str = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+# Seconds between write-behind flushes of user_data changed outside an update
+# (the user of an update is written before each reply)
+STATE_UPDATE_INTERVAL: float = float(os.getenv("STATE_UPDATE_INTERVAL", "0.1"))
+
+# ── Update de-duplication ─────────────────────────────────────────────────────
+# Telegram redelivers webhook updates; remember the last DEDUP_WINDOW ids per
+# worker, and with DEDUP_BACKEND=sqlite share them across workers.
+DEDUP_BACKEND: str = os.getenv("DEDUP_BACKEND", "sqlite")   # "sqlite" or "memory"
+DEDUP_DB_PATH: str = os.getenv("DEDUP_DB_PATH", "data/updates.sqlite3")
+DEDUP_WINDOW: int = int(os.getenv("DEDUP_WINDOW", "10000"))
+DEDUP_TTL: float = float(os.getenv("DEDUP_TTL", "86400"))   # seconds kept in the shared table
+
+# ── Update recording ──────────────────────────────────────────────────────────
+# Append every received update, with arrival time and processing latency, to
+# JSONL files for `python -m bench.replay`. One file per worker process.
+RECORD_UPDATES: bool = os.getenv("RECORD_UPDATES", "0") == "1"
+RECORD_DIR: str = os.getenv("RECORD_DIR", "data/recordings")
+RECORD_MAX_BYTES: int = int(os.getenv("RECORD_MAX_BYTES", str(50 << 20)))   # rotate after this
+RECORD_BACKUPS: int = int(os.getenv("RECORD_BACKUPS", "5"))                 # rotated files kept
+RECORD_REDACT: bool = os.getenv("RECORD_REDACT", "1") == "1"   # strip names, text, addresses
+RECORD_SALT: str = os.getenv("RECORD_SALT", "")                # keys the chat/user id pseudonyms
+
+# ── Tracing and profiling ─────────────────────────────────────────────────────
+# Percent of updates traced (spans for de_json, handler, preview, Bot API, SMTP)
+TRACE_SAMPLE: float = float(os.getenv("TRACE_SAMPLE", "0"))
+TRACE_EXPORT: str = os.getenv("TRACE_EXPORT", "log")   # "log" (JSON lines) or "otlp" (file)
+TRACE_FILE: str = os.getenv("TRACE_FILE", "data/traces.otlp.jsonl")
+# Percent of updates run under cProfile; stats at /debug/profile
+PROFILE_SAMPLE: float = float(os.getenv("PROFILE_SAMPLE", "0"))
+# Enables /debug/profile (send it as the X-Admin-Token header); empty = disabled
+ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+
+# ── Hot-reloadable content ────────────────────────────────────────────────────
+# Optional JSON or TOML file with "receiver_groups" and/or "preset_messages".
+# Each worker re-reads it when its mtime changes; no restart needed.
+CONTENT_FILE: str = os.getenv("CONTENT_FILE", "")
+CONTENT_POLL_INTERVAL: float = float(os.getenv("CONTENT_POLL_INTERVAL", "5"))   # seconds
+
 # ── Receiver groups ───────────────────────────────────────────────────────────
 _default_groups = {
     "hr_managers": {
@@ -95,8 +241,56 @@ PRESET_MESSAGES: dict = {
     },
 }
 
-# Preset keys that need date input
-DATE_REQUIRING_PRESETS = {"leave_request", "wfh", "half_day", "half_day_leave_wfh"}
+# ── HTML templates ────────────────────────────────────────────────────────────
+# An email with a template goes out as HTML plus the plain text; without one
+# it is plain text only.  Variables: {{body}} (the plain body, escaped, blank
+# lines as paragraphs), {{subject}} and {{sender}}.  A preset may name its own
+# with "html_template"; "" keeps that preset plain text.
+HTML_TEMPLATES: dict = {
+    "basic": (
+        "<!DOCTYPE html>\n"
+        "<html>\n"
+        "<head><meta charset=\"utf-8\"><title>{{subject}}</title></head>\n"
+        "<body style=\"margin:0;padding:24px;font-family:Arial,Helvetica,sans-serif;"
+        "font-size:14px;line-height:1.5;color:#222;\">\n"
+        "<div style=\"max-width:600px;\">\n"
+        "{{body}}\n"
+        "<hr style=\"border:none;border-top:1px solid #ddd;margin:24px 0 8px;\">\n"
+        "<p style=\"font-size:12px;color:#888;\">{{sender}}</p>\n"
+        "</div>\n"
+        "</body>\n"
+        "</html>\n"
+    ),
+}
+EMAIL_HTML_TEMPLATE: str = os.getenv("EMAIL_HTML_TEMPLATE", "")   # template id; "" = plain text
+
+# ── Config version ────────────────────────────────────────────────────────────
+# Bumped whenever RECEIVER_GROUPS / PRESET_MESSAGES / HTML_TEMPLATES change at
+# runtime so that caches derived from them (keyboards, …) are rebuilt on next use.
+_config_version = 0
+
+
+def config_version() -> int:
+    return _config_version
+
+
+def bump_config_version() -> int:
+    global _config_version
+    _config_version += 1
+    return _config_version
+
+
+def swap_content(groups: dict, presets: dict, templates: dict) -> int:
+    """Install an already validated groups/presets/templates snapshot.
+
+    Readers must go through the module (``config.RECEIVER_GROUPS``) to see
+    it.  The version is bumped only after every name points at the new
+    snapshot, so a cache never stores old data under the new version.
+    """
+    global RECEIVER_GROUPS, PRESET_MESSAGES, HTML_TEMPLATES
+    RECEIVER_GROUPS, PRESET_MESSAGES, HTML_TEMPLATES = groups, presets, templates
+    return bump_config_version()
+
 
 # ── Validation ────────────────────────────────────────────────────────────────
 def validate_config() -> list[str]:
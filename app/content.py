@@ -0,0 +1,190 @@
+"""Hot reload of groups, presets and HTML templates from a watched JSON/TOML file.
+
+The file may define ``receiver_groups``, ``preset_messages`` and/or
+``html_templates`` (same shape as the dicts in :mod:`app.config`); a
+missing section keeps the built-in defaults.  A background thread polls the
+file's mtime, parses and validates it off the event loop, then swaps the
+snapshot in with :func:`app.config.swap_content`.  A broken file is logged
+and ignored — the previous snapshot stays live.
+"""
+import json
+import logging
+import os
+import threading
+import tomllib
+
+from app import config
+from app.config import CONTENT_FILE, CONTENT_POLL_INTERVAL
+from app.utils.html_templates import compile_templates
+from app.utils.preset_builder import compile_presets
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits callback_data to 64 bytes
+_MAX_CALLBACK_DATA = 64
+
+# Import-time values, used for sections the file leaves out
+_BUILTIN_GROUPS = config.RECEIVER_GROUPS
+_BUILTIN_PRESETS = config.PRESET_MESSAGES
+_BUILTIN_TEMPLATES = config.HTML_TEMPLATES
+
+
+class ContentError(ValueError):
+    """Raised when the content file is well-formed but invalid."""
+
+
+def _check_key(kind: str, key: object, prefix: str) -> None:
+    if not isinstance(key, str) or not key:
+        raise ContentError(f"{kind} keys must be non-empty strings, got {key!r}")
+    if len(f"{prefix}{key}".encode()) > _MAX_CALLBACK_DATA:
+        raise ContentError(f"{kind} key {key!r} is too long for callback data")
+
+
+def validate_groups(groups: object) -> dict:
+    if not isinstance(groups, dict) or not groups:
+        raise ContentError("receiver_groups must be a non-empty table")
+    for key, group in groups.items():
+        _check_key("Group", key, "bulk_group_")   # the longer of its two prefixes
+        if not isinstance(group, dict):
+            raise ContentError(f"Group {key!r} must be a table")
+        for field in ("name", "receiver"):
+            if not isinstance(group.get(field), str) or not group[field]:
+                raise ContentError(f"Group {key!r} needs a non-empty {field!r}")
+        cc = group.setdefault("cc", [])
+        if not isinstance(cc, list) or not all(isinstance(e, str) for e in cc):
+            raise ContentError(f"Group {key!r}: 'cc' must be a list of addresses")
+    return groups
+
+
+def validate_presets(presets: object) -> dict:
+    if not isinstance(presets, dict) or not presets:
+        raise ContentError("preset_messages must be a non-empty table")
+    for key, preset in presets.items():
+        _check_key("Preset", key, "preset_")
+        if not isinstance(preset, dict):
+            raise ContentError(f"Preset {key!r} must be a table")
+        for field in ("subject", "body"):
+            if not isinstance(preset.get(field), str) or not preset[field]:
+                raise ContentError(f"Preset {key!r} needs a non-empty {field!r}")
+        if not isinstance(preset.get("html_template", ""), str):
+            raise ContentError(f"Preset {key!r}: 'html_template' must be a template id")
+    compile_presets(presets)   # raises TemplateError on bad placeholders
+    return presets
+
+
+def validate_templates(templates: object, presets: dict) -> dict:
+    if not isinstance(templates, dict):
+        raise ContentError("html_templates must be a table")
+    for key, source in templates.items():
+        if not isinstance(key, str) or not key:
+            raise ContentError(f"HTML template keys must be non-empty strings, got {key!r}")
+        if not isinstance(source, str):
+            raise ContentError(f"HTML template {key!r} must be a string")
+    compile_templates(templates)   # raises TemplateError on bad variables
+    for key, preset in presets.items():
+        template = preset.get("html_template")
+        if template and template not in templates:
+            raise ContentError(f"Preset {key!r}: unknown HTML template {template!r}")
+    return templates
+
+
+def load_content(path: str) -> tuple[dict, dict, dict]:
+    """Parse and validate ``path``; returns ``(groups, presets, templates)``."""
+    with open(path, "rb") as fh:
+        if path.endswith(".toml"):
+            data = tomllib.load(fh)
+        else:
+            data = json.load(fh)
+    if not isinstance(data, dict):
+        raise ContentError("Content file must contain a table at the top level")
+    groups = validate_groups(data.get("receiver_groups", _BUILTIN_GROUPS))
+    presets = validate_presets(data.get("preset_messages", _BUILTIN_PRESETS))
+    templates = validate_templates(data.get("html_templates", _BUILTIN_TEMPLATES), presets)
+    return groups, presets, templates
+
+
+class ContentWatcher:
+    """Poll one content file and swap in each valid new version.
+
+    :meth:`start` loads the file synchronously once, so the first update a
+    worker handles already sees it, then keeps polling on a daemon thread.
+    """
+
+    def __init__(self, path: str = CONTENT_FILE, interval: float = CONTENT_POLL_INTERVAL) -> None:
+        self.path = path
+        self.interval = interval
+        self._stamp: tuple[int, int] | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def check(self) -> bool:
+        """Reload if the file changed; True when a new snapshot went live."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self._stamp is not None:
+                    logger.warning("Content file %s disappeared; keeping current content", self.path)
+                    self._stamp = None
+                return False
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp == self._stamp:
+                return False
+            # Remember the stamp even on failure so a bad file is reported once
+            self._stamp = stamp
+            try:
+                groups, presets, templates = load_content(self.path)
+            except (OSError, ValueError) as exc:
+                self.errors += 1
+                self.last_error = str(exc)
+                logger.error("Ignoring invalid content file %s: %s", self.path, exc)
+                return False
+            version = config.swap_content(groups, presets, templates)
+            self.reloads += 1
+            self.last_error = None
+            logger.info(
+                "Loaded %d groups, %d presets and %d HTML templates from %s (config version %d)",
+                len(groups), len(presets), len(templates), self.path, version,
+            )
+            return True
+
+    def start(self) -> None:
+        if not self.path or self.running:
+            return
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="content-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(self.interval + 1)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Content watcher check failed")
+
+    def stats(self) -> dict:
+        return {
+            "file": self.path or None,
+            "config_version": config.config_version(),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+content_watcher = ContentWatcher()
@@ -0,0 +1,97 @@
+"""Drop Telegram redeliveries (webhook retries, replayed polling batches)
+before they reach the handlers."""
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import DEDUP_BACKEND, DEDUP_DB_PATH, DEDUP_WINDOW, DEDUP_TTL
+from app.utils.db import connect
+
+# Prune the shared table once per this many inserts
+_PRUNE_EVERY = 1000
+
+
+class UpdateDeduplicator:
+    """Remember recently seen ``update_id`` values.
+
+    A bounded insertion-ordered dict gives O(1) checks inside one worker.
+    With ``shared_path`` set, ids are also claimed in a SQLite table so
+    every gunicorn worker sees the same window.
+    """
+
+    def __init__(self, window: int = DEDUP_WINDOW, shared_path: str | None = None) -> None:
+        self.window = window
+        self.shared_path = shared_path
+        self._ids: OrderedDict[int, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inserts = 0
+        self.duplicates = 0
+
+    def _shared(self):
+        # Opened lazily so the connection is created inside the worker, after fork
+        if self._conn is None:
+            self._conn = connect(self.shared_path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_updates ("
+                " update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def seen(self, update_id: int, record: bool = True) -> bool:
+        """Record *update_id*; return ``True`` if it was already seen.
+
+        With ``record=False`` only check, e.g. to record the id once the
+        update has actually been handled.
+        """
+        with self._lock:
+            if update_id in self._ids:
+                self.duplicates += 1
+                return True
+            if not record:
+                if self.shared_path and self._known_shared(update_id):
+                    self.duplicates += 1
+                    return True
+                return False
+            self._ids[update_id] = None
+            if len(self._ids) > self.window:
+                self._ids.popitem(last=False)
+            if self.shared_path and not self._claim_shared(update_id):
+                self.duplicates += 1
+                return True
+        return False
+
+    def forget(self, update_id: int) -> None:
+        """Drop *update_id* again, e.g. when its update could not be handed off,
+        so that Telegram's redelivery is processed rather than acknowledged."""
+        with self._lock:
+            self._ids.pop(update_id, None)
+            if self.shared_path:
+                self._shared().execute(
+                    "DELETE FROM seen_updates WHERE update_id = ?", (update_id,)
+                )
+
+    def _known_shared(self, update_id: int) -> bool:
+        return self._shared().execute(
+            "SELECT 1 FROM seen_updates WHERE update_id = ?", (update_id,)
+        ).fetchone() is not None
+
+    def _claim_shared(self, update_id: int) -> bool:
+        now = time.time()
+        conn = self._shared()
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)",
+            (update_id, now),
+        )
+        self._inserts += 1
+        if self._inserts % _PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - DEDUP_TTL,))
+        return cur.rowcount == 1
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._ids), "duplicates": self.duplicates}
+
+
+deduplicator = UpdateDeduplicator(
+    shared_path=DEDUP_DB_PATH if DEDUP_BACKEND == "sqlite" else None,
+)
@@ -0,0 +1,280 @@
+"""Background mail dispatch so SMTP never runs on the bot's event loop."""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from telegram import Bot
+
+from app.attachments import AttachmentError, fetched, resolve
+from app.config import MAIL_WORKERS, MAIL_QUEUE_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL
+from app.metrics import EMAILS
+from app.outbox import FAILED, PENDING, SENT, Outbox, backoff_delay, is_transient, outbox
+from app.ratelimit import BACKGROUND, USER, priority_args
+from app.tracing import Span, bind, span, start_span
+from app.utils.email_sender import send_email
+from app.utils.html_templates import render_html
+from app.utils.keyboards import post_send_keyboard
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MailJob:
+    """One email to send plus the Telegram message that reports its status."""
+
+    receiver: str
+    subject: str
+    body: str
+    cc_list: list[str] = field(default_factory=list)
+    chat_id: int | None = None
+    # Status message edited with the outcome; None reports in a new message
+    message_id: int | None = None
+    # Metadata from app.attachments.describe; the files are fetched when sending
+    attachments: list[dict] = field(default_factory=list)
+    # Id of an HTML template, rendered when sending; "" sends plain text only
+    html_template: str = ""
+
+
+class MailDispatcher:
+    """Async queue of outbox rows served by a bounded pool of workers.
+
+    Jobs are written to the :class:`Outbox` first; the in-memory queue only
+    carries row ids.  Each worker claims its row, hands the blocking SMTP
+    exchange to a dedicated thread pool and then edits the job's status
+    message.  A poller re-queues rows whose retry time has come and, on
+    startup, anything left pending by a previous process; rows already in
+    the queue are not queued again.  Outbox reads and writes run in a thread.
+    """
+
+    def __init__(
+        self,
+        store: Outbox = outbox,
+        workers: int = MAIL_WORKERS,
+        max_queue: int = MAIL_QUEUE_SIZE,
+    ) -> None:
+        self.outbox = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self._bot: Bot | None = None
+        self._queue: asyncio.Queue[int] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._wakeup: asyncio.Event | None = None
+        # Rows in the queue or being attempted by a worker
+        self._queued: set[int] = set()
+        # "mail.queue" spans of traced rows, ended when a worker picks them up
+        self._queued_spans: dict[int, Span] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    async def start(self, bot: Bot) -> None:
+        if self.running:
+            return
+        self._bot = bot
+        self._queue = asyncio.Queue(self.max_queue)
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="mail")
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"mail-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._poller(), name="mail-outbox-poller"))
+        logger.info("Mail dispatcher started with %d workers", self.workers)
+
+    async def stop(self) -> None:
+        """Finish queued jobs, then stop the workers.
+
+        Rows still waiting for a retry stay in the outbox for the next start.
+        """
+        if not self.running:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+        logger.info("Mail dispatcher stopped")
+
+    # ── Submission ────────────────────────────────────────────────────────────
+
+    def record(self, job: MailJob, key: str) -> int | None:
+        """Write *job* to the outbox under idempotency *key*.
+
+        Returns the row id, or ``None`` if the key was already queued or sent.
+        """
+        row_id = self.outbox.enqueue(key, asdict(job))
+        if row_id is None:
+            logger.info("Duplicate send suppressed for key %s", key[:12])
+        return row_id
+
+    async def submit(self, row_id: int, bot: Bot) -> None:
+        """Schedule a recorded row.
+
+        Without background workers (per-request runtime) or with a full queue
+        the first attempt runs right here.
+        """
+        if self.running:
+            try:
+                self._queue.put_nowait(row_id)
+                self._queued.add(row_id)
+                queued = start_span("mail.queue", row_id=row_id)
+                if queued is not None:
+                    self._queued_spans[row_id] = queued
+                return
+            except asyncio.QueueFull:
+                logger.warning("Mail queue full — sending inline")
+        await self.run_row(row_id, bot)
+
+    async def _worker(self) -> None:
+        while True:
+            row_id = await self._queue.get()
+            queued = self._queued_spans.pop(row_id, None)
+            try:
+                if queued is None:
+                    await self.run_row(row_id, self._bot)
+                else:
+                    # Open the job's span first so the trace is not exported in between
+                    with queued.parent.activate(), span("mail.job", row_id=row_id):
+                        queued.end()
+                        await self.run_row(row_id, self._bot)
+            except Exception as exc:
+                logger.error("Mail worker error: %s", exc)
+            finally:
+                self._queued.discard(row_id)
+                self._queue.task_done()
+
+    async def _poller(self) -> None:
+        while True:
+            more = False
+            try:
+                # Queued rows are due too; ask for enough to also fill the queue
+                limit = len(self._queued) + self.max_queue
+                now = time.time()
+                due = await asyncio.to_thread(self.outbox.due, limit, now)
+                more = len(due) == limit
+                for row_id in due:
+                    if row_id not in self._queued:
+                        self._queued.add(row_id)
+                        await self._queue.put(row_id)
+                next_due = await asyncio.to_thread(self.outbox.next_due_at, now)
+            except Exception as exc:
+                logger.error("Outbox poll failed: %s", exc)
+                next_due = None
+            timeout = OUTBOX_POLL_INTERVAL
+            if more:
+                timeout = 0   # a full page: fetch the rest as the queue drains
+            elif next_due is not None:
+                timeout = max(0.05, min(timeout, next_due - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_row(self, row_id: int, bot: Bot) -> str | None:
+        """Attempt one row; return its new outbox status, or ``None`` if not claimed."""
+        claimed = await asyncio.to_thread(self.outbox.claim, row_id)
+        if claimed is None:
+            return None   # another worker or process got there first
+        payload, attempt = claimed
+        job = MailJob(**payload)
+
+        loop = asyncio.get_running_loop()
+        try:
+            with span("mail.send", row_id=row_id, attempt=attempt):
+                urls = await resolve(bot, job.attachments)
+                html = render_html(job.html_template, job.subject, job.body)
+                await loop.run_in_executor(self._executor, bind(_send), job, urls, html)
+        except Exception as exc:
+            if is_transient(exc) and attempt < OUTBOX_MAX_ATTEMPTS:
+                delay = backoff_delay(attempt)
+                logger.warning(
+                    "Transient SMTP error (attempt %d/%d), retrying in %.0fs: %s",
+                    attempt, OUTBOX_MAX_ATTEMPTS, delay, exc,
+                )
+                await asyncio.to_thread(self.outbox.mark_retry, row_id, str(exc), delay)
+                EMAILS.labels("retry").inc()
+                if self._wakeup is not None:
+                    self._wakeup.set()
+                await self._report(
+                    bot,
+                    job,
+                    priority=BACKGROUND,
+                    text=(
+                        f"⏳ Temporary error from the mail server — retrying in "
+                        f"{delay:.0f}s (attempt {attempt}/{OUTBOX_MAX_ATTEMPTS})."
+                    ),
+                )
+                return PENDING
+            logger.error("SMTP error: %s", exc)
+            await asyncio.to_thread(self.outbox.mark_failed, row_id, str(exc))
+            EMAILS.labels("failed").inc()
+            hint = (
+                "Please attach the file again and resend."
+                if isinstance(exc, AttachmentError)
+                else "Please check your email credentials in the `.env` file."
+            )
+            await self._report(
+                bot,
+                job,
+                text=f"❌ Error sending email:\n`{exc}`\n\n{hint}",
+            )
+            return FAILED
+        else:
+            await asyncio.to_thread(self.outbox.mark_sent, row_id)
+            EMAILS.labels("sent").inc()
+            await self._report(
+                bot,
+                job,
+                text="✅ **Email sent successfully!** 📧\n\nWhat's next?",
+                reply_markup=post_send_keyboard(),
+            )
+            return SENT
+
+    @staticmethod
+    async def _report(bot: Bot, job: MailJob, priority: int = USER, **kwargs) -> None:
+        """Edit the job's status message — or, without one, send a new message."""
+        if job.chat_id is None:
+            return
+        try:
+            if job.message_id is None:
+                await bot.send_message(
+                    chat_id=job.chat_id,
+                    parse_mode="Markdown",
+                    rate_limit_args=priority_args(priority),
+                    **kwargs,
+                )
+                return
+            await bot.edit_message_text(
+                chat_id=job.chat_id,
+                message_id=job.message_id,
+                parse_mode="Markdown",
+                rate_limit_args=priority_args(priority),
+                **kwargs,
+            )
+        except Exception as exc:
+            logger.error("Could not report mail status to chat %s: %s", job.chat_id, exc)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers if self.running else 0,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+        }
+
+
+def _send(job: MailJob, urls: list[str], html: str | None) -> None:
+    """Download *job*'s attachments, if any, then send; runs on a mail thread."""
+    with fetched(job.attachments, urls) as files:
+        send_email(job.receiver, job.subject, job.body, job.cc_list, attachments=files, html=html)
+
+
+# Shared by every handler in this worker process
+mail_dispatcher = MailDispatcher()
@@ -1,309 +1,575 @@
-"""Telegram inline-keyboard callback handler."""
+"""Inline-keyboard callback steps.
+
+Each function handles one callback id (or ``prefix*``) from the flow table in
+:mod:`app.handlers.flow`; ``arg`` is the part of the callback data after the
+prefix, or ``""`` for exact ids.
+"""
+import asyncio
 import logging
+import uuid
+from datetime import datetime, timedelta
 
-from telegram import Update
+from telegram import CallbackQuery
 from telegram.ext import ContextTypes
 
-from app.config import (
-    RECEIVER_GROUPS,
-    PRESET_MESSAGES,
-    DATE_REQUIRING_PRESETS,
-)
+from app import bulk, config
+from app.attachments import format_size
+from app.dispatch import mail_dispatcher
+from app.handlers.drafts import draft_job
+from app.scheduler import check_when, format_when, morning_of, parse_date, scheduler, TZ
 from app.utils.keyboards import (
     home_keyboard,
     recipient_type_keyboard,
+    group_keyboard,
     cc_options_keyboard,
     modify_cc_keyboard,
     message_type_keyboard,
+    preset_keyboard,
     preview_keyboard,
     edit_options_keyboard,
     date_type_keyboard,
     reason_keyboard,
     post_send_keyboard,
+    bulk_recipients_keyboard,
+    schedule_keyboard,
+    scheduled_list_keyboard,
 )
-from app.utils.preview import build_preview
-from app.utils.preset_builder import build_preset_body
-from app.utils.email_sender import send_email as smtp_send_email
+from app.utils.html_templates import template_for
+from app.utils.preview import build_bulk_preview, build_preview
+from app.utils.preset_builder import get_preset
 
 logger = logging.getLogger(__name__)
 
+Context = ContextTypes.DEFAULT_TYPE
+
 
 # ── Small helpers ─────────────────────────────────────────────────────────────
 
-async def _show_preview(query, context: ContextTypes.DEFAULT_TYPE) -> None:
-    receiver = context.user_data.get("receiver_email", "Not set")
-    cc_list = context.user_data.get("cc_recipients", [])
+async def _show_preview(query: CallbackQuery, context: Context) -> None:
+    # Identifies this draft so repeated "Send" taps map to one outbox entry
+    context.user_data.setdefault("draft_id", uuid.uuid4().hex)
     subject = context.user_data.get("email_subject", "No subject")
     body = context.user_data.get("email_body", "No body")
+    if context.user_data.get("bulk"):
+        text = build_bulk_preview(bulk.collect(context.user_data), subject, body)
+    else:
+        receiver = context.user_data.get("receiver_email", "Not set")
+        cc_list = context.user_data.get("cc_recipients", [])
+        attachments = context.user_data.get("attachments", [])
+        text = build_preview(receiver, cc_list, subject, body, attachments)
     await query.edit_message_text(
-        text=build_preview(receiver, cc_list, subject, body),
+        text=text,
         reply_markup=preview_keyboard(),
         parse_mode="Markdown",
     )
 
 
-async def _finish_preset_callback(query, context: ContextTypes.DEFAULT_TYPE) -> None:
-    preset_key = context.user_data.get("selected_preset")
-    if not preset_key or preset_key not in PRESET_MESSAGES:
+async def _finish_preset_callback(query: CallbackQuery, context: Context) -> None:
+    preset = get_preset(context.user_data.get("selected_preset"))
+    if preset is None:
         await query.edit_message_text("❌ Preset not found. Please start over with /start")
         return
-    body = build_preset_body(preset_key, context.user_data)
-    context.user_data["email_subject"] = PRESET_MESSAGES[preset_key]["subject"]
-    context.user_data["email_body"] = body
+    context.user_data["email_subject"] = preset.subject
+    context.user_data["email_body"] = preset.render(context.user_data)
     await _show_preview(query, context)
 
 
-# ── Main dispatcher ───────────────────────────────────────────────────────────
+async def _ask_for_reason(query: CallbackQuery) -> None:
+    await query.edit_message_text(
+        text=(
+            "📋 **Add a reason (optional):**\n\n"
+            "Choose 'Personal Reasons', enter a custom reason, or skip."
+        ),
+        reply_markup=reason_keyboard(),
+        parse_mode="Markdown",
+    )
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    await query.answer()
-    data: str = query.data
 
-    # ── Home / Help ───────────────────────────────────────────────────────────
-    if data == "back_to_home":
-        context.user_data.clear()
-        await query.edit_message_text(
-            text="Welcome to Email Bot! 📧\n\nChoose an option below:",
-            reply_markup=home_keyboard(),
-        )
+async def _show_message_type(query: CallbackQuery) -> None:
+    await query.edit_message_text(
+        text="📝 Choose message type:",
+        reply_markup=message_type_keyboard(),
+    )
+
+
+async def _show_bulk_recipients(query: CallbackQuery, context: Context, note: str = "") -> None:
+    selected = context.user_data.get("bulk_groups", [])
+    listed = len(context.user_data.get("bulk_list", []))
+    await query.edit_message_text(
+        text=(
+            f"{note}📨 **Bulk send — choose recipients:**\n\n"
+            f"Groups selected: {len(selected)}\n"
+            f"Addresses from list: {listed}"
+        ),
+        reply_markup=bulk_recipients_keyboard(set(selected)),
+        parse_mode="Markdown",
+    )
+
+
+async def _show_recipient_type(query: CallbackQuery) -> None:
+    await query.edit_message_text(
+        text="📧 Choose how to select recipients:",
+        reply_markup=recipient_type_keyboard(),
+    )
+
+
+# ── Home / Help ───────────────────────────────────────────────────────────────
+
+async def back_to_home(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data.clear()
+    await query.edit_message_text(
+        text="Welcome to Email Bot! 📧\n\nChoose an option below:",
+        reply_markup=home_keyboard(),
+    )
+
+
+async def show_help(query: CallbackQuery, context: Context, arg: str) -> None:
+    help_text = (
+        "📧 **Email Bot Help**\n\n"
+        "1. Click 'Send Email' to start (or 'Bulk Send' for many recipients)\n"
+        "2. Select a group OR enter receiver email manually\n"
+        "3. Add additional CC recipients (optional)\n"
+        "4. Choose message type (preset or custom)\n"
+        "5. Preview and confirm — or tap 'Send Later' to schedule it\n"
+        "6. Message will be sent!\n\n"
+        "'Scheduled Emails' lists and cancels emails waiting to go out.\n"
+        "/start — Return to main menu"
+    )
+    await query.edit_message_text(text=help_text, parse_mode="Markdown")
+
+
+async def unknown_callback(query: CallbackQuery, context: Context, arg: str) -> None:
+    logger.warning("Unhandled callback: %s", query.data)
+    await query.edit_message_text(
+        text="❓ Unknown action. Please start over with /start",
+        reply_markup=home_keyboard(),
+    )
+
+
+# ── Start email flow ──────────────────────────────────────────────────────────
+
+async def start_email(query: CallbackQuery, context: Context, arg: str) -> None:
+    await _show_recipient_type(query)
 
-    elif data == "help":
-        help_text = (
-            "📧 **Email Bot Help**\n\n"
-            "1. Click 'Send Email' to start\n"
-            "2. Select a group OR enter receiver email manually\n"
-            "3. Add additional CC recipients (optional)\n"
-            "4. Choose message type (preset or custom)\n"
-            "5. Preview and confirm\n"
-            "6. Message will be sent!\n\n"
-            "/start — Return to main menu"
-        )
-        await query.edit_message_text(text=help_text, parse_mode="Markdown")
 
-    # ── Start email flow ──────────────────────────────────────────────────────
-    elif data == "send_email":
+# ── Recipient selection ───────────────────────────────────────────────────────
+
+async def select_group(query: CallbackQuery, context: Context, arg: str) -> None:
+    await query.edit_message_text(
+        text="👥 **Select a receiver group:**",
+        reply_markup=group_keyboard(),
+        parse_mode="Markdown",
+    )
+
+
+async def manual_entry(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "receiver_email"
+    await query.edit_message_text(text="📧 Enter the receiver's email address:")
+
+
+async def group_selected(query: CallbackQuery, context: Context, group_key: str) -> None:
+    group = config.RECEIVER_GROUPS.get(group_key)
+    if not group:
+        await query.edit_message_text("❌ Group not found.")
+        return
+    context.user_data["receiver_email"] = group["receiver"]
+    context.user_data["cc_recipients"] = group["cc"].copy()
+    context.user_data["selected_group"] = group_key
+
+    cc_text = "\n".join(f"• {e}" for e in group["cc"]) or "None"
+    await query.edit_message_text(
+        text=(
+            f"✅ **Group Selected: {group['name']}**\n\n"
+            f"**Main Receiver:** {group['receiver']}\n\n"
+            f"**CC Recipients:**\n{cc_text}"
+        ),
+        reply_markup=modify_cc_keyboard(),
+        parse_mode="Markdown",
+    )
+
+
+# ── Bulk recipients ───────────────────────────────────────────────────────────
+
+async def bulk_start(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data.clear()
+    context.user_data.update(bulk=True, bulk_groups=[], bulk_list=[])
+    await _show_bulk_recipients(query, context)
+
+
+async def bulk_toggle_group(query: CallbackQuery, context: Context, group_key: str) -> None:
+    selected = context.user_data.setdefault("bulk_groups", [])
+    if group_key in selected:
+        selected.remove(group_key)
+    elif group_key in config.RECEIVER_GROUPS:
+        selected.append(group_key)
+    await _show_bulk_recipients(query, context)
+
+
+async def bulk_paste(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "bulk_addresses"
+    await query.edit_message_text(
+        text=(
+            "📋 Paste the addresses (one per line, or separated by commas), "
+            "or upload a .txt/.csv file.\n\n"
+            "For per-recipient fields send CSV with a header row, e.g.\n"
+            "email,name\nana@example.com,Ana\n\n"
+            "and use {name} in the subject or body."
+        ),
+    )
+
+
+async def bulk_continue(query: CallbackQuery, context: Context, arg: str) -> None:
+    if not bulk.collect(context.user_data):
+        await _show_bulk_recipients(query, context, note="⚠️ Select at least one recipient.\n\n")
+        return
+    await _show_message_type(query)
+
+
+# ── CC management ─────────────────────────────────────────────────────────────
+
+async def add_cc(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "cc_email"
+    await query.edit_message_text(text="📧 Enter CC email address:")
+
+
+async def skip_cc(query: CallbackQuery, context: Context, arg: str) -> None:
+    await _show_message_type(query)
+
+
+async def modify_cc(query: CallbackQuery, context: Context, arg: str) -> None:
+    cc_list = context.user_data.get("cc_recipients", [])
+    cc_text = "\n".join(f"• {e}" for e in cc_list) or "No CC recipients"
+    await query.edit_message_text(
+        text=f"📋 Current CCs:\n{cc_text}\n\nWhat would you like to do?",
+        reply_markup=cc_options_keyboard(has_cc=True),
+    )
+
+
+async def add_more_cc(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "cc_email"
+    await query.edit_message_text(text="📧 Enter another CC email address:")
+
+
+async def remove_last_cc(query: CallbackQuery, context: Context, arg: str) -> None:
+    cc_list = context.user_data.get("cc_recipients", [])
+    if cc_list:
+        removed = cc_list.pop()
+        cc_text = "\n".join(f"• {e}" for e in cc_list) or "No CC recipients"
         await query.edit_message_text(
-            text="📧 Choose how to select recipients:",
-            reply_markup=recipient_type_keyboard(),
+            text=f"🗑️ Removed: {removed}\n\nCurrent CC List:\n{cc_text}",
+            reply_markup=cc_options_keyboard(has_cc=bool(cc_list)),
         )
-
-    # ── Recipient selection ───────────────────────────────────────────────────
-    elif data == "select_group":
-        keyboard_rows = [
-            [__import__("telegram", fromlist=["InlineKeyboardButton"]).InlineKeyboardButton(
-                group["name"], callback_data=f"group_{key}"
-            )]
-            for key, group in RECEIVER_GROUPS.items()
-        ]
-        from telegram import InlineKeyboardMarkup
+    else:
         await query.edit_message_text(
-            text="👥 **Select a receiver group:**",
-            reply_markup=InlineKeyboardMarkup(keyboard_rows),
-            parse_mode="Markdown",
+            text="No CC recipients to remove.",
+            reply_markup=cc_options_keyboard(has_cc=False),
         )
 
-    elif data == "manual_entry":
-        context.user_data["waiting_for"] = "receiver_email"
-        await query.edit_message_text(text="📧 Enter the receiver's email address:")
-
-    elif data.startswith("group_"):
-        group_key = data.removeprefix("group_")
-        group = RECEIVER_GROUPS.get(group_key)
-        if not group:
-            await query.edit_message_text("❌ Group not found.")
-            return
-        context.user_data["receiver_email"] = group["receiver"]
-        context.user_data["cc_recipients"] = group["cc"].copy()
-        context.user_data["selected_group"] = group_key
-
-        cc_text = "\n".join(f"• {e}" for e in group["cc"]) or "None"
+
+async def done_with_cc(query: CallbackQuery, context: Context, arg: str) -> None:
+    await _show_message_type(query)
+
+
+# ── Message type ──────────────────────────────────────────────────────────────
+
+async def use_preset(query: CallbackQuery, context: Context, arg: str) -> None:
+    await query.edit_message_text(
+        text="📌 Select a preset message:",
+        reply_markup=preset_keyboard(),
+    )
+
+
+async def preset_selected(query: CallbackQuery, context: Context, preset_key: str) -> None:
+    preset = get_preset(preset_key)
+    if preset is None:
+        await query.edit_message_text("❌ Preset not found.")
+        return
+    context.user_data["selected_preset"] = preset_key
+
+    # The preset's placeholders decide which inputs to collect
+    if preset.needs_dates:
+        label = "leave/WFH" if preset.multi_day else "half-day/WFH"
         await query.edit_message_text(
-            text=(
-                f"✅ **Group Selected: {group['name']}**\n\n"
-                f"**Main Receiver:** {group['receiver']}\n\n"
-                f"**CC Recipients:**\n{cc_text}"
-            ),
-            reply_markup=modify_cc_keyboard(),
+            text=f"📅 **Select date(s) for your {label}:**",
+            reply_markup=date_type_keyboard(multi_day=preset.multi_day),
             parse_mode="Markdown",
         )
+    elif preset.needs_reason:
+        await _ask_for_reason(query)
+    else:
+        await _finish_preset_callback(query, context)
 
-    # ── CC management ─────────────────────────────────────────────────────────
-    elif data == "add_cc":
-        context.user_data["waiting_for"] = "cc_email"
-        await query.edit_message_text(text="📧 Enter CC email address:")
 
-    elif data == "skip_cc":
-        await query.edit_message_text(
-            text="📝 Choose message type:",
-            reply_markup=message_type_keyboard(),
-        )
+async def use_custom(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data.pop("selected_preset", None)   # so its HTML template is not used
+    context.user_data["waiting_for"] = "custom_subject"
+    await query.edit_message_text(text="📝 Enter the email subject:")
 
-    elif data == "modify_cc":
-        cc_list = context.user_data.get("cc_recipients", [])
-        cc_text = "\n".join(f"• {e}" for e in cc_list) or "No CC recipients"
+
+# ── Date selection ────────────────────────────────────────────────────────────
+
+async def date_select_range(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "date_range_start"
+    await query.edit_message_text(
+        text="📅 Enter start date (format: YYYY-MM-DD or DD/MM/YYYY):\nExample: 2026-02-15"
+    )
+
+
+async def date_select_single(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "date_single"
+    await query.edit_message_text(
+        text="📅 Enter the date (format: YYYY-MM-DD or DD/MM/YYYY):\nExample: 2026-02-15"
+    )
+
+
+# ── Reason selection ──────────────────────────────────────────────────────────
+
+async def reason_personal(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["leave_reason"] = "personal reasons"
+    await _finish_preset_callback(query, context)
+
+
+async def reason_custom(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "leave_reason"
+    await query.edit_message_text(text="✍️ Enter your reason for leave:")
+
+
+async def reason_skip(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["leave_reason"] = ""
+    await _finish_preset_callback(query, context)
+
+
+# ── Preview editing ───────────────────────────────────────────────────────────
+
+async def preview_edit(query: CallbackQuery, context: Context, arg: str) -> None:
+    await query.edit_message_text(
+        text="What would you like to edit?",
+        reply_markup=edit_options_keyboard(),
+    )
+
+
+async def edit_subject(query: CallbackQuery, context: Context, arg: str) -> None:
+    current = context.user_data.get("email_subject", "")
+    context.user_data["waiting_for"] = "edit_subject_text"
+    await query.edit_message_text(
+        text=f"✏️ **Current Subject:**\n{current}\n\n📝 Enter new subject:",
+        parse_mode="Markdown",
+    )
+
+
+async def edit_body(query: CallbackQuery, context: Context, arg: str) -> None:
+    current = context.user_data.get("email_body", "")
+    context.user_data["waiting_for"] = "edit_body_text"
+    await query.edit_message_text(
+        text=(
+            f"✏️ **Current Body:**\n─────────────────\n{current}\n─────────────────\n\n"
+            f"📝 Enter new message body:"
+        ),
+        parse_mode="Markdown",
+    )
+
+
+async def attach_file(query: CallbackQuery, context: Context, arg: str) -> None:
+    if context.user_data.get("bulk"):
         await query.edit_message_text(
-            text=f"📋 Current CCs:\n{cc_text}\n\nWhat would you like to do?",
-            reply_markup=cc_options_keyboard(has_cc=True),
+            "⚠️ Bulk sends cannot carry attachments — send now or start over.",
+            reply_markup=preview_keyboard(),
         )
+        return
+    context.user_data["waiting_for"] = "attachment"
+    await query.edit_message_text(
+        text=(
+            "📎 Send the file (as a document or a photo).\n"
+            f"Up to {config.ATTACHMENT_MAX_FILES} files, {format_size(config.ATTACHMENT_MAX_BYTES)} each.\n"
+            "Send any text to go back to the preview."
+        )
+    )
 
-    elif data == "add_more_cc":
-        context.user_data["waiting_for"] = "cc_email"
-        await query.edit_message_text(text="📧 Enter another CC email address:")
 
-    elif data == "remove_last_cc":
-        cc_list = context.user_data.get("cc_recipients", [])
-        if cc_list:
-            removed = cc_list.pop()
-            cc_text = "\n".join(f"• {e}" for e in cc_list) or "No CC recipients"
-            await query.edit_message_text(
-                text=f"🗑️ Removed: {removed}\n\nCurrent CC List:\n{cc_text}",
-                reply_markup=cc_options_keyboard(has_cc=bool(cc_list)),
-            )
-        else:
-            await query.edit_message_text(
-                text="No CC recipients to remove.",
-                reply_markup=cc_options_keyboard(has_cc=False),
-            )
-
-    elif data == "done_with_cc":
+async def remove_attachments(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data.pop("attachments", None)
+    await _show_preview(query, context)
+
+
+# ── Send ──────────────────────────────────────────────────────────────────────
+
+async def send_email_confirm(query: CallbackQuery, context: Context, arg: str) -> None:
+    if context.user_data.get("bulk"):
+        await _send_bulk(query, context)
+        return
+    drafted = draft_job(
+        query.from_user.id, context.user_data, query.message.chat_id, query.message.message_id
+    )
+    if drafted is None:
         await query.edit_message_text(
-            text="📝 Choose message type:",
-            reply_markup=message_type_keyboard(),
+            "❌ Missing email details. Please start over with /start"
         )
+        return
+    job, key = drafted
+    row_id = await asyncio.to_thread(mail_dispatcher.record, job, key)
+    if row_id is None:
+        # Double tap or redelivered update — the first one reports status
+        return
+    # The dispatcher edits this same message once the send finishes
+    await query.edit_message_text(text="⏳ **Sending your email…**", parse_mode="Markdown")
+    await mail_dispatcher.submit(row_id, context.bot)
 
-    # ── Message type ──────────────────────────────────────────────────────────
-    elif data == "use_preset":
-        keyboard_rows = [
-            [__import__("telegram", fromlist=["InlineKeyboardButton"]).InlineKeyboardButton(
-                msg["subject"], callback_data=f"preset_{key}"
-            )]
-            for key, msg in PRESET_MESSAGES.items()
-        ]
-        from telegram import InlineKeyboardMarkup
+
+async def _send_bulk(query: CallbackQuery, context: Context) -> None:
+    recipients = bulk.collect(context.user_data)
+    subject = context.user_data.get("email_subject")
+    body = context.user_data.get("email_body")
+    if not all([recipients, subject, body]):
         await query.edit_message_text(
-            text="📌 Select a preset message:",
-            reply_markup=InlineKeyboardMarkup(keyboard_rows),
+            "❌ Missing email details. Please start over with /start"
         )
+        return
 
-    elif data.startswith("preset_"):
-        preset_key = data.removeprefix("preset_")
-        if preset_key not in PRESET_MESSAGES:
-            await query.edit_message_text("❌ Preset not found.")
-            return
-        context.user_data["selected_preset"] = preset_key
-
-        if preset_key in DATE_REQUIRING_PRESETS:
-            multi_day = preset_key in ("leave_request", "wfh")
-            label = "leave/WFH" if multi_day else "half-day/WFH"
-            await query.edit_message_text(
-                text=f"📅 **Select date(s) for your {label}:**",
-                reply_markup=date_type_keyboard(multi_day=multi_day),
-                parse_mode="Markdown",
-            )
-        else:
-            # Non-date preset — straight to preview
-            preset = PRESET_MESSAGES[preset_key]
-            context.user_data["email_subject"] = preset["subject"]
-            context.user_data["email_body"] = preset["body"]
-            await _show_preview(query, context)
-
-    elif data == "use_custom":
-        context.user_data["waiting_for"] = "custom_subject"
-        await query.edit_message_text(text="📝 Enter the email subject:")
-
-    # ── Date selection ────────────────────────────────────────────────────────
-    elif data == "date_select_range":
-        context.user_data["waiting_for"] = "date_range_start"
+    rows = await asyncio.to_thread(
+        bulk.record,
+        query.from_user.id,
+        context.user_data.setdefault("draft_id", uuid.uuid4().hex),
+        subject,
+        body,
+        recipients,
+        template_for(context.user_data),
+    )
+    if not rows:
+        # Double tap or redelivered update — the first one reports progress
+        return
+    await query.edit_message_text(
+        text=f"⏳ **Sending to {len(rows)} recipients…**", parse_mode="Markdown"
+    )
+    # Runs past this update; the application waits for it on shutdown
+    context.application.create_task(
+        bulk.BulkSend(context.bot, rows, query.message.chat_id, query.message.message_id).run()
+    )
+
+
+# ── Send later ────────────────────────────────────────────────────────────────
+
+def _draft_date(user_data: dict):
+    """First day of the draft's leave dates, if it has any."""
+    return parse_date(user_data.get("date_start") or user_data.get("date_single") or "")
+
+
+async def send_later(query: CallbackQuery, context: Context, arg: str) -> None:
+    if context.user_data.get("bulk"):
         await query.edit_message_text(
-            text="📅 Enter start date (format: YYYY-MM-DD or DD/MM/YYYY):\nExample: 2026-02-15"
+            "⚠️ Bulk sends cannot be scheduled — send now or start over.",
+            reply_markup=preview_keyboard(),
         )
-
-    elif data == "date_select_single":
-        context.user_data["waiting_for"] = "date_single"
+        return
+    problem = scheduler.unavailable()
+    if problem:
         await query.edit_message_text(
-            text="📅 Enter the date (format: YYYY-MM-DD or DD/MM/YYYY):\nExample: 2026-02-15"
+            f"⚠️ {problem} Send now instead.", reply_markup=preview_keyboard()
         )
+        return
+    await query.edit_message_text(
+        text=f"⏰ **When should this email go out?** (times in {TZ.key})",
+        reply_markup=schedule_keyboard(has_date=_draft_date(context.user_data) is not None),
+        parse_mode="Markdown",
+    )
 
-    # ── Reason selection ──────────────────────────────────────────────────────
-    elif data == "reason_personal":
-        context.user_data["leave_reason"] = "personal reasons"
-        await _finish_preset_callback(query, context)
 
-    elif data == "reason_custom":
-        context.user_data["waiting_for"] = "leave_reason"
-        await query.edit_message_text(text="✍️ Enter your reason for leave:")
+async def schedule_on_date(query: CallbackQuery, context: Context, arg: str) -> None:
+    day = _draft_date(context.user_data)
+    if day is None:
+        await query.edit_message_text("❌ This email has no date. Please start over with /start")
+        return
+    await schedule_draft(query, context, morning_of(day))
 
-    elif data == "reason_skip":
-        context.user_data["leave_reason"] = ""
-        await _finish_preset_callback(query, context)
 
-    # ── Preview editing ───────────────────────────────────────────────────────
-    elif data == "preview_edit":
-        await query.edit_message_text(
-            text="What would you like to edit?",
-            reply_markup=edit_options_keyboard(),
-        )
+async def schedule_tomorrow(query: CallbackQuery, context: Context, arg: str) -> None:
+    tomorrow = datetime.now(TZ).date() + timedelta(days=1)
+    await schedule_draft(query, context, morning_of(tomorrow))
 
-    elif data == "edit_subject":
-        current = context.user_data.get("email_subject", "")
-        context.user_data["waiting_for"] = "edit_subject_text"
-        await query.edit_message_text(
-            text=f"✏️ **Current Subject:**\n{current}\n\n📝 Enter new subject:",
-            parse_mode="Markdown",
+
+async def schedule_custom(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data["waiting_for"] = "schedule_time"
+    await query.edit_message_text(
+        text=(
+            f"⏰ Enter when to send (times in {TZ.key}):\n"
+            "• 2026-02-15 09:30 (or 15/02/2026 09:30)\n"
+            "• 18:00 (today, or tomorrow if already past)\n"
+            "• in 2h / in 30m"
         )
+    )
+
+
+async def schedule_back(query: CallbackQuery, context: Context, arg: str) -> None:
+    await _show_preview(query, context)
 
-    elif data == "edit_body":
-        current = context.user_data.get("email_body", "")
-        context.user_data["waiting_for"] = "edit_body_text"
+
+async def schedule_draft(query: CallbackQuery, context: Context, when: datetime) -> None:
+    """Store the previewed draft for *when*; the query's message becomes its status."""
+    problem = scheduler.unavailable()
+    if problem:
         await query.edit_message_text(
-            text=(
-                f"✏️ **Current Body:**\n─────────────────\n{current}\n─────────────────\n\n"
-                f"📝 Enter new message body:"
-            ),
-            parse_mode="Markdown",
+            f"⚠️ {problem} Send now instead.", reply_markup=preview_keyboard()
         )
-
-    # ── Send ──────────────────────────────────────────────────────────────────
-    elif data == "send_email_confirm":
-        receiver = context.user_data.get("receiver_email")
-        cc_list = context.user_data.get("cc_recipients", [])
-        subject = context.user_data.get("email_subject")
-        body = context.user_data.get("email_body")
-
-        if not all([receiver, subject, body]):
-            await query.edit_message_text(
-                "❌ Missing email details. Please start over with /start"
-            )
-            return
-
-        try:
-            smtp_send_email(receiver, subject, body, cc_list)
-            await query.edit_message_text(
-                text="✅ **Email sent successfully!** 📧\n\nWhat's next?",
-                reply_markup=post_send_keyboard(),
-                parse_mode="Markdown",
-            )
-        except Exception as exc:
-            logger.error("SMTP error: %s", exc)
-            await query.edit_message_text(
-                text=(
-                    f"❌ Error sending email:\n`{exc}`\n\n"
-                    "Please check your email credentials in the `.env` file."
-                ),
-                parse_mode="Markdown",
-            )
-
-    elif data == "send_another":
-        context.user_data.clear()
+        return
+    problem = check_when(when)
+    if problem:
         await query.edit_message_text(
-            text="📧 Choose how to select recipients:",
-            reply_markup=recipient_type_keyboard(),
+            f"❌ {problem} Pick another time:",
+            reply_markup=schedule_keyboard(has_date=_draft_date(context.user_data) is not None),
         )
-
-    else:
-        logger.warning("Unhandled callback: %s", data)
+        return
+    drafted = draft_job(
+        query.from_user.id,
+        context.user_data,
+        query.message.chat_id,
+        query.message.message_id,
+        due=when.timestamp(),
+    )
+    if drafted is None:
         await query.edit_message_text(
-            text="❓ Unknown action. Please start over with /start",
-            reply_markup=home_keyboard(),
+            "❌ Missing email details. Please start over with /start"
         )
+        return
+    job, key = drafted
+    schedule_id = await scheduler.schedule(key, query.from_user.id, job, when.timestamp())
+    if schedule_id is None:
+        return   # double tap — already scheduled
+    # The dispatcher edits this message again once the email is sent
+    await query.edit_message_text(
+        text=(
+            f"⏰ **Scheduled #{schedule_id}** for {format_when(when.timestamp())}\n\n"
+            "Use 'Scheduled Emails' on the home menu to cancel it."
+        ),
+        reply_markup=post_send_keyboard(),
+        parse_mode="Markdown",
+    )
+
+
+# ── Scheduled emails ──────────────────────────────────────────────────────────
+
+async def scheduled_list(query: CallbackQuery, context: Context, arg: str, note: str = "") -> None:
+    items = await asyncio.to_thread(scheduler.store.pending, query.from_user.id)
+    lines = [
+        f"#{item['id']} • {format_when(item['due_at'])}\n"
+        f"    {item['job']['receiver']} — {item['job']['subject']}"
+        for item in items
+    ]
+    await query.edit_message_text(
+        text=f"{note}⏰ Scheduled emails:\n\n" + ("\n".join(lines) or "Nothing scheduled."),
+        reply_markup=scheduled_list_keyboard([item["id"] for item in items]),
+    )
+
+
+async def cancel_scheduled(query: CallbackQuery, context: Context, schedule_id: str) -> None:
+    cancelled = schedule_id.isdigit() and await asyncio.to_thread(
+        scheduler.store.cancel, query.from_user.id, int(schedule_id)
+    )
+    note = (
+        f"🗑️ Cancelled #{schedule_id}.\n\n" if cancelled
+        else f"⚠️ #{schedule_id} could not be cancelled (already sent?).\n\n"
+    )
+    await scheduled_list(query, context, "", note=note)
+
+
+async def send_another(query: CallbackQuery, context: Context, arg: str) -> None:
+    context.user_data.clear()
+    await _show_recipient_type(query)
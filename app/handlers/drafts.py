@@ -0,0 +1,45 @@
+"""The previewed single-recipient draft as a mail job, shared by the send steps."""
+import uuid
+
+from app.attachments import key_fields
+from app.dispatch import MailJob
+from app.outbox import idempotency_key
+from app.utils.html_templates import template_for
+
+
+def draft_job(
+    user_id: int,
+    user_data: dict,
+    chat_id: int,
+    message_id: int | None = None,
+    due: float | None = None,
+) -> tuple[MailJob, str] | None:
+    """The draft in *user_data* and its idempotency key, or ``None`` if it is incomplete.
+
+    *due* is set for scheduled sends, so the same draft scheduled for two
+    different times makes two jobs.
+    """
+    receiver = user_data.get("receiver_email")
+    subject = user_data.get("email_subject")
+    body = user_data.get("email_body")
+    if not all([receiver, subject, body]):
+        return None
+    job = MailJob(
+        receiver=receiver,
+        subject=subject,
+        body=body,
+        cc_list=list(user_data.get("cc_recipients", [])),
+        chat_id=chat_id,
+        message_id=message_id,
+        attachments=list(user_data.get("attachments", [])),
+        html_template=template_for(user_data),
+    )
+    fields = {"to": receiver, "cc": job.cc_list, "subject": subject, "body": body}
+    if due is not None:
+        fields["due"] = due
+    key = idempotency_key(
+        user_id,
+        user_data.setdefault("draft_id", uuid.uuid4().hex),
+        {**fields, **key_fields(job.attachments)},
+    )
+    return job, key
@@ -0,0 +1,168 @@
+"""The conversation flow as data, and the two PTB entry points that route it.
+
+The table below is compiled into a :class:`FlowRouter` at import time; an
+inconsistent flow (a button nobody handles, a step nobody can reach, a
+``waiting_for`` state without a text step) fails startup with a
+:class:`~app.utils.flow.FlowError`.
+"""
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from app.bulk import MAX_LIST_BYTES
+from app.metrics import HANDLER_SECONDS
+from app.handlers import callbacks as cb
+from app.handlers import messages as msg
+from app.tracing import span
+from app.utils.flow import Flow, FlowRouter, Step
+from app.utils.keyboards import (
+    home_keyboard,
+    recipient_type_keyboard,
+    group_keyboard,
+    cc_options_keyboard,
+    modify_cc_keyboard,
+    message_type_keyboard,
+    preset_keyboard,
+    preview_keyboard,
+    edit_options_keyboard,
+    date_type_keyboard,
+    reason_keyboard,
+    post_send_keyboard,
+    bulk_recipients_keyboard,
+    schedule_keyboard,
+    scheduled_list_keyboard,
+)
+
+FLOW = Flow(
+    entry=("home",),
+    keyboards={
+        "home": home_keyboard,
+        "recipient_type": recipient_type_keyboard,
+        "groups": group_keyboard,
+        "cc_options": lambda: (cc_options_keyboard(False), cc_options_keyboard(True)),
+        "modify_cc": modify_cc_keyboard,
+        "message_type": message_type_keyboard,
+        "presets": preset_keyboard,
+        "date_type": lambda: (date_type_keyboard(True), date_type_keyboard(False)),
+        "reason": reason_keyboard,
+        "preview": preview_keyboard,
+        "edit_options": edit_options_keyboard,
+        "post_send": post_send_keyboard,
+        "bulk_recipients": bulk_recipients_keyboard,
+        "schedule_options": lambda: (schedule_keyboard(True), schedule_keyboard(False)),
+        # Sample ids: the buttons' callback data is all the router looks at
+        "scheduled": lambda: scheduled_list_keyboard([1]),
+    },
+    callbacks={
+        # Home / help
+        "back_to_home": Step(cb.back_to_home, shows=("home",)),
+        "help": Step(cb.show_help),
+        # Recipients
+        "send_email": Step(cb.start_email, shows=("recipient_type",)),
+        "select_group": Step(cb.select_group, shows=("groups",)),
+        "manual_entry": Step(cb.manual_entry, awaits=("receiver_email",)),
+        "group_*": Step(cb.group_selected, shows=("modify_cc",)),
+        # Bulk send
+        "bulk_send": Step(cb.bulk_start, shows=("bulk_recipients",)),
+        "bulk_group_*": Step(cb.bulk_toggle_group, shows=("bulk_recipients",)),
+        "bulk_paste": Step(cb.bulk_paste, awaits=("bulk_addresses",)),
+        "bulk_continue": Step(cb.bulk_continue, shows=("bulk_recipients", "message_type")),
+        # CC management
+        "add_cc": Step(cb.add_cc, awaits=("cc_email",)),
+        "skip_cc": Step(cb.skip_cc, shows=("message_type",)),
+        "modify_cc": Step(cb.modify_cc, shows=("cc_options",)),
+        "add_more_cc": Step(cb.add_more_cc, awaits=("cc_email",)),
+        "remove_last_cc": Step(cb.remove_last_cc, shows=("cc_options",)),
+        "done_with_cc": Step(cb.done_with_cc, shows=("message_type",)),
+        # Message type
+        "use_preset": Step(cb.use_preset, shows=("presets",)),
+        "preset_*": Step(cb.preset_selected, shows=("date_type", "reason", "preview")),
+        "use_custom": Step(cb.use_custom, awaits=("custom_subject",)),
+        # Dates and reason
+        "date_select_range": Step(cb.date_select_range, awaits=("date_range_start",)),
+        "date_select_single": Step(cb.date_select_single, awaits=("date_single",)),
+        "reason_personal": Step(cb.reason_personal, shows=("preview",)),
+        "reason_custom": Step(cb.reason_custom, awaits=("leave_reason",)),
+        "reason_skip": Step(cb.reason_skip, shows=("preview",)),
+        # Preview, edit, send
+        "preview_edit": Step(cb.preview_edit, shows=("edit_options",)),
+        "edit_subject": Step(cb.edit_subject, awaits=("edit_subject_text",)),
+        "edit_body": Step(cb.edit_body, awaits=("edit_body_text",)),
+        "attach_file": Step(cb.attach_file, awaits=("attachment",), shows=("preview",)),
+        "remove_attachments": Step(cb.remove_attachments, shows=("preview",)),
+        "send_email_confirm": Step(cb.send_email_confirm, shows=("post_send",)),
+        "send_another": Step(cb.send_another, shows=("recipient_type",)),
+        # Send later
+        "send_later": Step(cb.send_later, shows=("schedule_options", "preview")),
+        "schedule_on_date": Step(cb.schedule_on_date, shows=("post_send", "schedule_options")),
+        "schedule_tomorrow": Step(cb.schedule_tomorrow, shows=("post_send", "schedule_options")),
+        "schedule_custom": Step(cb.schedule_custom, awaits=("schedule_time",)),
+        "schedule_back": Step(cb.schedule_back, shows=("preview",)),
+        "scheduled_list": Step(cb.scheduled_list, shows=("scheduled",)),
+        "sched_cancel_*": Step(cb.cancel_scheduled, shows=("scheduled",)),
+    },
+    text_states={
+        "receiver_email": Step(msg.receiver_email, shows=("cc_options",)),
+        "cc_email": Step(msg.cc_email, shows=("cc_options",)),
+        "bulk_addresses": Step(msg.bulk_addresses, shows=("bulk_recipients",)),
+        "custom_subject": Step(msg.custom_subject, awaits=("custom_body",)),
+        "custom_body": Step(msg.custom_body, shows=("preview",)),
+        "date_range_start": Step(msg.date_range_start, awaits=("date_range_end",)),
+        "date_range_end": Step(msg.date_range_end, shows=("reason", "preview")),
+        "date_single": Step(msg.date_single, shows=("reason", "preview")),
+        "leave_reason": Step(msg.leave_reason, shows=("preview",)),
+        "edit_subject_text": Step(msg.edit_subject_text, shows=("preview",)),
+        "edit_body_text": Step(msg.edit_body_text, shows=("preview",)),
+        "attachment": Step(msg.attachment_text, shows=("preview",)),
+        "schedule_time": Step(msg.schedule_time, awaits=("schedule_time",), shows=("post_send",)),
+    },
+    text_commands={
+        text: Step(msg.greeting, shows=("home",))
+        for text in ("hi", "hello", "hey", "start")
+    },
+    fallback_text=Step(msg.unrecognised, shows=("home",)),
+)
+
+ROUTER = FlowRouter(FLOW)
+
+_UNKNOWN_CALLBACK = Step(cb.unknown_callback, name="unknown")
+
+
+# ── PTB entry points ──────────────────────────────────────────────────────────
+
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Route an inline-keyboard tap to its step."""
+    query = update.callback_query
+    await query.answer()
+    step, arg = ROUTER.callback(query.data) or (_UNKNOWN_CALLBACK, "")
+    with HANDLER_SECONDS.labels("callback", step.name).time(), span("handler", step=step.name):
+        await step.handler(query, context, arg)
+
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Route incoming text based on the current conversation state."""
+    message = update.message
+    step = ROUTER.text(context.user_data.get("waiting_for"), message.text)
+    with HANDLER_SECONDS.labels("text", step.name).time(), span("handler", step=step.name):
+        await step.handler(message, context, message.text)
+
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Accept an uploaded recipient list or attachment while one is expected."""
+    message = update.message
+    waiting_for = context.user_data.get("waiting_for")
+    if waiting_for == "attachment":
+        with HANDLER_SECONDS.labels("file", "attachment").time(), span("handler", step="attachment"):
+            await msg.attachment_file(message, context, "")
+        return
+    if waiting_for != "bulk_addresses" or message.document is None:
+        await msg.unrecognised(message, context, "")
+        return
+    document = message.document
+    if document.file_size and document.file_size > MAX_LIST_BYTES:
+        await message.reply_text(
+            f"❌ That file is too large (max {MAX_LIST_BYTES // 1024} KB). Try again:"
+        )
+        return
+    file = await document.get_file()
+    raw = await file.download_as_bytearray()
+    await msg.bulk_addresses(message, context, raw.decode("utf-8-sig", errors="replace"))
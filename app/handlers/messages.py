@@ -1,34 +1,54 @@
-"""Telegram text message handler — manages the multi-step conversation flow."""
-from telegram import Update
+"""Free-text steps of the multi-step conversation flow.
+
+Each function handles the text typed while ``context.user_data["waiting_for"]``
+holds one state from the flow table in :mod:`app.handlers.flow`.
+"""
+import uuid
+
+from telegram import Message
 from telegram.ext import ContextTypes
 
-from app.config import PRESET_MESSAGES, DATE_REQUIRING_PRESETS
+from app import bulk
+from app.attachments import check, describe
+from app.handlers.drafts import draft_job
+from app.scheduler import check_when, format_when, parse_when, scheduler
 from app.utils.keyboards import (
     home_keyboard,
     cc_options_keyboard,
     preview_keyboard,
     reason_keyboard,
+    bulk_recipients_keyboard,
+    post_send_keyboard,
 )
-from app.utils.preview import build_preview
-from app.utils.preset_builder import build_preset_body
+from app.utils.preview import build_bulk_preview, build_preview
+from app.utils.preset_builder import get_preset
+
+Context = ContextTypes.DEFAULT_TYPE
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
-async def _send_preview(message, context: ContextTypes.DEFAULT_TYPE) -> None:
-    receiver = context.user_data.get("receiver_email", "Not set")
-    cc_list = context.user_data.get("cc_recipients", [])
+async def _send_preview(message: Message, context: Context) -> None:
+    # Identifies this draft so repeated "Send" taps map to one outbox entry
+    context.user_data.setdefault("draft_id", uuid.uuid4().hex)
     subject = context.user_data.get("email_subject", "No subject")
     body = context.user_data.get("email_body", "No body")
+    if context.user_data.get("bulk"):
+        text = build_bulk_preview(bulk.collect(context.user_data), subject, body)
+    else:
+        receiver = context.user_data.get("receiver_email", "Not set")
+        cc_list = context.user_data.get("cc_recipients", [])
+        attachments = context.user_data.get("attachments", [])
+        text = build_preview(receiver, cc_list, subject, body, attachments)
 
     await message.reply_text(
-        text=build_preview(receiver, cc_list, subject, body),
+        text=text,
         reply_markup=preview_keyboard(),
         parse_mode="Markdown",
     )
 
 
-async def _ask_for_reason(message, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def _ask_for_reason(message: Message, context: Context) -> None:
     await message.reply_text(
         text=(
             "📋 **Add a reason (optional):**\n\n"
@@ -39,119 +59,199 @@ async def _ask_for_reason(message, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
-# ── Main handler ──────────────────────────────────────────────────────────────
+async def _finish_preset(message: Message, context: Context) -> None:
+    """Build the preset body and show the email preview."""
+    preset = get_preset(context.user_data.get("selected_preset"))
+    if preset is None:
+        await message.reply_text("❌ Error: Preset not found. Please start over with /start")
+        return
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Route incoming text messages based on the current conversation state."""
-    message = update.message
-    text = message.text
-    text_lower = text.lower().strip()
+    context.user_data["email_subject"] = preset.subject
+    context.user_data["email_body"] = preset.render(context.user_data)
+    await _send_preview(message, context)
 
-    # ── Greeting — restart bot ────────────────────────────────────────────────
-    if text_lower in ("hi", "hello", "hey", "start"):
-        context.user_data.clear()
-        await message.reply_text(
-            "Welcome to Email Bot! 📧\n\nChoose an option below:",
-            reply_markup=home_keyboard(),
-        )
-        return
 
-    waiting = context.user_data.get("waiting_for")
+async def _after_dates(message: Message, context: Context) -> None:
+    preset = get_preset(context.user_data.get("selected_preset"))
+    if preset is not None and preset.needs_reason:
+        await _ask_for_reason(message, context)
+    else:
+        await _finish_preset(message, context)
 
-    # ── Receiver email ────────────────────────────────────────────────────────
-    if waiting == "receiver_email":
-        context.user_data["receiver_email"] = text.strip()
-        context.user_data["waiting_for"] = None
-        await message.reply_text(
-            f"✅ Receiver: {text.strip()}\n\nDo you want to add CC recipients?",
-            reply_markup=cc_options_keyboard(has_cc=False),
-        )
 
-    # ── CC email ──────────────────────────────────────────────────────────────
-    elif waiting == "cc_email":
-        cc = context.user_data.setdefault("cc_recipients", [])
-        cc.append(text.strip())
-        cc_list_text = "\n".join(f"• {e}" for e in cc)
-        context.user_data["waiting_for"] = None
-        await message.reply_text(
-            f"✅ CC Added!\n\nCurrent CC List:\n{cc_list_text}\n\nWhat would you like to do?",
-            reply_markup=cc_options_keyboard(has_cc=True),
-        )
+# ── Greeting / unrecognised ───────────────────────────────────────────────────
 
-    # ── Custom subject ────────────────────────────────────────────────────────
-    elif waiting == "custom_subject":
-        context.user_data["email_subject"] = text
-        context.user_data["waiting_for"] = "custom_body"
-        await message.reply_text(f"✅ Subject: {text}\n\n📝 Now please type the message body:")
+async def greeting(message: Message, context: Context, text: str) -> None:
+    """Restart the bot on "hi", "hello", …"""
+    context.user_data.clear()
+    await message.reply_text(
+        "Welcome to Email Bot! 📧\n\nChoose an option below:",
+        reply_markup=home_keyboard(),
+    )
 
-    # ── Custom body ───────────────────────────────────────────────────────────
-    elif waiting == "custom_body":
-        context.user_data["email_body"] = text
-        context.user_data["waiting_for"] = None
-        await _send_preview(message, context)
 
-    # ── Date range start ──────────────────────────────────────────────────────
-    elif waiting == "date_range_start":
-        context.user_data["date_start"] = text.strip()
-        context.user_data["waiting_for"] = "date_range_end"
-        await message.reply_text(
-            "📅 Now enter end date (format: YYYY-MM-DD or DD/MM/YYYY):\nExample: 2026-02-20"
-        )
+async def unrecognised(message: Message, context: Context, text: str) -> None:
+    await message.reply_text(
+        "👋 Not sure what you mean. Use /start to begin.",
+        reply_markup=home_keyboard(),
+    )
 
-    # ── Date range end ────────────────────────────────────────────────────────
-    elif waiting == "date_range_end":
-        context.user_data["date_end"] = text.strip()
-        context.user_data["waiting_for"] = None
-        if context.user_data.get("selected_preset") in DATE_REQUIRING_PRESETS:
-            await _ask_for_reason(message, context)
-        else:
-            await _finish_preset(message, context)
-
-    # ── Single date ───────────────────────────────────────────────────────────
-    elif waiting == "date_single":
-        context.user_data["date_single"] = text.strip()
-        context.user_data["waiting_for"] = None
-        if context.user_data.get("selected_preset") in DATE_REQUIRING_PRESETS:
-            await _ask_for_reason(message, context)
-        else:
-            await _finish_preset(message, context)
-
-    # ── Leave reason ──────────────────────────────────────────────────────────
-    elif waiting == "leave_reason":
-        context.user_data["leave_reason"] = text.strip()
-        context.user_data["waiting_for"] = None
-        await _finish_preset(message, context)
 
-    # ── Edit subject ──────────────────────────────────────────────────────────
-    elif waiting == "edit_subject_text":
-        context.user_data["email_subject"] = text
-        context.user_data["waiting_for"] = None
-        await message.reply_text(f"✅ Subject updated: {text}")
-        await _send_preview(message, context)
+# ── Recipients ────────────────────────────────────────────────────────────────
 
-    # ── Edit body ─────────────────────────────────────────────────────────────
-    elif waiting == "edit_body_text":
-        context.user_data["email_body"] = text
-        context.user_data["waiting_for"] = None
-        await message.reply_text("✅ Message body updated!")
-        await _send_preview(message, context)
+async def receiver_email(message: Message, context: Context, text: str) -> None:
+    context.user_data["receiver_email"] = text.strip()
+    context.user_data["waiting_for"] = None
+    await message.reply_text(
+        f"✅ Receiver: {text.strip()}\n\nDo you want to add CC recipients?",
+        reply_markup=cc_options_keyboard(has_cc=False),
+    )
 
-    # ── Unrecognised state ────────────────────────────────────────────────────
-    else:
+
+async def bulk_addresses(message: Message, context: Context, text: str) -> None:
+    """A pasted list — or the contents of an uploaded file, see ``handle_document``."""
+    recipients, skipped = bulk.parse_recipients(text)
+    context.user_data["bulk_list"] = recipients
+    context.user_data["waiting_for"] = None
+    total = len(bulk.collect(context.user_data))
+    reply = f"✅ {len(recipients)} addresses read from the list ({total} recipients in total)."
+    if skipped:
+        shown = ", ".join(skipped[:5]) + (" …" if len(skipped) > 5 else "")
+        reply += f"\n⚠️ Skipped {len(skipped)} invalid entries: {shown}"
+    if total >= bulk.BULK_MAX_RECIPIENTS:
+        reply += f"\n⚠️ Only the first {bulk.BULK_MAX_RECIPIENTS} recipients will be used."
+    await message.reply_text(
+        reply,
+        reply_markup=bulk_recipients_keyboard(set(context.user_data.get("bulk_groups", []))),
+    )
+
+
+async def cc_email(message: Message, context: Context, text: str) -> None:
+    cc = context.user_data.setdefault("cc_recipients", [])
+    cc.append(text.strip())
+    cc_list_text = "\n".join(f"• {e}" for e in cc)
+    context.user_data["waiting_for"] = None
+    await message.reply_text(
+        f"✅ CC Added!\n\nCurrent CC List:\n{cc_list_text}\n\nWhat would you like to do?",
+        reply_markup=cc_options_keyboard(has_cc=True),
+    )
+
+
+# ── Custom message ────────────────────────────────────────────────────────────
+
+async def custom_subject(message: Message, context: Context, text: str) -> None:
+    context.user_data["email_subject"] = text
+    context.user_data["waiting_for"] = "custom_body"
+    await message.reply_text(f"✅ Subject: {text}\n\n📝 Now please type the message body:")
+
+
+async def custom_body(message: Message, context: Context, text: str) -> None:
+    context.user_data["email_body"] = text
+    context.user_data["waiting_for"] = None
+    await _send_preview(message, context)
+
+
+# ── Dates and reason ──────────────────────────────────────────────────────────
+
+async def date_range_start(message: Message, context: Context, text: str) -> None:
+    context.user_data["date_start"] = text.strip()
+    context.user_data["waiting_for"] = "date_range_end"
+    await message.reply_text(
+        "📅 Now enter end date (format: YYYY-MM-DD or DD/MM/YYYY):\nExample: 2026-02-20"
+    )
+
+
+async def date_range_end(message: Message, context: Context, text: str) -> None:
+    context.user_data["date_end"] = text.strip()
+    context.user_data["waiting_for"] = None
+    await _after_dates(message, context)
+
+
+async def date_single(message: Message, context: Context, text: str) -> None:
+    context.user_data["date_single"] = text.strip()
+    context.user_data["waiting_for"] = None
+    await _after_dates(message, context)
+
+
+async def leave_reason(message: Message, context: Context, text: str) -> None:
+    context.user_data["leave_reason"] = text.strip()
+    context.user_data["waiting_for"] = None
+    await _finish_preset(message, context)
+
+
+# ── Preview editing ───────────────────────────────────────────────────────────
+
+async def edit_subject_text(message: Message, context: Context, text: str) -> None:
+    context.user_data["email_subject"] = text
+    context.user_data["waiting_for"] = None
+    await message.reply_text(f"✅ Subject updated: {text}")
+    await _send_preview(message, context)
+
+
+async def edit_body_text(message: Message, context: Context, text: str) -> None:
+    context.user_data["email_body"] = text
+    context.user_data["waiting_for"] = None
+    await message.reply_text("✅ Message body updated!")
+    await _send_preview(message, context)
+
+
+# ── Send later ────────────────────────────────────────────────────────────────
+
+async def schedule_time(message: Message, context: Context, text: str) -> None:
+    problem = scheduler.unavailable()
+    if problem:
+        context.user_data["waiting_for"] = None
         await message.reply_text(
-            "👋 Not sure what you mean. Use /start to begin.",
-            reply_markup=home_keyboard(),
+            f"⚠️ {problem} Send now instead.", reply_markup=preview_keyboard()
         )
+        return
+    when = parse_when(text)
+    problem = "I couldn't read that time." if when is None else check_when(when)
+    if problem:
+        # Stay in this state so the user can simply try again
+        await message.reply_text(f"❌ {problem} Try e.g. 2026-02-15 09:30, 18:00 or in 2h:")
+        return
+    # No status message to edit: an inline-held reply returns True, not a
+    # Message, so the dispatcher reports the outcome in a new message
+    drafted = draft_job(
+        message.from_user.id, context.user_data, message.chat_id, due=when.timestamp()
+    )
+    if drafted is None:
+        await message.reply_text("❌ Missing email details. Please start over with /start")
+        return
+    context.user_data["waiting_for"] = None
+    job, key = drafted
+    schedule_id = await scheduler.schedule(key, message.from_user.id, job, when.timestamp())
+    if schedule_id is None:
+        await message.reply_text("ℹ️ This email is already scheduled for that time.")
+        return
+    await message.reply_text(
+        text=(
+            f"⏰ **Scheduled #{schedule_id}** for {format_when(when.timestamp())}\n\n"
+            "Use 'Scheduled Emails' on the home menu to cancel it."
+        ),
+        reply_markup=post_send_keyboard(),
+        parse_mode="Markdown",
+    )
 
 
-async def _finish_preset(message, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Build the preset body and show the email preview."""
-    preset_key = context.user_data.get("selected_preset")
-    if not preset_key or preset_key not in PRESET_MESSAGES:
-        await message.reply_text("❌ Error: Preset not found. Please start over with /start")
+# ── Attachments ───────────────────────────────────────────────────────────────
+
+async def attachment_file(message: Message, context: Context, text: str) -> None:
+    """The document or photo in *message* joins the draft — see ``handle_document``."""
+    attachment = describe(message)
+    attached = context.user_data.setdefault("attachments", [])
+    problem = check(attached, attachment)
+    if problem:
+        # Stay in this state so the user can send another file
+        await message.reply_text(f"❌ {problem} Send another file, or any text to go back:")
         return
+    attached.append(attachment)
+    context.user_data["waiting_for"] = None
+    await message.reply_text(f"📎 Attached {attachment['name']}.")
+    await _send_preview(message, context)
+
 
-    body = build_preset_body(preset_key, context.user_data)
-    context.user_data["email_subject"] = PRESET_MESSAGES[preset_key]["subject"]
-    context.user_data["email_body"] = body
+async def attachment_text(message: Message, context: Context, text: str) -> None:
+    context.user_data["waiting_for"] = None
     await _send_preview(message, context)
@@ -0,0 +1,141 @@
+"""Answer a webhook with one Bot API call in the HTTP response body.
+
+Telegram executes a method returned as the webhook's JSON response, which
+saves one outbound HTTPS request per update.  While an update runs under
+:func:`process_with_inline_reply`, :class:`InlineReplyBot` holds back the
+handler's first call, if it is eligible, instead of sending it:
+
+* later calls are sent normally — but if the held call shows up in the
+  chat, it is sent first so messages stay in order, and the response is
+  empty; a held ``answerCallbackQuery`` does not affect the chat and stays;
+* when the handler returns, whatever is still held becomes the response;
+* if the handler is still running after ``INLINE_REPLY_WAIT`` seconds, a
+  held answer is returned anyway and anything else is sent normally.
+
+Held calls report success (``True``) to the handler.  That is the real
+result of ``answerCallbackQuery``, the only method eligible by default;
+other methods (``INLINE_REPLY_METHODS``) hand the handler ``True`` instead
+of a ``Message`` and reach the chat only once the response is delivered.
+"""
+import asyncio
+import contextvars
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from telegram.ext import Application, ExtBot
+from telegram.request import RequestData
+# Not re-exported, but the same conversion Bot._do_post applies to its data
+from telegram.request._requestparameter import RequestParameter
+
+from app.config import INLINE_REPLY_METHODS, INLINE_REPLY_WAIT
+
+_ANSWER = "answerCallbackQuery"
+
+_current: contextvars.ContextVar["InlineReply | None"] = contextvars.ContextVar(
+    "inline_reply", default=None
+)
+
+Send = Callable[..., Awaitable[Any]]
+
+
+class InlineReply:
+    """The webhook response slot for one update."""
+
+    def __init__(self, methods: frozenset[str] = INLINE_REPLY_METHODS) -> None:
+        self.methods = methods
+        self.closed = False
+        self._called = False
+        self._held: tuple[Send, str, dict, dict, dict] | None = None
+        self._done = asyncio.get_running_loop().create_future()
+        self._flush: asyncio.Task | None = None
+
+    async def call(
+        self, send: Send, endpoint: str, data: dict, timeouts: dict, payload: dict
+    ) -> Any:
+        """Send or hold one call; *payload* is *data* without PTB's internal keys."""
+        if self.closed:
+            if self._flush is not None:
+                # Let a held call released on timeout go out first
+                await asyncio.wait({self._flush})
+            return await send(endpoint=endpoint, data=data, **timeouts)
+        first, self._called = not self._called, True
+        if first:
+            if endpoint in self.methods and _inlineable(payload):
+                self._held = (send, endpoint, data, timeouts, payload)
+                return True
+        elif self._held is not None and self._held[1] != _ANSWER:
+            # Keep chat order: the held call goes out before this one
+            held, self._held = self._held, None
+            await held[0](endpoint=held[1], data=held[2], **held[3])
+        return await send(endpoint=endpoint, data=data, **timeouts)
+
+    def finish(self) -> None:
+        """The handler returned: release the held call as the response."""
+        if not self._done.done():
+            self._done.set_result(None)
+
+    async def response(self, timeout: float = INLINE_REPLY_WAIT) -> dict | None:
+        """Wait for the handler, then return the webhook body (or ``None``)."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._done), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.closed = True
+        held, self._held = self._held, None
+        if held is None:
+            return None
+        send, endpoint, data, timeouts, payload = held
+        if self._done.done() or endpoint == _ANSWER:
+            return {"method": endpoint, **_parameters(payload)}
+        # The handler may still send more; only an answer is order-safe to inline
+        self._flush = asyncio.ensure_future(send(endpoint=endpoint, data=data, **timeouts))
+        await self._flush
+        return None
+
+
+def _request_data(data: dict) -> RequestData:
+    return RequestData([RequestParameter.from_input(key, value) for key, value in data.items()])
+
+
+def _inlineable(data: dict) -> bool:
+    return not _request_data(data).contains_files
+
+
+def _parameters(data: dict) -> dict:
+    return _request_data(data).parameters
+
+
+class InlineReplyBot(ExtBot):
+    """:class:`ExtBot` that routes calls through the current :class:`InlineReply`."""
+
+    async def _do_post(self, endpoint: str, data: dict, **timeouts: Any) -> Any:
+        reply = _current.get()
+        if reply is None:
+            return await super()._do_post(endpoint=endpoint, data=data, **timeouts)
+        # Drop the rate limiter's arguments from what may become the response
+        payload = dict(data)
+        self._extract_rl_kwargs(payload)
+        return await reply.call(super()._do_post, endpoint, data, timeouts, payload)
+
+
+async def _process(application: Application, update: object, reply: InlineReply) -> None:
+    token = _current.set(reply)
+    try:
+        await application.process_update(update)
+    finally:
+        _current.reset(token)
+        reply.finish()
+
+
+async def process_with_inline_reply(application: Application, update: object) -> dict | None:
+    """Process *update* and return the webhook response body, if any.
+
+    Goes through the application's update processor, so per-chat ordering
+    and the concurrency limit still apply.
+    """
+    reply = InlineReply()
+    application.create_task(
+        application.update_processor.process_update(update, _process(application, update, reply)),
+        update=update,
+    )
+    return await reply.response()
@@ -0,0 +1,132 @@
+"""Per-chat update lanes: concurrent across chats, ordered within one chat.
+
+The ``waiting_for`` state machine assumes a user's taps and text are
+handled one after another.  :class:`LaneUpdateProcessor` shards updates by
+chat id into FIFO lanes, each drained by its own task, while a global
+semaphore bounds how many handlers run at once.  A lane's task exits and
+the lane is dropped as soon as its queue is empty, so idle chats cost
+nothing.
+"""
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Hashable
+from typing import Any
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING
+
+
+def lane_key(update: object) -> Hashable | None:
+    """The chat (or, failing that, user) an update belongs to."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return None
+
+
+class _Lane:
+    __slots__ = ("pending", "task")
+
+    def __init__(self) -> None:
+        self.pending: deque[tuple[Awaitable[Any], asyncio.Future]] = deque()
+        self.task: asyncio.Task | None = None
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    """PTB update processor that keeps each chat's updates in order.
+
+    ``max_pending`` is PTB's own limit — how many updates may be accepted
+    (queued or running) before intake waits.  ``concurrency`` bounds how
+    many of them execute handlers at the same time.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = UPDATE_CONCURRENCY,
+        max_pending: int = UPDATE_MAX_PENDING,
+    ) -> None:
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lanes: dict[Hashable, _Lane] = {}
+        self._running = 0
+        self.processed = 0
+        self.lanes_opened = 0
+        self.peak_depth = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        tasks = [lane.task for lane in self._lanes.values() if lane.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = lane_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+            lane.task = asyncio.create_task(self._drain(key, lane), name=f"lane-{key}")
+            self.lanes_opened += 1
+        lane.pending.append((coroutine, done))
+        self.peak_depth = max(self.peak_depth, len(lane.pending))
+        await done
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+                self.processed += 1
+
+    async def _drain(self, key: Hashable, lane: _Lane) -> None:
+        try:
+            while lane.pending:
+                coroutine, done = lane.pending[0]
+                if done.cancelled():
+                    coroutine.close()
+                else:
+                    try:
+                        await self._run(coroutine)
+                    except Exception as exc:
+                        if not done.done():
+                            done.set_exception(exc)
+                    else:
+                        if not done.done():
+                            done.set_result(None)
+                lane.pending.popleft()
+        finally:
+            # No await between the empty check and this, so nothing can
+            # be appended to a lane that is being dropped
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+            # Only non-empty if this task was cancelled mid-lane
+            for coroutine, done in lane.pending:
+                coroutine.close()
+                done.cancel()
+
+    def stats(self) -> dict:
+        depths = [len(lane.pending) for lane in self._lanes.values()]
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "active_lanes": len(depths),
+            "queued": sum(depths),
+            "max_lane_depth": max(depths, default=0),
+            "peak_lane_depth": self.peak_depth,
+            "lanes_opened": self.lanes_opened,
+            "processed": self.processed,
+        }
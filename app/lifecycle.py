@@ -0,0 +1,22 @@
+"""Start and stop the per-worker background services with the bot."""
+from telegram.ext import Application
+
+from app.content import content_watcher
+from app.dispatch import mail_dispatcher
+from app.recorder import recorder
+from app.scheduler import scheduler
+
+
+async def on_startup(application: Application) -> None:
+    """PTB ``post_init`` hook."""
+    content_watcher.start()
+    await mail_dispatcher.start(application.bot)
+    await scheduler.start(application.bot)
+
+
+async def on_shutdown(application: Application) -> None:
+    """PTB ``post_stop`` hook — runs while the bot can still edit messages."""
+    await scheduler.stop()
+    await mail_dispatcher.stop()
+    content_watcher.stop()
+    recorder.close()
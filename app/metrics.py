@@ -0,0 +1,217 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Histograms and counters are recorded on the hot paths (webhook, update
+parsing, handler steps, Bot API calls, SMTP phases).  Recording is a
+``perf_counter`` pair, a bisect over the bucket bounds and a few additions
+under an uncontended lock, so it stays on in production.  Gauges are not
+stored at all: :func:`render` flattens the numeric values of
+:func:`app.status.health_status` at scrape time.
+
+Metrics are per worker process; with several workers each scrape sees the
+worker that answered it (gauges carry a ``pid`` label to tell them apart).
+"""
+import bisect
+import os
+import threading
+import time
+
+_PREFIX = "mailbot_"
+
+# Seconds; covers in-process steps (sub-ms) up to slow SMTP sessions
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_registry: list["_Metric"] = []
+
+
+def _label_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = _PREFIX + name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines += child.render(self.name, self.labelnames, values)
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values) -> list[str]:
+        return [f"{name}_total{_label_text(labelnames, values)} {_number(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: "_HistogramChild") -> None:
+        self.child = child
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def render(self, name, labelnames, values) -> list[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            bucket_labels = _label_text(labelnames, values, 'le="' + le + '"')
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        labels = _label_text(labelnames, values)
+        lines.append(f"{name}_sum{labels} {total!r}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, seconds: float) -> None:
+        self.labels().observe(seconds)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+
+# ── Hot-path metrics ──────────────────────────────────────────────────────────
+
+WEBHOOK_SECONDS = Histogram(
+    "webhook_request_seconds", "Whole webhook request, body read to response.", ("server",)
+)
+DE_JSON_SECONDS = Histogram("update_de_json_seconds", "Update.de_json on a webhook payload.")
+HANDLER_SECONDS = Histogram(
+    "handler_seconds", "One conversation step, by callback id or text state.", ("kind", "step")
+)
+BOT_API_SECONDS = Histogram(
+    "bot_api_request_seconds", "One Bot API HTTP request, by method.", ("method",)
+)
+BOT_API_ERRORS = Counter(
+    "bot_api_errors", "Bot API requests that raised, by method.", ("method",)
+)
+SMTP_SECONDS = Histogram(
+    "smtp_phase_seconds", "SMTP session phases (connect, starttls, login, noop, send).", ("phase",)
+)
+EMAILS = Counter("emails", "Send attempts by outcome (sent, retry, failed).", ("outcome",))
+UPDATES = Counter(
+    "updates", "Incoming updates by result (accepted, duplicate, rejected).", ("result",)
+)
+
+
+# ── Exposition ────────────────────────────────────────────────────────────────
+
+def _flatten(prefix: str, value, out: list[tuple[str, float]]) -> None:
+    if isinstance(value, (int, float)):   # bools included
+        out.append((prefix, float(value)))
+    elif isinstance(value, dict):
+        for key, inner in value.items():
+            _flatten(f"{prefix}_{key}", inner, out)
+
+
+def render(status: dict | None = None) -> str:
+    """All metrics, plus the numeric fields of *status* as gauges."""
+    lines: list[str] = []
+    for metric in _registry:
+        lines += metric.render()
+    if status:
+        pid = f'{{pid="{os.getpid()}"}}'
+        gauges: list[tuple[str, float]] = []
+        for section, value in status.items():
+            _flatten(_PREFIX + section, value, gauges)
+        for name, value in gauges:
+            name = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{pid} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
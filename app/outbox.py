@@ -0,0 +1,176 @@
+"""Disk-backed outbox for outgoing mail.
+
+Every email is written here before any SMTP work starts, keyed by an
+idempotency key derived from the draft, so a crash, a transient provider
+error, a double tap or a redelivered update can never lose or duplicate a
+message.  Rows move ``pending → sending → sent`` (or ``failed``); a row stuck
+in ``sending`` past its lease is picked up again by any worker.
+"""
+import hashlib
+import json
+import random
+import smtplib
+import threading
+import time
+
+from app.config import (
+    OUTBOX_DB_PATH,
+    OUTBOX_RETRY_BASE,
+    OUTBOX_RETRY_MAX,
+    OUTBOX_LEASE,
+)
+from app.utils.db import connect
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def idempotency_key(user_id: int, draft_id: str, payload: dict) -> str:
+    """Stable key for one draft's content — edits produce a new key."""
+    raw = json.dumps([user_id, draft_id, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for errors worth retrying: dropped connections and 4xx replies.
+
+    Other SMTP errors carry no reply code and point at the setup (e.g.
+    ``SMTPNotSupportedError`` when the server offers no AUTH), so they fail.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    # SMTPException subclasses OSError; plain OSErrors are socket trouble
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) attempt."""
+    ceiling = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (attempt - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class Outbox:
+    """SQLite table of outgoing messages shared by all worker processes."""
+
+    def __init__(self, path: str = OUTBOX_DB_PATH) -> None:
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        # Opened lazily so the file is created inside the worker, after fork
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY,"
+                " idem_key TEXT NOT NULL UNIQUE,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL,"
+                " lease_until REAL,"
+                " last_error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)"
+            )
+        return self._conn
+
+    def enqueue(self, key: str, payload: dict) -> int | None:
+        """Record a message; return its row id, or ``None`` for a duplicate.
+
+        A key whose earlier attempt failed permanently may be queued again.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO outbox (idem_key, payload, status, next_attempt_at, created_at,"
+                " updated_at) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (idem_key) DO NOTHING",
+                (key, json.dumps(payload), PENDING, now, now, now),
+            )
+            if cur.rowcount:
+                return cur.lastrowid
+            cur = self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ?"
+                " WHERE idem_key = ? AND status = ? RETURNING id",
+                (PENDING, now, now, key, FAILED),
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def claim(self, row_id: int) -> tuple[dict, int] | None:
+        """Atomically take a due row; return ``(payload, attempt)`` or ``None``."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, lease_until = ?,"
+                " updated_at = ? WHERE id = ? AND ((status = ? AND next_attempt_at <= ?)"
+                " OR (status = ? AND lease_until < ?)) RETURNING payload, attempts",
+                (SENDING, now + OUTBOX_LEASE, now, row_id, PENDING, now, SENDING, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def due(self, limit: int = 50, now: float | None = None) -> list[int]:
+        """Ids of rows ready for an attempt, including expired leases."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id FROM outbox WHERE (status = ? AND next_attempt_at <= ?)"
+                " OR (status = ? AND lease_until < ?) ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, SENDING, now, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def next_due_at(self, after: float = 0.0) -> float | None:
+        """When the first pending row not yet due at *after* becomes due."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox"
+                " WHERE status = ? AND next_attempt_at > ?",
+                (PENDING, after),
+            ).fetchone()
+        return row[0]
+
+    def mark_sent(self, row_id: int) -> None:
+        self._set(row_id, SENT)
+
+    def mark_failed(self, row_id: int, error: str) -> None:
+        self._set(row_id, FAILED, error=error)
+
+    def mark_retry(self, row_id: int, error: str, delay: float) -> None:
+        self._set(row_id, PENDING, error=error, next_attempt_at=time.time() + delay)
+
+    def _set(self, row_id: int, status: str, *, error: str | None = None,
+             next_attempt_at: float | None = None) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, last_error = COALESCE(?, last_error),"
+                " next_attempt_at = COALESCE(?, next_attempt_at), lease_until = NULL,"
+                " updated_at = ? WHERE id = ?",
+                (status, error, next_attempt_at, now, row_id),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+
+# Shared by every handler and worker in this process
+outbox = Outbox()
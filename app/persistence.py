@@ -0,0 +1,307 @@
+"""Per-user conversation state shared by every worker process.
+
+PTB keeps ``context.user_data`` in process memory.  With several workers,
+consecutive updates for one user may land on different processes, so the
+state is re-read before each update via
+:meth:`BasePersistence.refresh_user_data` and written to a shared key-value
+store before the bot replies: :func:`write_through` runs ahead of every Bot
+API request made while the user's update is handled, and once more when the
+handler returns.  The user can only send their next update after seeing a
+reply, so whichever worker receives it finds the state already stored.
+"""
+import asyncio
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from app.config import (
+    STATE_BACKEND,
+    STATE_DB_PATH,
+    STATE_REDIS_URL,
+    STATE_UPDATE_INTERVAL,
+)
+from app.utils.db import connect
+
+logger = logging.getLogger(__name__)
+
+USER_NAMESPACE = "user_data"
+
+# The user whose update is being handled: (persistence, user_id, user_data)
+_handling: ContextVar[tuple["SharedPersistence", int, dict] | None] = ContextVar(
+    "state_handling", default=None
+)
+
+
+# ── Key-value backends ────────────────────────────────────────────────────────
+
+class StateStore(ABC):
+    """Minimal key-value interface the persistence writes through."""
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> str | None:
+        """Return the stored value or ``None``."""
+
+    @abstractmethod
+    def get_all(self, namespace: str) -> dict[str, str]:
+        """Return every key/value in *namespace*."""
+
+    @abstractmethod
+    def put_many(self, namespace: str, items: dict[str, str]) -> None:
+        """Store all *items* in a single round-trip / transaction."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove *key* if present."""
+
+    def close(self) -> None:
+        """Release the underlying connection."""
+
+
+class SQLiteStore(StateStore):
+    """Store backed by a single SQLite file in WAL mode (the default)."""
+
+    def __init__(self, path: str) -> None:
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+
+    def get(self, namespace: str, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_all(self, namespace: str) -> dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return dict(rows)
+
+    def put_many(self, namespace: str, items: dict[str, str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value",
+                    [(namespace, key, value) for key, value in items.items()],
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStore(StateStore):
+    """Store backed by a local key-value server speaking the Redis protocol.
+
+    Each namespace is one hash.  Requires the optional ``redis`` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "mailerbot:") -> None:
+        try:
+            import redis
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise RuntimeError(
+                "STATE_BACKEND=redis requires the 'redis' package (pip install redis)"
+            ) from exc
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    def _hash(self, namespace: str) -> str:
+        return f"{self._prefix}{namespace}"
+
+    def get(self, namespace: str, key: str) -> str | None:
+        return self._client.hget(self._hash(namespace), key)
+
+    def get_all(self, namespace: str) -> dict[str, str]:
+        return self._client.hgetall(self._hash(namespace))
+
+    def put_many(self, namespace: str, items: dict[str, str]) -> None:
+        self._client.hset(self._hash(namespace), mapping=items)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._client.hdel(self._hash(namespace), key)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+# ── PTB persistence ───────────────────────────────────────────────────────────
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+class SharedPersistence(BasePersistence[dict, dict, dict]):
+    """Persist ``user_data`` only, one small JSON row per user.
+
+    The user of the update being handled is written through (see
+    :meth:`handling`).  Anything else PTB marks dirty is written behind: all
+    users from one persistence run are flushed in a single transaction.
+    Users whose data did not actually change are skipped entirely.
+    """
+
+    def __init__(self, store: StateStore, update_interval: float = STATE_UPDATE_INTERVAL) -> None:
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self._last_seen: dict[int, str] = {}
+        self._pending: dict[int, str] = {}
+        self._flush_scheduled = False
+
+    # ── user_data ────────────────────────────────────────────────────────────
+
+    async def get_user_data(self) -> dict[int, dict]:
+        rows = self.store.get_all(USER_NAMESPACE)
+        self._last_seen = {int(key): raw for key, raw in rows.items()}
+        return {user_id: json.loads(raw) for user_id, raw in self._last_seen.items()}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        # Another worker may have advanced this user's flow since we last looked
+        if user_id in self._pending:
+            return
+        raw = self.store.get(USER_NAMESPACE, str(user_id))
+        if raw is None:
+            raw = _dumps({})
+        if raw == self._last_seen.get(user_id):
+            return
+        self._last_seen[user_id] = raw
+        user_data.clear()
+        user_data.update(json.loads(raw))
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        raw = _dumps(data)
+        if raw == self._last_seen.get(user_id):
+            return
+        self._last_seen[user_id] = raw
+        self._pending[user_id] = raw
+        if not self._flush_scheduled:
+            # PTB updates all dirty users concurrently; coalesce them into one write
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._write_pending)
+
+    @contextmanager
+    def handling(self, user_id: int, user_data: dict) -> Iterator[None]:
+        """Write *user_data* through while, and once after, the block handles its update."""
+        token = _handling.set((self, user_id, user_data))
+        try:
+            yield
+        finally:
+            _handling.reset(token)
+            self.write_now(user_id, user_data)
+
+    def write_now(self, user_id: int, data: dict) -> None:
+        """Store *user_id*'s data right away if it changed since it was last stored."""
+        raw = _dumps(data)
+        if raw == self._last_seen.get(user_id):
+            return
+        try:
+            self.store.put_many(USER_NAMESPACE, {str(user_id): raw})
+        except Exception as exc:
+            # Left for the next write-behind run, which sees it as changed
+            logger.error("Failed to persist user_data for user %s: %s", user_id, exc)
+            return
+        self._last_seen[user_id] = raw
+        self._pending.pop(user_id, None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending.pop(user_id, None)
+        self._last_seen.pop(user_id, None)
+        self.store.delete(USER_NAMESPACE, str(user_id))
+
+    def _write_pending(self) -> None:
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            self.store.put_many(USER_NAMESPACE, {str(k): v for k, v in pending.items()})
+        except Exception as exc:
+            logger.error("Failed to persist user_data for %d users: %s", len(pending), exc)
+            for user_id in pending:
+                self._last_seen.pop(user_id, None)
+
+    async def flush(self) -> None:
+        self._write_pending()
+
+    # ── Unused data kinds ────────────────────────────────────────────────────
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        return None
+
+    async def update_bot_data(self, data: dict) -> None:
+        return None
+
+    async def update_callback_data(self, data: object) -> None:
+        return None
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        return None
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        return None
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        return None
+
+
+def write_through() -> None:
+    """Store the handled update's user data now; called before each Bot API request."""
+    active = _handling.get()
+    if active is not None:
+        persistence, user_id, user_data = active
+        persistence.write_now(user_id, user_data)
+
+
+def build_persistence() -> SharedPersistence | None:
+    """Return the persistence configured by ``STATE_BACKEND`` (or ``None``)."""
+    if STATE_BACKEND == "memory":
+        return None
+    if STATE_BACKEND == "redis":
+        return SharedPersistence(RedisStore(STATE_REDIS_URL))
+    if STATE_BACKEND != "sqlite":
+        logger.warning("Unknown STATE_BACKEND %r — using sqlite", STATE_BACKEND)
+    return SharedPersistence(SQLiteStore(STATE_DB_PATH))
@@ -0,0 +1,185 @@
+"""Long-polling ingestion: batched ``getUpdates`` with a durable offset.
+
+For local runs, benchmarks and hosts without a public HTTPS URL.  Each
+batch (up to ``POLL_LIMIT`` updates) goes through the application's update
+processor, so it runs concurrently across chats and in order within a chat.
+The next offset is written to SQLite only once the whole batch is done: a
+restart resumes at that offset, so no update is lost, and at most the one
+interrupted batch is fetched again.  Each handled update is recorded with
+the webhook's :mod:`app.dedup`, so the replay skips the updates that
+already ran and only the rest are handled.
+"""
+import asyncio
+import contextlib
+import logging
+import signal
+
+from telegram import Update
+from telegram.error import RetryAfter, TelegramError, TimedOut
+from telegram.ext import Application
+
+from app.bot import build_application, start_application, stop_application
+from app.config import POLL_TIMEOUT, POLL_LIMIT, POLL_OFFSET_DB_PATH
+from app.dedup import deduplicator
+from app.metrics import UPDATES
+from app.ratelimit import retry_after_seconds
+from app.utils.db import connect
+
+logger = logging.getLogger(__name__)
+
+# Pause after a failed getUpdates, doubled per consecutive failure
+_BACKOFF_START = 1.0
+_BACKOFF_MAX = 30.0
+
+
+class OffsetStore:
+    """The next ``getUpdates`` offset per bot id, kept in SQLite."""
+
+    def __init__(self, path: str = POLL_OFFSET_DB_PATH) -> None:
+        self.path = path
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS poll_offsets ("
+                " bot_id INTEGER PRIMARY KEY, next_offset INTEGER NOT NULL)"
+            )
+        return self._conn
+
+    def load(self, bot_id: int) -> int | None:
+        row = self._db().execute(
+            "SELECT next_offset FROM poll_offsets WHERE bot_id = ?", (bot_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, bot_id: int, offset: int) -> None:
+        self._db().execute(
+            "INSERT INTO poll_offsets (bot_id, next_offset) VALUES (?, ?)"
+            " ON CONFLICT(bot_id) DO UPDATE SET next_offset = excluded.next_offset",
+            (bot_id, offset),
+        )
+
+
+class Poller:
+    """Drive an :class:`Application` from ``getUpdates`` until :meth:`stop`."""
+
+    def __init__(
+        self,
+        application: Application,
+        offsets: OffsetStore | None = None,
+        timeout: int = POLL_TIMEOUT,
+        limit: int = POLL_LIMIT,
+    ) -> None:
+        self.application = application
+        self.offsets = offsets or OffsetStore()
+        self.timeout = timeout
+        self.limit = min(max(limit, 1), 100)
+        self._stop: asyncio.Event | None = None
+        self.batches = 0
+        self.updates = 0
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self) -> None:
+        self._stop = asyncio.Event()
+        await start_application(self.application)
+        try:
+            # getUpdates is refused while a webhook is registered
+            await self.application.bot.delete_webhook(drop_pending_updates=False)
+            logger.info("Polling for updates (batch %d, timeout %ds)", self.limit, self.timeout)
+            await self._poll()
+        finally:
+            await stop_application(self.application)
+            logger.info("Polling stopped after %d updates", self.updates)
+
+    async def _poll(self) -> None:
+        bot = self.application.bot
+        offset = self.offsets.load(bot.id)
+        backoff = _BACKOFF_START
+        while not self._stop.is_set():
+            try:
+                updates = await self._fetch(offset)
+            except RetryAfter as exc:
+                await self._sleep(retry_after_seconds(exc.retry_after))
+                continue
+            except TimedOut:
+                continue
+            except TelegramError as exc:
+                logger.warning("getUpdates failed (%s); retrying in %.0fs", exc, backoff)
+                await self._sleep(backoff)
+                backoff = min(backoff * 2, _BACKOFF_MAX)
+                continue
+            if updates is None:
+                return
+            backoff = _BACKOFF_START
+            if not updates:
+                continue
+
+            await self._process_batch(updates)
+            offset = updates[-1].update_id + 1
+            self.offsets.save(bot.id, offset)
+            self.batches += 1
+            self.updates += len(updates)
+
+    async def _fetch(self, offset: int | None) -> list[Update] | None:
+        """One long poll; ``None`` if :meth:`stop` was called meanwhile."""
+        fetch = asyncio.ensure_future(self.application.bot.get_updates(
+            offset=offset,
+            limit=self.limit,
+            timeout=self.timeout,
+            read_timeout=self.timeout + 10,
+        ))
+        stopped = asyncio.ensure_future(self._stop.wait())
+        done, _ = await asyncio.wait({fetch, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        if fetch not in done:
+            # Nothing fetched is lost: the offset only advances after processing
+            fetch.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await fetch
+            return None
+        stopped.cancel()
+        return list(fetch.result())
+
+    async def _sleep(self, seconds: float) -> None:
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._stop.wait(), seconds)
+
+    async def _process_batch(self, updates: list[Update]) -> None:
+        # Skip what a replayed batch already handled before the interruption
+        fresh = await asyncio.to_thread(
+            lambda: [u for u in updates if not deduplicator.seen(u.update_id, record=False)]
+        )
+        UPDATES.labels("duplicate").inc(len(updates) - len(fresh))
+        UPDATES.labels("accepted").inc(len(fresh))
+        # The update processor keeps per-chat order (see app.lanes)
+        app = self.application
+        results = await asyncio.gather(
+            *(app.update_processor.process_update(u, self._process(u)) for u in fresh),
+            return_exceptions=True,
+        )
+        for update, result in zip(fresh, results):
+            if isinstance(result, Exception):
+                logger.error("Update %s failed: %s", update.update_id, result)
+
+    async def _process(self, update: Update) -> None:
+        await self.application.process_update(update)
+        # Recorded once handled, so an interrupted update is run again
+        await asyncio.to_thread(deduplicator.seen, update.update_id)
+
+
+def run_polling() -> None:
+    """Blocking entry point used by ``python app.py --polling``."""
+    poller = Poller(build_application())
+
+    async def main() -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, poller.stop)
+        await poller.run()
+
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""On-demand cProfile sampling of updates, aggregated per worker process.
+
+``PROFILE_SAMPLE`` percent of updates (changeable at runtime through
+``/debug/profile``) run under :mod:`cProfile`; their stats are merged into
+one :class:`pstats.Stats` that the endpoint serves as text or as a
+``.pstats`` file for snakeviz / ``python -m pstats``.
+
+cProfile follows a thread, not a task: while a sampled update awaits, other
+updates running on the same event loop are profiled too.  Only one update is
+profiled at a time — a second profiler would replace the first — so samples
+that arrive meanwhile are skipped.  When the rate is 0 the per-update cost
+is one comparison, and :mod:`cProfile` / :mod:`pstats` are not even
+imported until the first sample.
+"""
+import hmac
+import io
+import json
+import marshal
+import os
+import random
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
+
+from app.config import ADMIN_TOKEN, PROFILE_SAMPLE
+from app.tracing import tracer
+
+if TYPE_CHECKING:
+    import pstats
+
+
+class UpdateProfiler:
+    def __init__(self, sample: float = 0.0) -> None:
+        self.sample = sample
+        self._lock = threading.Lock()
+        self._active = False
+        self._stats: "pstats.Stats | None" = None
+        self.profiled = 0
+        self.skipped = 0
+
+    def should_profile(self) -> bool:
+        if self.sample <= 0 or random.random() * 100 >= self.sample:
+            return False
+        with self._lock:
+            if self._active:
+                self.skipped += 1
+                return False
+            self._active = True
+        return True
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """Run the block under cProfile; only after :meth:`should_profile` said yes."""
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                try:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profiler)
+                    else:
+                        self._stats.add(profiler)
+                except TypeError:
+                    pass   # nothing was recorded
+                self.profiled += 1
+                self._active = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = None
+            self.profiled = self.skipped = 0
+
+    def text(self, sort: str = "cumulative", limit: int = 60) -> str:
+        """The aggregated stats as ``pstats`` prints them."""
+        out = io.StringIO()
+        with self._lock:
+            if self._stats is None:
+                return "No profiled updates yet.\n"
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self) -> bytes:
+        """The aggregated stats in the binary format ``pstats.Stats(path)`` loads."""
+        with self._lock:
+            if self._stats is None:
+                return marshal.dumps({})
+            return marshal.dumps(self._stats.stats)
+
+    def stats(self) -> dict:
+        return {
+            "sample_percent": self.sample,
+            "profiled": self.profiled,
+            "skipped": self.skipped,
+            "active": self._active,
+        }
+
+
+profiler = UpdateProfiler(PROFILE_SAMPLE)
+
+
+# ── /debug/profile ────────────────────────────────────────────────────────────
+
+_SORT_KEYS = {"cumulative", "tottime", "calls", "ncalls", "time"}
+
+
+def _percent(value: str) -> float:
+    percent = float(value)
+    if not 0 <= percent <= 100:
+        raise ValueError(value)
+    return percent
+
+
+def admin_endpoint(method: str, params: dict[str, str], token: str) -> tuple[int, bytes, dict]:
+    """Shared by both servers; returns ``(status, body, headers)``.
+
+    ``GET`` serves the aggregated stats (``?format=pstats`` as a download,
+    ``?sort=tottime&limit=100`` for the text form).  ``POST`` changes this
+    worker's rates — ``?profile=5&trace=1`` in percent — and ``?reset=1``
+    clears the stats.  Without a matching ``ADMIN_TOKEN`` it does not exist.
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return 404, b"Not Found", {"Content-Type": "text/plain; charset=utf-8"}
+
+    if method == "POST":
+        try:
+            if "profile" in params:
+                profiler.sample = _percent(params["profile"])
+            if "trace" in params:
+                tracer.sample = _percent(params["trace"])
+        except ValueError:
+            return 400, b"profile and trace are percentages (0-100)", {
+                "Content-Type": "text/plain; charset=utf-8"
+            }
+        if params.get("reset") == "1":
+            profiler.reset()
+        body = json.dumps({"profiler": profiler.stats(), "tracing": tracer.stats()})
+        return 200, body.encode(), {"Content-Type": "application/json"}
+
+    if params.get("format") == "pstats":
+        return 200, profiler.dump(), {
+            "Content-Type": "application/octet-stream",
+            "Content-Disposition": f'attachment; filename="profile-{os.getpid()}.pstats"',
+        }
+    sort = params.get("sort", "cumulative")
+    if sort not in _SORT_KEYS:
+        sort = "cumulative"
+    try:
+        limit = max(1, int(params.get("limit", "60")))
+    except ValueError:
+        limit = 60
+    header = f"pid {os.getpid()}: {json.dumps(profiler.stats())}\n\n"
+    return 200, (header + profiler.text(sort, limit)).encode(), {
+        "Content-Type": "text/plain; charset=utf-8"
+    }
@@ -0,0 +1,246 @@
+"""Flood-control-aware scheduling of outbound Bot API requests.
+
+:class:`FloodControlLimiter` plugs into PTB as the bot's rate limiter.
+Every request takes a token from a global bucket (about 30 requests/s)
+and, when it targets a chat, from that chat's bucket (about 1 message/s in
+private chats, 20/min in groups).  Waiting requests are granted in priority
+order, so user-facing replies overtake background progress edits.  A
+``RetryAfter`` from Telegram pauses the affected bucket and the request is
+retried instead of failing.
+
+Pass a priority with ``rate_limit_args=priority_args(BACKGROUND)``.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass, field
+from typing import Any
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from app.config import (
+    FLOOD_CONTROL,
+    RATE_GLOBAL,
+    RATE_CHAT,
+    RATE_GROUP_PER_MINUTE,
+    RATE_CHAT_BURST,
+    RATE_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Priorities: lower is served first
+USER = 0
+BACKGROUND = 10
+
+# Never queued: getUpdates is exempt in PTB already; these are not messages
+_EXEMPT = frozenset({"getMe", "getUpdates", "setWebhook", "deleteWebhook", "getWebhookInfo"})
+
+# Drop idle chat buckets this often (seconds)
+_SWEEP_EVERY = 60.0
+
+
+def priority_args(priority: int) -> dict | None:
+    """``rate_limit_args`` for a bot call, or ``None`` when flood control is off."""
+    return {"priority": priority} if FLOOD_CONTROL else None
+
+
+def retry_after_seconds(value) -> float:
+    """``RetryAfter.retry_after`` in seconds; an int or a timedelta by PTB version."""
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class TokenBucket:
+    """Classic token bucket with an optional hard pause (for ``RetryAfter``)."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token can be taken (0 if one is available now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0
+
+    def idle(self, now: float) -> bool:
+        return now >= self.paused_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    chat_id: int | str | None = field(compare=False)
+    granted: asyncio.Future = field(compare=False)
+
+
+class FloodControlLimiter(BaseRateLimiter[dict]):
+    """Global + per-chat token buckets with a priority queue in front."""
+
+    def __init__(
+        self,
+        rate: float = RATE_GLOBAL,
+        chat_rate: float = RATE_CHAT,
+        group_per_minute: float = RATE_GROUP_PER_MINUTE,
+        burst: float = RATE_CHAT_BURST,
+        max_retries: int = RATE_MAX_RETRIES,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.group_rate = group_per_minute / 60
+        self.burst = burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(rate, rate)
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._waiting: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._wake: asyncio.Event | None = None
+        self._pump: asyncio.Task | None = None
+        self._last_sweep = time.monotonic()
+        # Metrics
+        self.granted = 0
+        self.retry_afters = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    # ── PTB hooks ─────────────────────────────────────────────────────────────
+
+    async def initialize(self) -> None:
+        self._wake = asyncio.Event()
+        self._pump = asyncio.create_task(self._run(), name="flood-control")
+
+    async def shutdown(self) -> None:
+        if self._pump is not None:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+            self._pump = None
+        for ticket in self._waiting:
+            ticket.granted.cancel()
+        self._waiting.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: dict | None,
+    ) -> bool | dict | list[dict]:
+        if endpoint in _EXEMPT or self._pump is None:
+            return await callback(*args, **kwargs)
+        priority = (rate_limit_args or {}).get("priority", USER)
+        chat_id = data.get("chat_id")
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                self.retry_afters += 1
+                delay = retry_after_seconds(exc.retry_after)
+                # Telegram does not say which limit was hit; blame the chat when
+                # there is one so other chats keep flowing
+                bucket = self._bucket(chat_id) if chat_id is not None else self._global
+                bucket.pause(time.monotonic() + delay)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    "Flood control on %s (chat %s): retrying in %.1fs", endpoint, chat_id, delay
+                )
+
+    # ── Scheduling ────────────────────────────────────────────────────────────
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Negative ids (and @channel names) are groups and channels
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, self.burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id: int | str | None, priority: int) -> None:
+        ticket = _Ticket(
+            priority, next(self._seq), chat_id, asyncio.get_running_loop().create_future()
+        )
+        enqueued = time.monotonic()
+        self._waiting.append(ticket)
+        self._wake.set()
+        await ticket.granted
+        waited = time.monotonic() - enqueued
+        self.granted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._waiting:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            now = time.monotonic()
+            delay = self._global.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            chosen, soonest = None, None
+            self._waiting = [t for t in self._waiting if not t.granted.done()]
+            for ticket in sorted(self._waiting):
+                wait = self._bucket(ticket.chat_id).delay(now) if ticket.chat_id is not None else 0
+                if wait <= 0:
+                    chosen = ticket
+                    break
+                soonest = wait if soonest is None else min(soonest, wait)
+            if chosen is None:
+                # Every waiting chat is throttled; sleep until the first frees
+                # up, or until a new request (maybe for another chat) arrives
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), soonest)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._waiting.remove(chosen)
+            self._global.take()
+            if chosen.chat_id is not None:
+                self._bucket(chosen.chat_id).take()
+            chosen.granted.set_result(None)
+            if now - self._last_sweep > _SWEEP_EVERY:
+                self._sweep(now)
+
+    def _sweep(self, now: float) -> None:
+        busy = {t.chat_id for t in self._waiting}
+        for chat_id in [c for c, b in self._chats.items() if c not in busy and b.idle(now)]:
+            del self._chats[chat_id]
+        self._last_sweep = now
+
+    def stats(self) -> dict:
+        return {
+            "waiting": len(self._waiting),
+            "chat_buckets": len(self._chats),
+            "granted": self.granted,
+            "retry_after": self.retry_afters,
+            "wait_avg_ms": round(1000 * self.wait_total / self.granted, 1) if self.granted else 0.0,
+            "wait_max_ms": round(1000 * self.wait_max, 1),
+        }
@@ -0,0 +1,245 @@
+"""Opt-in recording of received updates for ``python -m bench.replay``.
+
+A server notes each accepted webhook payload with :meth:`UpdateRecorder.arrived`;
+:class:`app.bot.ObservedApplication` times ``process_update`` and hands the
+result to :meth:`UpdateRecorder.finished`, which appends one JSON line::
+
+    {"ts": 1767225600.123, "update_id": 5, "queue_ms": 0.4, "latency_ms": 12.9,
+     "ok": true, "pid": 4242, "update": {...}}
+
+``ts`` is the wall-clock arrival time, ``queue_ms`` arrival → handlers start
+and ``latency_ms`` arrival → handlers done.  Long-polling updates have no
+raw payload; they are recorded from ``Update.to_dict()`` with arrival taken
+as the start of processing.
+
+Each worker process writes its own ``updates-<pid>.jsonl`` in ``RECORD_DIR``,
+rotated at ``RECORD_MAX_BYTES``.  With ``RECORD_REDACT`` (the default) names,
+usernames and phone numbers are replaced, chat and user ids become keyed
+pseudonyms (stable within a recording, so per-chat order survives), email
+addresses become ``user<hash>@example.com`` and other words in text are
+masked letter by letter — except the greetings, dates and times the flow
+itself parses, so a replay walks the same steps.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from telegram import Update
+
+from app.config import (
+    RECORD_BACKUPS,
+    RECORD_DIR,
+    RECORD_MAX_BYTES,
+    RECORD_REDACT,
+    RECORD_SALT,
+    RECORD_UPDATES,
+)
+from app.handlers.flow import FLOW
+
+logger = logging.getLogger(__name__)
+
+# Payloads waiting for their processing to finish; older ones are dropped
+_MAX_PENDING = 10_000
+
+# ── Redaction ─────────────────────────────────────────────────────────────────
+
+_EMAIL = re.compile(r"([\w.+-]+@[\w-]+(?:\.[\w-]+)+)")
+# Dates, times and "in 2h" durations, as typed into the date/schedule steps
+_KEEP_TOKEN = re.compile(r"\d{1,4}[-/.:]\d{1,2}(?:[-/.:]\d{2,4})?|\d{1,3}[hmd]")
+_KEEP_WORDS = frozenset(FLOW.text_commands) | {"in", "/start"}
+_WORD_CHAR = re.compile(r"\w")
+
+# Objects whose "id" is a person or chat
+_PEER_KEYS = frozenset({
+    "from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat", "via_bot",
+})
+_PERSONAL = {
+    "first_name": "User",
+    "last_name": "",
+    "username": "user",
+    "title": "Chat",
+    "phone_number": "",
+    "vcard": "",
+    "bio": "",
+}
+
+
+class Redactor:
+    """Strip personal data from an update payload, keeping its shape."""
+
+    def __init__(self, salt: str = "") -> None:
+        self._key = hashlib.sha256(salt.encode()).digest()
+
+    def _hash(self, value: str, size: int) -> bytes:
+        return hashlib.blake2b(value.encode(), digest_size=size, key=self._key).digest()
+
+    def peer_id(self, value: Any) -> Any:
+        if not isinstance(value, int):
+            return value
+        pseudo = int.from_bytes(self._hash(str(abs(value)), 5), "big") % 10**10 + 1
+        return -pseudo if value < 0 else pseudo
+
+    def email(self, address: str) -> str:
+        return f"user{self._hash(address.lower(), 4).hex()}@example.com"
+
+    def text(self, text: str) -> str:
+        if text.strip().lower() in _KEEP_WORDS:
+            return text
+        return re.sub(r"\S+", self._token, text)
+
+    def _token(self, match: re.Match) -> str:
+        word = match.group()
+        if _KEEP_TOKEN.fullmatch(word) or word.lower() in _KEEP_WORDS:
+            return word
+        # split() with a group alternates: other text, address, other text, …
+        parts = _EMAIL.split(word)
+        return "".join(
+            self.email(part) if index % 2 else _WORD_CHAR.sub("x", part)
+            for index, part in enumerate(parts)
+        )
+
+    def __call__(self, value: Any, parent: str = "") -> Any:
+        if isinstance(value, list):
+            return [self(item, parent) for item in value]
+        if not isinstance(value, dict):
+            return value
+        out = {}
+        for key, item in value.items():
+            if key in _PERSONAL:
+                out[key] = _PERSONAL[key]
+            elif (key == "id" and parent in _PEER_KEYS) or key in ("user_id", "chat_id"):
+                out[key] = self.peer_id(item)
+            elif key in ("text", "caption") and isinstance(item, str):
+                out[key] = self.text(item)
+            elif key == "file_name" and isinstance(item, str):
+                out[key] = "file" + os.path.splitext(item)[1]
+            elif key == "chat_instance":
+                out[key] = self._hash(str(item), 8).hex()
+            else:
+                out[key] = self(item, key)
+        return out
+
+
+# ── Recorder ──────────────────────────────────────────────────────────────────
+
+class UpdateRecorder:
+    """Append received updates with their timings to a rotating JSONL file.
+
+    The file is opened on the first write, so it is created inside the
+    worker process (after fork) and named after that process.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        enabled: bool = True,
+        max_bytes: int = 50 << 20,
+        backups: int = 5,
+        redact: bool = True,
+        salt: str = "",
+    ) -> None:
+        self.directory = directory
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.redactor = Redactor(salt) if redact else None
+
+        self._pending: OrderedDict[int, tuple[float, float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = ""
+        self.recorded = 0
+        self.rotations = 0
+        self.dropped = 0
+
+    def arrived(self, data: dict) -> None:
+        """Note a raw payload accepted by the webhook."""
+        if not self.enabled:
+            return
+        update_id = data.get("update_id")
+        if not isinstance(update_id, int):
+            return
+        with self._lock:
+            self._pending[update_id] = (time.time(), time.perf_counter(), data)
+            if len(self._pending) > _MAX_PENDING:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+
+    def finished(self, update: Update, started: float, ended: float, ok: bool) -> None:
+        """Write the line for *update*; times are ``perf_counter`` values."""
+        with self._lock:
+            entry = self._pending.pop(update.update_id, None)
+        if entry is None:
+            arrived_ts, arrived, data = time.time() - (ended - started), started, update.to_dict()
+        else:
+            arrived_ts, arrived, data = entry
+        line = json.dumps({
+            "ts": round(arrived_ts, 6),
+            "update_id": update.update_id,
+            "queue_ms": round((started - arrived) * 1000, 3),
+            "latency_ms": round((ended - arrived) * 1000, 3),
+            "ok": ok,
+            "pid": os.getpid(),
+            "update": self.redactor(data) if self.redactor else data,
+        }, ensure_ascii=False, separators=(",", ":"))
+        try:
+            self._write(line + "\n")
+        except OSError as exc:
+            logger.error("Could not record update %s: %s", update.update_id, exc)
+
+    def _write(self, line: str) -> None:
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._path = os.path.join(self.directory, f"updates-{os.getpid()}.jsonl")
+                self._file = open(self._path, "a", encoding="utf-8", buffering=1)
+            elif self._file.tell() >= self.max_bytes:
+                self._rotate()
+            self._file.write(line)
+            self.recorded += 1
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self._path}.{index}"):
+                os.replace(f"{self._path}.{index}", f"{self._path}.{index + 1}")
+        if self.backups:
+            os.replace(self._path, f"{self._path}.1")
+        else:
+            os.remove(self._path)
+        self._file = open(self._path, "a", encoding="utf-8", buffering=1)
+        self.rotations += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "recorded": self.recorded,
+                "pending": len(self._pending),
+                "dropped": self.dropped,
+                "rotations": self.rotations,
+                "path": self._path,
+            }
+
+
+recorder = UpdateRecorder(
+    RECORD_DIR,
+    enabled=RECORD_UPDATES,
+    max_bytes=RECORD_MAX_BYTES,
+    backups=RECORD_BACKUPS,
+    redact=RECORD_REDACT,
+    salt=RECORD_SALT,
+)
@@ -0,0 +1,116 @@
+"""Long-lived PTB application driven from a dedicated background event loop."""
+import asyncio
+import atexit
+import logging
+import threading
+
+from telegram.ext import Application
+
+from app.bot import start_application, stop_application
+from app.inline_reply import process_with_inline_reply
+from app.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for pending updates to drain when the worker exits
+SHUTDOWN_TIMEOUT = 30.0
+
+
+class BotRuntime:
+    """Keep one initialized :class:`Application` alive for the whole worker.
+
+    The event loop thread is started lazily on the first submitted update, so
+    it is always created inside the gunicorn worker (after fork).  Updates are
+    handed over with :meth:`submit`, which returns immediately; PTB's own
+    ``update_queue`` fetcher processes them in order on the loop.
+    """
+
+    def __init__(self, application: Application) -> None:
+        self.application = application
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the loop thread and initialize the application (idempotent)."""
+        if self._loop is not None:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=self._run_loop, args=(loop,), name="ptb-runtime", daemon=True
+            )
+            thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._startup(), loop).result()
+            except BaseException:
+                # Leave nothing behind, so the next update starts from scratch
+                self._teardown(loop, thread)
+                raise
+            self._thread = thread
+            self._loop = loop
+            atexit.register(self.stop)
+            logger.info("Bot runtime started")
+
+    def stop(self) -> None:
+        """Stop and shut down the application once, then stop the loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
+            self._teardown(loop, thread)
+
+    def _teardown(self, loop: asyncio.AbstractEventLoop, thread: threading.Thread) -> None:
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(SHUTDOWN_TIMEOUT)
+        except Exception as exc:
+            logger.error("Error while shutting down bot runtime: %s", exc)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(SHUTDOWN_TIMEOUT)
+            loop.close()
+            logger.info("Bot runtime stopped")
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    async def _startup(self) -> None:
+        await start_application(self.application)
+
+    async def _shutdown(self) -> None:
+        await stop_application(self.application)
+
+    # ── Update intake ─────────────────────────────────────────────────────────
+
+    def submit(self, data: dict) -> None:
+        """Queue a raw webhook payload for processing and return at once."""
+        self.start()
+        self._loop.call_soon_threadsafe(self._enqueue, data)
+
+    def submit_inline(self, data: dict) -> dict | None:
+        """Process a raw payload and wait for its inline webhook reply."""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._process_inline(data), self._loop)
+        return future.result()
+
+    async def _process_inline(self, data: dict) -> dict | None:
+        try:
+            update = tracer.decode(data, self.application.bot)
+        except Exception as exc:
+            logger.error("Dropping malformed update: %s", exc)
+            return None
+        return await process_with_inline_reply(self.application, update)
+
+    def _enqueue(self, data: dict) -> None:
+        try:
+            update = tracer.decode(data, self.application.bot)
+        except Exception as exc:
+            logger.error("Dropping malformed update: %s", exc)
+            return
+        self.application.update_queue.put_nowait(update)
@@ -0,0 +1,296 @@
+"""Durable "send later": rendered emails stored with a due time.
+
+:class:`ScheduleStore` is a SQLite table shared by every worker process;
+its ``(status, due_at)`` index is the priority queue.  Each worker's
+:class:`MailScheduler` sleeps until the earliest due time (re-checking every
+``SCHEDULE_POLL_INTERVAL`` seconds for rows added by other workers), claims
+due rows atomically, and hands each one to the outbox under the key
+``sched:<id>`` — so a row fires once even if two workers, or a restart
+between claiming and handing over, race for it.  From there the normal
+dispatcher sends it, retries it and edits the confirmation message.
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import asdict
+from datetime import date, datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+
+from telegram import Bot
+
+from app.config import (
+    SCHEDULE_DB_PATH,
+    TIMEZONE,
+    SCHEDULE_MORNING,
+    SCHEDULE_MAX_DAYS,
+    SCHEDULE_POLL_INTERVAL,
+    SCHEDULE_LEASE,
+)
+from app.dispatch import MailJob, mail_dispatcher
+from app.outbox import outbox
+from app.utils.db import connect
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED = "scheduled"
+FIRING = "firing"
+FIRED = "fired"
+CANCELLED = "cancelled"
+
+TZ = ZoneInfo(TIMEZONE)
+
+_RELATIVE_RE = re.compile(r"in\s+(\d+)\s*(m|min|mins|h|hr|hrs|hours?|d|days?)", re.IGNORECASE)
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{2})")
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+# ── Time parsing ──────────────────────────────────────────────────────────────
+
+def _morning() -> tuple[int, int]:
+    hour, minute = SCHEDULE_MORNING.split(":")
+    return int(hour), int(minute)
+
+
+def parse_date(text: str) -> date | None:
+    """A date in either format the date steps accept."""
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def morning_of(day: date) -> datetime:
+    return datetime.combine(day, dt_time(*_morning()), TZ)
+
+
+def parse_when(text: str, now: datetime | None = None) -> datetime | None:
+    """Parse ``in 2h``, ``HH:MM``, a date, or ``<date> HH:MM`` (in :data:`TZ`)."""
+    now = now or datetime.now(TZ)
+    text = text.strip()
+    if not text:
+        return None
+    match = _RELATIVE_RE.fullmatch(text)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)[0].lower()
+        return now + timedelta(**{{"m": "minutes", "h": "hours", "d": "days"}[unit]: amount})
+
+    day_text, _, time_text = text.rpartition(" ")
+    if not _TIME_RE.fullmatch(time_text):
+        day_text, time_text = text, ""
+    if time_text:
+        hour, minute = map(int, _TIME_RE.fullmatch(time_text).groups())
+        if hour > 23 or minute > 59:
+            return None
+    if day_text:
+        day = parse_date(day_text)
+        if day is None:
+            return None
+        when = morning_of(day)
+        return when.replace(hour=hour, minute=minute) if time_text else when
+    # Just a time: today, or tomorrow once it has passed
+    when = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return when if when > now else when + timedelta(days=1)
+
+
+def check_when(when: datetime, now: datetime | None = None) -> str | None:
+    """Why *when* cannot be scheduled, or ``None`` if it can."""
+    now = now or datetime.now(TZ)
+    if when <= now:
+        return "That time has already passed."
+    if when - now > timedelta(days=SCHEDULE_MAX_DAYS):
+        return f"Emails can be scheduled at most {SCHEDULE_MAX_DAYS} days ahead."
+    return None
+
+
+def format_when(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, TZ).strftime("%a %d %b %Y, %H:%M")
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+
+class ScheduleStore:
+    """SQLite table of scheduled emails shared by all worker processes."""
+
+    def __init__(self, path: str = SCHEDULE_DB_PATH) -> None:
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        # Opened lazily so the file is created inside the worker, after fork
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scheduled ("
+                " id INTEGER PRIMARY KEY,"
+                " idem_key TEXT NOT NULL UNIQUE,"
+                " user_id INTEGER NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " due_at REAL NOT NULL,"
+                " lease_until REAL,"
+                " created_at REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS scheduled_due ON scheduled (status, due_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS scheduled_user ON scheduled (user_id, status)"
+            )
+        return self._conn
+
+    def add(self, key: str, user_id: int, job: MailJob, due_at: float) -> int | None:
+        """Store *job*; return its id, or ``None`` if *key* is already scheduled."""
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO scheduled (idem_key, user_id, payload, status, due_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (idem_key) DO NOTHING",
+                (key, user_id, json.dumps(asdict(job)), SCHEDULED, due_at, time.time()),
+            )
+        return cur.lastrowid if cur.rowcount else None
+
+    def pending(self, user_id: int, limit: int = 10) -> list[dict]:
+        """A user's upcoming emails, soonest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, payload, due_at FROM scheduled WHERE user_id = ? AND status = ?"
+                " ORDER BY due_at LIMIT ?",
+                (user_id, SCHEDULED, limit),
+            ).fetchall()
+        return [{"id": i, "job": json.loads(p), "due_at": due} for i, p, due in rows]
+
+    def cancel(self, user_id: int, schedule_id: int) -> bool:
+        """Cancel one of *user_id*'s emails unless it is already firing."""
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE scheduled SET status = ? WHERE id = ? AND user_id = ? AND status = ?",
+                (CANCELLED, schedule_id, user_id, SCHEDULED),
+            )
+        return cur.rowcount == 1
+
+    def claim_due(self, limit: int = 50) -> list[tuple[int, dict]]:
+        """Atomically take due rows (and crashed firings) for this worker."""
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "UPDATE scheduled SET status = ?, lease_until = ? WHERE id IN ("
+                " SELECT id FROM scheduled WHERE (status = ? AND due_at <= ?)"
+                " OR (status = ? AND lease_until < ?) ORDER BY due_at LIMIT ?)"
+                " RETURNING id, payload",
+                (FIRING, now + SCHEDULE_LEASE, SCHEDULED, now, FIRING, now, limit),
+            ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def mark_fired(self, schedule_id: int) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE scheduled SET status = ?, lease_until = NULL WHERE id = ?",
+                (FIRED, schedule_id),
+            )
+
+    def next_due_at(self) -> float | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT MIN(due_at) FROM scheduled WHERE status = ?", (SCHEDULED,)
+            ).fetchone()
+        return row[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM scheduled GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+
+# ── Scheduler ─────────────────────────────────────────────────────────────────
+
+class MailScheduler:
+    """Per-worker task that moves due rows from the schedule to the outbox.
+
+    Store and outbox calls run in a thread, off the event loop.
+    """
+
+    def __init__(self, store: ScheduleStore) -> None:
+        self.store = store
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self.fired = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def unavailable(self) -> str | None:
+        """Why emails cannot be scheduled in this worker, or ``None`` if they can.
+
+        The task only runs with a long-lived Application (``post_init``);
+        with ``BOT_RUNTIME=per_request`` nothing would ever fire the jobs.
+        """
+        if self.running:
+            return None
+        return "Send Later is not available on this server."
+
+    async def start(self, bot: Bot) -> None:
+        if self._task is not None:
+            return
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="mail-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def schedule(self, key: str, user_id: int, job: MailJob, due_at: float) -> int | None:
+        """Store *job* for *due_at*; ``None`` if this draft is already scheduled."""
+        schedule_id = await asyncio.to_thread(self.store.add, key, user_id, job, due_at)
+        if schedule_id is not None and self._wakeup is not None:
+            self._wakeup.set()   # it may be due before whatever we are sleeping towards
+        return schedule_id
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._fire_due()
+                next_due = await asyncio.to_thread(self.store.next_due_at)
+            except Exception as exc:
+                logger.error("Scheduler tick failed: %s", exc)
+                next_due = None
+            timeout = SCHEDULE_POLL_INTERVAL
+            if next_due is not None:
+                timeout = max(0.05, min(timeout, next_due - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _fire_due(self) -> None:
+        for schedule_id, payload in await asyncio.to_thread(self.store.claim_due):
+            # The outbox key makes the hand-over idempotent across workers and restarts
+            row_id = await asyncio.to_thread(outbox.enqueue, f"sched:{schedule_id}", payload)
+            await asyncio.to_thread(self.store.mark_fired, schedule_id)
+            if row_id is None:
+                continue
+            self.fired += 1
+            logger.info("Scheduled email %d is due", schedule_id)
+            await mail_dispatcher.submit(row_id, self._bot)
+
+    def stats(self) -> dict:
+        return {"running": self.running, "fired": self.fired, **self.store.stats()}
+
+
+# Shared by every handler in this worker process
+scheduler = MailScheduler(ScheduleStore())
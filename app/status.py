@@ -0,0 +1,36 @@
+"""Health snapshot shared by the Flask and ASGI servers."""
+from telegram.ext import Application
+
+from app.boot import boot
+from app.content import content_watcher
+from app.dedup import deduplicator
+from app.dispatch import mail_dispatcher
+from app.lanes import LaneUpdateProcessor
+from app.profiling import profiler
+from app.ratelimit import FloodControlLimiter
+from app.recorder import recorder
+from app.scheduler import scheduler
+from app.tracing import tracer
+from app.transport import InstrumentedRequest
+from app.utils.email_sender import smtp_pool
+
+
+def health_status(application: Application) -> dict:
+    processor = application.update_processor
+    limiter = application.bot.rate_limiter
+    request = application.bot.request
+    return {
+        "status": "ok",
+        "boot": boot.stats(),
+        "smtp_pool": smtp_pool.stats(),
+        "mail_queue": mail_dispatcher.stats(),
+        "scheduled": scheduler.stats(),
+        "dedup": deduplicator.stats(),
+        "content": content_watcher.stats(),
+        "lanes": processor.stats() if isinstance(processor, LaneUpdateProcessor) else None,
+        "bot_api_pool": request.stats() if isinstance(request, InstrumentedRequest) else None,
+        "flood_control": limiter.stats() if isinstance(limiter, FloodControlLimiter) else None,
+        "recorder": recorder.stats() if recorder.enabled else None,
+        "tracing": tracer.stats(),
+        "profiler": profiler.stats(),
+    }
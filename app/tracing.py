@@ -0,0 +1,330 @@
+"""Per-update trace spans, exported as JSON log lines or an OTLP/JSON file.
+
+``TRACE_SAMPLE`` percent of updates get a trace: a root ``update`` span
+from decoding to the end of ``process_update``, with children for
+``de_json``, the handler step, ``build_preview``, every Bot API request,
+the time an email waits in the mail queue, and each SMTP phase.  A trace is
+exported once all of its spans have ended — emails are often sent after the
+update itself is done.  A span that starts after that (work the update left
+running in a task of its own) goes out as a later record with the same
+trace id.
+
+The active span lives in a context variable, so it follows the update across
+``await`` and ``create_task``; :func:`bind` carries it into executor threads
+and the mail queue carries it by hand.  With no active trace :func:`span`
+is a context-variable lookup returning a shared no-op object.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Iterator
+
+from telegram import Bot, Update
+
+from app.config import TRACE_EXPORT, TRACE_FILE, TRACE_SAMPLE
+from app.metrics import DE_JSON_SECONDS
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("app.trace")
+
+SERVICE_NAME = "email-telegram-bot"
+
+# Decoded updates waiting for process_update; older ones are dropped
+_MAX_PENDING = 10_000
+
+# Span kinds, as numbered by OTLP
+_INTERNAL, _CLIENT = 1, 3
+
+_current: ContextVar["Span | None"] = ContextVar("trace_span", default=None)
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "open", "_lock")
+
+    def __init__(self) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+        self.open = 0
+        self._lock = threading.Lock()
+
+
+class Span:
+    """One timed operation; ``with span:`` also makes it the current span."""
+
+    __slots__ = ("trace", "parent", "name", "kind", "span_id", "start_ns", "end_ns",
+                 "attrs", "error", "_token")
+
+    def __init__(self, trace: Trace, parent: "Span | None", name: str, kind: int, attrs: dict):
+        self.trace = trace
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.attrs = attrs
+        self.error: str | None = None
+        self.end_ns = 0
+        with trace._lock:
+            trace.open += 1
+        self.start_ns = time.time_ns()
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def end(self, error: BaseException | None = None) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        trace = self.trace
+        with trace._lock:
+            trace.spans.append(self)
+            trace.open -= 1
+            done = trace.open == 0
+        if done:
+            tracer.export(trace)
+
+    @contextmanager
+    def activate(self) -> Iterator["Span"]:
+        """Make this span current for the block without ending it."""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current.reset(self._token)
+        self.end(exc)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def end(self, error: BaseException | None = None) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def current() -> Span | None:
+    return _current.get()
+
+
+def span(name: str, *, client: bool = False, **attrs: Any) -> Span | _NoopSpan:
+    """A child of the current span, or :data:`NOOP` outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        return NOOP
+    return Span(parent.trace, parent, name, _CLIENT if client else _INTERNAL, attrs)
+
+
+def start_span(name: str, **attrs: Any) -> Span | None:
+    """Like :func:`span` but not made current — for spans ended elsewhere."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, parent, name, _INTERNAL, attrs)
+
+
+def traced(name: str) -> Callable:
+    """Decorator: run a sync function in a span when inside a trace."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn: Callable) -> Callable:
+    """*fn*, run in the current context when a trace is active (for executors)."""
+    if _current.get() is None:
+        return fn
+    return functools.partial(copy_context().run, fn)
+
+
+# ── Tracer ────────────────────────────────────────────────────────────────────
+
+def _update_kind(update: Update) -> str:
+    for kind in ("callback_query", "message", "edited_message"):
+        if getattr(update, kind, None) is not None:
+            return kind
+    return "other"
+
+
+class Tracer:
+    """Sampling decisions and export for this worker process."""
+
+    def __init__(self, sample: float = 0.0, export: str = "log", path: str = "") -> None:
+        self.sample = sample
+        self.exporter = export
+        self.path = path
+        self._pending: OrderedDict[int, Span] = OrderedDict()
+        self._lock = threading.Lock()
+        self._fd: int | None = None
+        self.traces = 0
+        self.exported = 0
+
+    def _sampled(self) -> bool:
+        return self.sample > 0 and random.random() * 100 < self.sample
+
+    def _root(self) -> Span:
+        self.traces += 1
+        return Span(Trace(), None, "update", _INTERNAL, {})
+
+    def decode(self, data: dict, bot: Bot) -> Update:
+        """``Update.de_json`` (timed), starting a trace if this update is sampled."""
+        if not self._sampled():
+            with DE_JSON_SECONDS.time():
+                return Update.de_json(data, bot)
+        root = self._root()
+        try:
+            with root.activate(), span("de_json"), DE_JSON_SECONDS.time():
+                update = Update.de_json(data, bot)
+        except Exception as exc:
+            root.end(exc)
+            raise
+        root.set(update_id=update.update_id)
+        with self._lock:
+            self._pending[update.update_id] = root
+            if len(self._pending) > _MAX_PENDING:
+                self._pending.popitem(last=False)[1].end()
+        return update
+
+    def begin(self, update: object) -> Span | None:
+        """The root span for *update* — from :meth:`decode`, or newly sampled."""
+        if not isinstance(update, Update):
+            return None
+        root = None
+        if self._pending:
+            with self._lock:
+                root = self._pending.pop(update.update_id, None)
+        if root is None:
+            if not self._sampled():
+                return None
+            root = self._root()
+            root.set(update_id=update.update_id)
+        root.set(kind=_update_kind(update))
+        return root
+
+    # ── Export ────────────────────────────────────────────────────────────────
+
+    def export(self, trace: Trace) -> None:
+        try:
+            if self.exporter == "otlp":
+                self._write(json.dumps(_otlp(trace), separators=(",", ":")) + "\n")
+            else:
+                trace_logger.info(json.dumps(_summary(trace), separators=(",", ":")))
+            self.exported += 1
+        except Exception as exc:
+            logger.error("Could not export trace %s: %s", trace.trace_id, exc)
+
+    def _write(self, line: str) -> None:
+        # One O_APPEND write per trace, so workers sharing the file never interleave
+        if self._fd is None:
+            with self._lock:
+                if self._fd is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, line.encode())
+
+    def stats(self) -> dict:
+        return {
+            "sample_percent": self.sample,
+            "exporter": self.exporter,
+            "traces": self.traces,
+            "exported": self.exported,
+            "pending": len(self._pending),
+        }
+
+
+def _summary(trace: Trace) -> dict:
+    spans = sorted(trace.spans, key=lambda s: s.start_ns)
+    origin = spans[0].start_ns
+    root = next((s for s in spans if s.parent is None), spans[0])
+    return {
+        "trace_id": trace.trace_id,
+        "duration_ms": round((root.end_ns - root.start_ns) / 1e6, 3),
+        **root.attrs,
+        "spans": [
+            {
+                "name": s.name,
+                "id": s.span_id,
+                "parent": s.parent.span_id if s.parent else None,
+                "start_ms": round((s.start_ns - origin) / 1e6, 3),
+                "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 3),
+                **({"error": s.error} if s.error else {}),
+                **s.attrs,
+            }
+            for s in spans
+        ],
+    }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attrs(attrs: dict) -> list[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()]
+
+
+def _otlp(trace: Trace) -> dict:
+    """One ``ExportTraceServiceRequest`` in OTLP/JSON, as the collector's file exporter writes."""
+    spans = []
+    for s in trace.spans:
+        item = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent.span_id if s.parent else "",
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": _otlp_attrs(s.attrs),
+        }
+        if s.error:
+            item["status"] = {"code": 2, "message": s.error}
+        spans.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attrs({
+            "service.name": SERVICE_NAME, "process.pid": os.getpid(),
+        })},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+tracer = Tracer(TRACE_SAMPLE, TRACE_EXPORT, TRACE_FILE)
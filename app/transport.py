@@ -0,0 +1,167 @@
+"""Configurable, instrumented HTTP transport for Bot API calls.
+
+:class:`InstrumentedRequest` is PTB's :class:`HTTPXRequest` with the pool
+size, keep-alive and HTTP/2 settings from :mod:`app.config`, and an httpx
+transport that records, per request, how long it waited for a connection
+and whether it had to open a new one.  Timing comes from httpcore's
+``trace`` extension, so nothing in httpx itself is patched.
+"""
+import functools
+import ssl
+import time
+from typing import Any
+
+import httpx
+from telegram.request import HTTPXRequest
+
+from app.config import (
+    BOT_API_POOL_SIZE,
+    BOT_API_KEEPALIVE,
+    BOT_API_KEEPALIVE_EXPIRY,
+    BOT_API_HTTP2,
+    BOT_API_CONNECT_TIMEOUT,
+    BOT_API_READ_TIMEOUT,
+    BOT_API_WRITE_TIMEOUT,
+    BOT_API_POOL_TIMEOUT,
+)
+from app.metrics import BOT_API_ERRORS, BOT_API_SECONDS
+from app.tracing import span
+
+# First trace events of a request once it holds a connection
+_ON_CONNECTION = ("connection.connect_tcp.started", "http11.send_request_headers.started",
+                  "http2.send_request_headers.started")
+
+
+@functools.cache
+def ssl_context(http2: bool) -> ssl.SSLContext:
+    """A verifying SSL context shared by every client this process builds.
+
+    Loading the CA bundle takes ~40 ms, and httpx does it for each client —
+    PTB builds a new one whenever the Application is re-initialized, i.e.
+    every update with ``BOT_RUNTIME=per_request``.  One per HTTP version,
+    since httpcore sets the ALPN protocols on the context it connects with.
+    """
+    return httpx.create_ssl_context()
+
+
+class PoolMetrics:
+    """Counters shared by every transport one :class:`InstrumentedRequest` builds."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.in_flight = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.errors = 0
+
+    def record(self, waited: float, new_connection: bool) -> None:
+        self.requests += 1
+        self.new_connections += new_connection
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        seen: dict[str, float | bool] = {"new": False}
+
+        async def trace(name: str, info: dict) -> None:
+            if name == "connection.connect_tcp.started":
+                seen["new"] = True
+            if "connected" not in seen and name in _ON_CONNECTION:
+                seen["connected"] = time.perf_counter()
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.metrics.in_flight += 1
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        finally:
+            self.metrics.in_flight -= 1
+        waited = seen.get("connected", started) - started
+        self.metrics.record(waited, bool(seen["new"]))
+        return response
+
+    def connections(self) -> tuple[int, int]:
+        """``(open, idle)`` connections in the pool right now."""
+        pool = getattr(self, "_pool", None)
+        conns = list(getattr(pool, "connections", ()))
+        return len(conns), sum(1 for c in conns if c.is_idle())
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """:class:`HTTPXRequest` with tunable keep-alive and pool statistics."""
+
+    def __init__(
+        self,
+        pool_size: int = BOT_API_POOL_SIZE,
+        keepalive: int = BOT_API_KEEPALIVE,
+        keepalive_expiry: float = BOT_API_KEEPALIVE_EXPIRY,
+        http2: bool = BOT_API_HTTP2,
+        connect_timeout: float = BOT_API_CONNECT_TIMEOUT,
+        read_timeout: float = BOT_API_READ_TIMEOUT,
+        write_timeout: float = BOT_API_WRITE_TIMEOUT,
+        pool_timeout: float = BOT_API_POOL_TIMEOUT,
+    ) -> None:
+        self.metrics = PoolMetrics()
+        self._limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=min(keepalive, pool_size),
+            keepalive_expiry=keepalive_expiry,
+        )
+        # A custom transport ignores the client's limits/http2 arguments, so it
+        # gets them itself.  Every client PTB rebuilds after shutdown() reuses
+        # it: closing it only empties its connection pool.
+        self.transport = _InstrumentedTransport(
+            self.metrics,
+            verify=ssl_context(http2),
+            limits=self._limits,
+            http1=not http2,
+            http2=http2,
+        )
+        super().__init__(
+            connection_pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            pool_timeout=pool_timeout,
+            http_version="2" if http2 else "1.1",
+            httpx_kwargs={"transport": self.transport},
+        )
+
+    async def do_request(self, url: str, method: str, *args: Any, **kwargs: Any):
+        endpoint = url.rsplit("/", 1)[-1]   # never the token-bearing path
+        try:
+            with (
+                BOT_API_SECONDS.labels(endpoint).time(),
+                span("bot_api", client=True, method=endpoint),
+            ):
+                return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            BOT_API_ERRORS.labels(endpoint).inc()
+            raise
+
+    def stats(self) -> dict:
+        m = self.metrics
+        open_, idle = self.transport.connections()
+        return {
+            "http_version": self.http_version,
+            "max_connections": self._limits.max_connections,
+            "open_connections": open_,
+            "idle_connections": idle,
+            "in_flight": m.in_flight,
+            "requests": m.requests,
+            "new_connections": m.new_connections,
+            "reuse_ratio": round(1 - m.new_connections / m.requests, 3) if m.requests else None,
+            "pool_wait_avg_ms": round(1000 * m.wait_total / m.requests, 2) if m.requests else 0.0,
+            "pool_wait_max_ms": round(1000 * m.wait_max, 2),
+            "errors": m.errors,
+        }
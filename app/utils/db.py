@@ -0,0 +1,26 @@
+"""Shared SQLite connection setup for the on-disk stores."""
+import os
+import sqlite3
+
+# Seconds a writer waits for another process to release the database lock
+BUSY_TIMEOUT = 5.0
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open *path* in WAL mode so several gunicorn workers can share it.
+
+    The connection runs in autocommit mode; callers open explicit
+    ``BEGIN``/``COMMIT`` blocks when they batch writes.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT,
+        isolation_level=None,
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -1,9 +1,209 @@
 """SMTP email sending utility."""
+import base64
+import logging
+import re
 import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from email.policy import compat32
+from typing import BinaryIO, Iterable, Iterator
 
-from app.config import EMAIL_ADDRESS, EMAIL_PASSWORD
+from app.config import (
+    EMAIL_ADDRESS,
+    EMAIL_PASSWORD,
+    SMTP_HOST,
+    SMTP_PORT,
+    SMTP_STARTTLS,
+    SMTP_POOL_SIZE,
+    SMTP_MAX_IDLE,
+    SMTP_TIMEOUT,
+)
+from app.metrics import SMTP_SECONDS
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Raw bytes per base64 read: 57 bytes make one 76-character line
+_B64_CHUNK = 57 * 1024
+# How much is handed to the socket at once while streaming DATA
+_SEND_BUFFER = 64 * 1024
+
+
+class SMTPPool:
+    """Keep authenticated SMTP sessions open and hand them out one at a time.
+
+    At most ``max_size`` sessions exist at once; callers beyond that block
+    until one is released.  An idle session is checked with ``NOOP`` before
+    reuse and discarded when it fails or has been idle longer than
+    ``max_idle`` seconds (providers silently drop long-idle connections).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = "",
+        password: str = "",
+        *,
+        starttls: bool = True,
+        max_size: int = 4,
+        max_idle: float = 60.0,
+        timeout: float = 30.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: deque[tuple[smtplib.SMTP, float]] = deque()
+        self._stats = {
+            "connects": 0,
+            "reuses": 0,
+            "discarded_stale": 0,
+            "discarded_broken": 0,
+            "in_use": 0,
+            "wait_seconds": 0.0,
+        }
+
+    # ── Session management ───────────────────────────────────────────────────
+
+    def _connect(self) -> smtplib.SMTP:
+        with SMTP_SECONDS.labels("connect").time(), span("smtp.connect", client=True):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                with SMTP_SECONDS.labels("starttls").time(), span("smtp.starttls", client=True):
+                    server.starttls()
+                    server.ehlo()
+            if self.password:
+                with SMTP_SECONDS.labels("login").time(), span("smtp.login", client=True):
+                    server.login(self.username, self.password)
+        except Exception:
+            self._close_quietly(server)
+            raise
+        with self._lock:
+            self._stats["connects"] += 1
+        return server
+
+    @staticmethod
+    def _close_quietly(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _take_idle(self) -> smtplib.SMTP | None:
+        """Pop the most recently used healthy session, discarding dead ones."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                server, last_used = self._idle.pop()
+            if time.monotonic() - last_used > self.max_idle:
+                self._discard(server, "discarded_stale")
+                continue
+            try:
+                with SMTP_SECONDS.labels("noop").time(), span("smtp.noop", client=True):
+                    code, _ = server.noop()
+            except (smtplib.SMTPException, OSError):
+                code = -1
+            if code == 250:
+                with self._lock:
+                    self._stats["reuses"] += 1
+                return server
+            self._discard(server, "discarded_stale")
+
+    @staticmethod
+    def _is_broken(server: smtplib.SMTP, exc: BaseException) -> bool:
+        """Whether *exc* left *server* unusable, rather than rejecting one message.
+
+        ``SMTPException`` subclasses ``OSError``, so a reply error (a refused
+        recipient, a 5xx to DATA) must not be mistaken for a socket error.
+        """
+        if server.sock is None:
+            return True   # closed by smtplib (a 421 reply) or mid-message
+        if isinstance(exc, smtplib.SMTPServerDisconnected):
+            return True
+        return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+    def _discard(self, server: smtplib.SMTP, reason: str) -> None:
+        self._close_quietly(server)
+        with self._lock:
+            self._stats[reason] += 1
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """Borrow an authenticated session for the duration of the block.
+
+        If the block raises a connection-level error the session is closed
+        instead of being returned to the pool; after an SMTP reply error
+        (already reset by ``RSET``) it is reused.
+        """
+        started = time.monotonic()
+        self._slots.acquire()
+        with self._lock:
+            self._stats["wait_seconds"] += time.monotonic() - started
+            self._stats["in_use"] += 1
+        server = None
+        try:
+            server = self._take_idle() or self._connect()
+            yield server
+        except BaseException as exc:
+            if server is not None and self._is_broken(server, exc):
+                self._discard(server, "discarded_broken")
+                server = None
+            raise
+        finally:
+            if server is not None:
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    def close(self) -> None:
+        """Close every idle session."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for server, _ in idle:
+            self._close_quietly(server)
+
+    def stats(self) -> dict:
+        """Return a snapshot of pool counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["idle"] = len(self._idle)
+        snapshot["max_size"] = self.max_size
+        return snapshot
+
+
+# Shared by every send in this worker process
+smtp_pool = SMTPPool(
+    SMTP_HOST,
+    SMTP_PORT,
+    EMAIL_ADDRESS,
+    EMAIL_PASSWORD,
+    starttls=SMTP_STARTTLS,
+    max_size=SMTP_POOL_SIZE,
+    max_idle=SMTP_MAX_IDLE,
+    timeout=SMTP_TIMEOUT,
+)
 
 
 def send_email(
@@ -11,8 +211,15 @@ def send_email(
     subject: str,
     body: str,
     cc_list: list[str] | None = None,
+    attachments: list[tuple[str, str, BinaryIO]] | None = None,
+    html: str | None = None,
 ) -> None:
-    """Send a plain-text email via Gmail SMTP.
+    """Send a plain-text email over a pooled SMTP session.
+
+    *attachments* are ``(filename, mime type, file)`` tuples; each file is
+    base64-encoded while it is written to the socket rather than held in
+    memory as part of the message.  With *html* the body becomes a
+    ``multipart/alternative`` of the plain text and that HTML.
 
     Raises:
         Exception: propagates any SMTP / auth error to the caller.
@@ -27,10 +234,105 @@ def send_email(
     if cc_list:
         msg["Cc"] = ", ".join(cc_list)
 
-    msg.attach(MIMEText(body, "plain"))
+    if html is None:
+        msg.attach(MIMEText(body, "plain"))
+    else:
+        alternative = MIMEMultipart("alternative")
+        alternative.attach(MIMEText(body, "plain"))
+        alternative.attach(MIMEText(html, "html"))
+        msg.attach(alternative)
+
+    recipients = [receiver] + cc_list
+    if not attachments:
+        with smtp_pool.connection() as server:
+            with SMTP_SECONDS.labels("send").time(), span("smtp.send", client=True):
+                server.sendmail(EMAIL_ADDRESS, recipients, msg.as_string())
+        return
+
+    chunks = _streamed_message(msg, attachments)
+    with smtp_pool.connection() as server:
+        with SMTP_SECONDS.labels("send").time(), span("smtp.send", client=True):
+            _sendmail_streamed(server, EMAIL_ADDRESS, recipients, chunks)
+
+
+# ── Streamed messages ────────────────────────────────────────────────────────
+
+def _streamed_message(
+    msg: MIMEMultipart, attachments: list[tuple[str, str, BinaryIO]]
+) -> Iterator[bytes]:
+    """The DATA payload of *msg* plus *attachments*, CRLF and dot-stuffed.
 
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        recipients = [receiver] + cc_list
-        server.sendmail(EMAIL_ADDRESS, recipients, msg.as_string())
+    The MIME structure is rendered once with a placeholder per attachment;
+    the placeholders are then swapped for each file's base64, read a chunk
+    at a time.
+    """
+    placeholders = []
+    for i, (name, mime, _) in enumerate(attachments):
+        maintype, _, subtype = mime.partition("/")
+        part = MIMEBase(maintype or "application", subtype or "octet-stream")
+        part.add_header("Content-Disposition", "attachment", filename=name)
+        part["Content-Transfer-Encoding"] = "base64"
+        placeholder = f"attachment-{uuid.uuid4().hex}-{i}"
+        # Newline-terminated like encodebytes() output, so the blank line
+        # before the next boundary matches what sendmail() would send
+        part.set_payload(placeholder + "\n")
+        placeholders.append(placeholder.encode() + b"\r\n")
+        msg.attach(part)
+
+    skeleton = msg.as_bytes(policy=compat32.clone(linesep="\r\n"))
+    # As smtplib does for sendmail(): bare CR / LF become CRLF, leading dots double
+    skeleton = re.sub(rb"(?:\r\n|\n|\r(?!\n))", b"\r\n", skeleton)
+    skeleton = re.sub(rb"(?m)^\.", b"..", skeleton)
+
+    for placeholder, (_, _, file) in zip(placeholders, attachments):
+        head, skeleton = skeleton.split(placeholder, 1)
+        yield head
+        while block := file.read(_B64_CHUNK):
+            yield base64.encodebytes(block).replace(b"\n", b"\r\n")
+    yield skeleton
+
+
+def _sendmail_streamed(
+    server: smtplib.SMTP, sender: str, recipients: list[str], chunks: Iterable[bytes]
+) -> None:
+    """``SMTP.sendmail`` for a message produced piece by piece.
+
+    *chunks* must already be CRLF-terminated and dot-stuffed.  As with
+    ``sendmail`` a refused sender raises, and so do refused recipients only
+    when all of them are refused.
+    """
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(sender)
+    if code != 250:
+        server._rset()
+        raise smtplib.SMTPSenderRefused(code, resp, sender)
+    refused = {}
+    for recipient in recipients:
+        code, resp = server.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, resp)
+    if len(refused) == len(recipients):
+        server._rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, resp = server.docmd("data")
+    if code != 354:
+        server._rset()
+        raise smtplib.SMTPDataError(code, resp)
+    try:
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= _SEND_BUFFER:
+                server.send(bytes(buffer))
+                buffer.clear()
+        if not buffer.endswith(b"\r\n"):
+            buffer += b"\r\n"
+        server.send(bytes(buffer) + b".\r\n")
+        code, resp = server.getreply()
+    except BaseException:
+        # Half a message is on the wire; the session cannot be reused
+        server.close()
+        raise
+    if code != 250:
+        server._rset()
+        raise smtplib.SMTPDataError(code, resp)
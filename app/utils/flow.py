@@ -0,0 +1,178 @@
+"""Compile a declarative conversation flow into a dict / prefix-trie router.
+
+A flow is plain data: the keyboards the bot can show (and the callback ids
+on them), the step that handles each callback id or ``prefix*``, and the
+step that handles free text in each ``waiting_for`` state.  Every step
+declares which keyboards it may show and which text states it may set, so
+the whole graph can be checked once at startup.
+"""
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Iterable
+
+from telegram import InlineKeyboardMarkup
+
+# Suffix that marks a callback key as a prefix route, e.g. "group_*"
+PREFIX_MARK = "*"
+
+
+class FlowError(ValueError):
+    """Raised at startup when the flow definition is inconsistent."""
+
+
+@dataclass(frozen=True)
+class Step:
+    """One node of the flow: a handler plus the edges it may take."""
+
+    handler: Callable[..., Any]
+    shows: tuple[str, ...] = ()
+    awaits: tuple[str, ...] = ()
+    name: str = ""
+
+
+@dataclass(frozen=True)
+class Flow:
+    """The complete flow definition.
+
+    ``keyboards`` maps a name to a zero-argument callable returning one or
+    more :class:`InlineKeyboardMarkup` (all variants the name covers).
+    ``entry`` lists the keyboards shown without any prior step (/start).
+    """
+
+    entry: tuple[str, ...]
+    keyboards: dict[str, Callable[[], InlineKeyboardMarkup | Iterable[InlineKeyboardMarkup]]]
+    callbacks: dict[str, Step]
+    text_states: dict[str, Step]
+    text_commands: dict[str, Step] = field(default_factory=dict)
+    fallback_text: Step | None = None
+
+
+def callback_ids(markups: InlineKeyboardMarkup | Iterable[InlineKeyboardMarkup]) -> set[str]:
+    """All ``callback_data`` values on one or several keyboards."""
+    if isinstance(markups, InlineKeyboardMarkup):
+        markups = (markups,)
+    return {
+        button.callback_data
+        for markup in markups
+        for row in markup.inline_keyboard
+        for button in row
+        if button.callback_data is not None
+    }
+
+
+class _PrefixTrie:
+    """Longest-prefix lookup whose cost depends on key length, not route count."""
+
+    def __init__(self) -> None:
+        self._root: dict = {}
+
+    def add(self, prefix: str, value: Step) -> None:
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = value
+
+    def match(self, key: str) -> tuple[Step, str] | None:
+        node, best = self._root, None
+        for index, char in enumerate(key):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                best = (node[None], key[index + 1:])
+        return best
+
+
+class FlowRouter:
+    """Validated, compiled form of a :class:`Flow`."""
+
+    def __init__(self, flow: Flow) -> None:
+        self.flow = flow
+        self._exact: dict[str, Step] = {}
+        self._prefix_steps: dict[str, Step] = {}
+        self._prefixes = _PrefixTrie()
+        for key, step in flow.callbacks.items():
+            step = replace(step, name=key)
+            if key.endswith(PREFIX_MARK):
+                self._prefix_steps[key] = step
+                self._prefixes.add(key[:-len(PREFIX_MARK)], step)
+            else:
+                self._exact[key] = step
+        self._text = {state: replace(step, name=state) for state, step in flow.text_states.items()}
+        self._commands = {
+            text: replace(step, name=text) for text, step in flow.text_commands.items()
+        }
+        self._fallback = (
+            replace(flow.fallback_text, name="fallback") if flow.fallback_text else None
+        )
+        self.validate()
+
+    # ── Dispatch ─────────────────────────────────────────────────────────────
+
+    def callback(self, data: str) -> tuple[Step, str] | None:
+        """Return ``(step, argument)`` for a callback id, or ``None``."""
+        step = self._exact.get(data)
+        if step is not None:
+            return step, ""
+        return self._prefixes.match(data)
+
+    def text(self, state: str | None, text: str) -> Step | None:
+        """Return the step for free text typed while in *state*."""
+        command = self._commands.get(text.lower().strip())
+        if command is not None:
+            return command
+        step = self._text.get(state) if state else None
+        return step or self._fallback
+
+    # ── Validation ───────────────────────────────────────────────────────────
+
+    def validate(self) -> None:
+        """Reject dangling callback ids, unknown targets and unreachable steps."""
+        flow = self.flow
+        problems: list[str] = []
+
+        buttons = {name: callback_ids(build()) for name, build in flow.keyboards.items()}
+        for name, ids in buttons.items():
+            problems += [f"keyboard {name!r}: callback {data!r} has no route"
+                         for data in sorted(ids) if self.callback(data) is None]
+
+        steps = {
+            **{f"callback {k!r}": s for k, s in self._exact.items()},
+            **{f"callback {k!r}": s for k, s in self._prefix_steps.items()},
+            **{f"text state {k!r}": s for k, s in self._text.items()},
+            **{f"text command {k!r}": s for k, s in self._commands.items()},
+        }
+        if self._fallback is not None:
+            steps["fallback text"] = self._fallback
+        for label, step in steps.items():
+            problems += [f"{label}: shows unknown keyboard {k!r}"
+                         for k in step.shows if k not in flow.keyboards]
+            problems += [f"{label}: awaits unknown text state {s!r}"
+                         for s in step.awaits if s not in self._text]
+        problems += [f"entry: unknown keyboard {k!r}" for k in flow.entry if k not in buttons]
+
+        # Walk the graph from the entry keyboards and the always-available text steps
+        seen_keyboards: set[str] = set()
+        seen_steps: set[int] = set()
+        keyboards = [k for k in flow.entry if k in buttons]
+        queue = list(self._commands.values()) + [self._fallback] * bool(self._fallback)
+        while keyboards or queue:
+            if keyboards:
+                name = keyboards.pop()
+                if name not in seen_keyboards:
+                    seen_keyboards.add(name)
+                    queue += [route[0] for route in map(self.callback, buttons[name]) if route]
+                continue
+            step = queue.pop()
+            if id(step) in seen_steps:
+                continue
+            seen_steps.add(id(step))
+            keyboards += [k for k in step.shows if k in buttons]
+            queue += [self._text[s] for s in step.awaits if s in self._text]
+
+        problems += [f"keyboard {name!r} is never shown"
+                     for name in flow.keyboards if name not in seen_keyboards]
+        problems += [f"{label} is unreachable"
+                     for label, step in steps.items() if id(step) not in seen_steps]
+
+        if problems:
+            raise FlowError("Invalid conversation flow:\n  " + "\n  ".join(problems))
@@ -0,0 +1,99 @@
+"""Compile HTML email templates once and render them by substitution.
+
+A template is an HTML document with ``{{name}}`` variables (see
+``HTML_TEMPLATES`` in :mod:`app.config`).  Each one is split into literal
+HTML and variable slots the first time it is used under a config version and
+cached by template id; rendering an email then only escapes its values and
+joins the pieces.  An unknown variable, or a template without ``{{body}}``,
+raises :class:`TemplateError` at compile time.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from html import escape
+
+from app import config
+from app.config import EMAIL_ADDRESS, EMAIL_HTML_TEMPLATE
+from app.tracing import traced
+from app.utils.preset_builder import TemplateError
+
+logger = logging.getLogger(__name__)
+
+# re.split with one group: literal HTML at even indices, variable names at odd
+_VARIABLE_RE = re.compile(r"\{\{\s*([a-z_]+)\s*\}\}")
+_PARAGRAPH_RE = re.compile(r"\n[ \t]*\n\s*")
+
+VARIABLES = frozenset({"body", "subject", "sender"})
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    key: str
+    segments: tuple[str, ...]
+
+    def render(self, values: dict[str, str]) -> str:
+        parts = list(self.segments)
+        parts[1::2] = [values[name] for name in self.segments[1::2]]
+        return "".join(parts)
+
+
+def compile_template(key: str, source: str) -> CompiledTemplate:
+    segments = tuple(_VARIABLE_RE.split(source))
+    names = set(segments[1::2])
+    unknown = names - VARIABLES
+    if unknown:
+        raise TemplateError(f"HTML template {key!r}: unknown variables {sorted(unknown)}")
+    if "body" not in names:
+        raise TemplateError(f"HTML template {key!r} has no {{{{body}}}}")
+    return CompiledTemplate(key, segments)
+
+
+def compile_templates(templates: dict) -> dict[str, CompiledTemplate]:
+    return {key: compile_template(key, source) for key, source in templates.items()}
+
+
+compile_templates(config.HTML_TEMPLATES)   # fail fast at startup
+
+_cache: dict[str, tuple[int, CompiledTemplate]] = {}
+
+
+def get_template(key: str) -> CompiledTemplate | None:
+    """The compiled template *key*, recompiled only when the config version changes."""
+    version = config.config_version()
+    hit = _cache.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    source = config.HTML_TEMPLATES.get(key)
+    if source is None:
+        return None
+    compiled = compile_template(key, source)
+    _cache[key] = (version, compiled)
+    return compiled
+
+
+def template_for(user_data: dict) -> str:
+    """The template id for the draft in *user_data*: its preset's, else the default."""
+    preset = config.PRESET_MESSAGES.get(user_data.get("selected_preset") or "", {})
+    return preset.get("html_template", EMAIL_HTML_TEMPLATE)
+
+
+def body_html(body: str) -> str:
+    """Plain text as HTML: escaped, blank lines between paragraphs, line breaks kept."""
+    paragraphs = _PARAGRAPH_RE.split(escape(body).strip("\n"))
+    return "\n".join("<p>" + p.replace("\n", "<br>\n") + "</p>" for p in paragraphs if p)
+
+
+@traced("render_html")
+def render_html(key: str, subject: str, body: str) -> str | None:
+    """The HTML version of an email, or ``None`` to send plain text only."""
+    if not key:
+        return None
+    template = get_template(key)
+    if template is None:
+        logger.warning("HTML template %r not found; sending plain text", key)
+        return None
+    return template.render({
+        "body": body_html(body),
+        "subject": escape(subject),
+        "sender": escape(EMAIL_ADDRESS),
+    })
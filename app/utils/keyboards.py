@@ -1,84 +1,222 @@
-"""Reusable inline keyboard builders."""
+"""Reusable inline keyboards.
+
+Static keyboards are built once at import and shared (PTB markups are
+immutable).  Keyboards derived from config (groups, presets) are cached per
+config version and rebuilt only after :func:`app.config.bump_config_version`.
+Every keyboard's serialized Bot API form is kept alongside it and sent in
+its place (see :func:`serialized`).
+"""
+import json
+from typing import Callable
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from app import config
+
+# id(markup) -> (markup, its JSON); holding the markup keeps the id from being reused
+_serialized: dict[int, tuple[InlineKeyboardMarkup, str]] = {}
+_dynamic: dict[str, tuple[int, InlineKeyboardMarkup]] = {}
+
+
+def _register(markup: InlineKeyboardMarkup) -> InlineKeyboardMarkup:
+    _serialized[id(markup)] = (markup, json.dumps(markup.to_dict()))
+    return markup
+
+
+def _static(rows: list[list[InlineKeyboardButton]]) -> InlineKeyboardMarkup:
+    return _register(InlineKeyboardMarkup(rows))
+
+
+def _cached(name: str, build: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+    version = config.config_version()
+    hit = _dynamic.get(name)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    if hit is not None:
+        _serialized.pop(id(hit[1]), None)
+    markup = _register(build())
+    _dynamic[name] = (version, markup)
+    return markup
+
+
+def serialized(markup: object) -> str | None:
+    """Bot API JSON of *markup* if it is a prebuilt or cached keyboard.
+
+    PTB sends a string ``reply_markup`` as is, so this skips ``to_dict()``
+    and ``json.dumps`` on every send of a shared keyboard.
+    """
+    hit = _serialized.get(id(markup))
+    return hit[1] if hit is not None and hit[0] is markup else None
+
+
+# ── Static keyboards ──────────────────────────────────────────────────────────
+
+_HOME = _static([
+    [InlineKeyboardButton("📧 Send Email", callback_data="send_email")],
+    [InlineKeyboardButton("📨 Bulk Send", callback_data="bulk_send")],
+    [InlineKeyboardButton("⏰ Scheduled Emails", callback_data="scheduled_list")],
+    [InlineKeyboardButton("❓ Help", callback_data="help")],
+])
+
+_RECIPIENT_TYPE = _static([
+    [InlineKeyboardButton("👥 Select Group", callback_data="select_group")],
+    [InlineKeyboardButton("✏️ Manual Entry", callback_data="manual_entry")],
+])
+
+_CC_OPTIONS_WITH_CC = _static([
+    [InlineKeyboardButton("➕ Add More CC", callback_data="add_more_cc")],
+    [InlineKeyboardButton("🗑️ Remove Last", callback_data="remove_last_cc")],
+    [InlineKeyboardButton("✅ Done with CC", callback_data="done_with_cc")],
+])
+
+_CC_OPTIONS_EMPTY = _static([
+    [InlineKeyboardButton("✅ Add CC", callback_data="add_cc")],
+    [InlineKeyboardButton("⏭️ Skip CC", callback_data="skip_cc")],
+])
+
+_MODIFY_CC = _static([
+    [InlineKeyboardButton("✏️ Modify CCs", callback_data="modify_cc")],
+    [InlineKeyboardButton("✅ Continue", callback_data="done_with_cc")],
+])
+
+_MESSAGE_TYPE = _static([
+    [InlineKeyboardButton("📌 Use Preset Message", callback_data="use_preset")],
+    [InlineKeyboardButton("✍️ Write Custom Message", callback_data="use_custom")],
+])
+
+_PREVIEW = _static([
+    [InlineKeyboardButton("✏️ Edit", callback_data="preview_edit")],
+    [InlineKeyboardButton("📧 Send", callback_data="send_email_confirm")],
+    [InlineKeyboardButton("⏰ Send Later", callback_data="send_later")],
+    [InlineKeyboardButton("📎 Attach File", callback_data="attach_file")],
+])
+
+_EDIT_OPTIONS = _static([
+    [InlineKeyboardButton("✏️ Edit Subject", callback_data="edit_subject")],
+    [InlineKeyboardButton("✏️ Edit Body", callback_data="edit_body")],
+    [InlineKeyboardButton("🗑️ Remove Attachments", callback_data="remove_attachments")],
+    [InlineKeyboardButton("📧 Send Email", callback_data="send_email_confirm")],
+])
+
+_DATE_TYPE_MULTI = _static([
+    [InlineKeyboardButton("📅 Select Date Range", callback_data="date_select_range")],
+    [InlineKeyboardButton("📅 Single Day", callback_data="date_select_single")],
+])
+
+_DATE_TYPE_SINGLE = _static([
+    [InlineKeyboardButton("📅 Select Date", callback_data="date_select_single")],
+])
+
+_REASON = _static([
+    [InlineKeyboardButton("📝 Personal Reasons", callback_data="reason_personal")],
+    [InlineKeyboardButton("✍️ Custom Reason", callback_data="reason_custom")],
+    [InlineKeyboardButton("⏭️ Skip Reason", callback_data="reason_skip")],
+])
+
+_POST_SEND = _static([
+    [InlineKeyboardButton("📧 Send Another", callback_data="send_another")],
+    [InlineKeyboardButton("🏠 Home", callback_data="back_to_home")],
+])
+
+
+_SCHEDULE_WITH_DATE = _static([
+    [InlineKeyboardButton("🗓️ Morning of the Date", callback_data="schedule_on_date")],
+    [InlineKeyboardButton("🌅 Tomorrow Morning", callback_data="schedule_tomorrow")],
+    [InlineKeyboardButton("✍️ Enter a Time", callback_data="schedule_custom")],
+    [InlineKeyboardButton("⬅️ Back to Preview", callback_data="schedule_back")],
+])
+
+_SCHEDULE = _static([
+    [InlineKeyboardButton("🌅 Tomorrow Morning", callback_data="schedule_tomorrow")],
+    [InlineKeyboardButton("✍️ Enter a Time", callback_data="schedule_custom")],
+    [InlineKeyboardButton("⬅️ Back to Preview", callback_data="schedule_back")],
+])
+
 
 def home_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📧 Send Email", callback_data="send_email")],
-        [InlineKeyboardButton("❓ Help", callback_data="help")],
-    ])
+    return _HOME
 
 
 def recipient_type_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("👥 Select Group", callback_data="select_group")],
-        [InlineKeyboardButton("✏️ Manual Entry", callback_data="manual_entry")],
-    ])
+    return _RECIPIENT_TYPE
 
 
 def cc_options_keyboard(has_cc: bool = False) -> InlineKeyboardMarkup:
-    if has_cc:
-        return InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ Add More CC", callback_data="add_more_cc")],
-            [InlineKeyboardButton("🗑️ Remove Last", callback_data="remove_last_cc")],
-            [InlineKeyboardButton("✅ Done with CC", callback_data="done_with_cc")],
-        ])
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✅ Add CC", callback_data="add_cc")],
-        [InlineKeyboardButton("⏭️ Skip CC", callback_data="skip_cc")],
-    ])
+    return _CC_OPTIONS_WITH_CC if has_cc else _CC_OPTIONS_EMPTY
 
 
 def modify_cc_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✏️ Modify CCs", callback_data="modify_cc")],
-        [InlineKeyboardButton("✅ Continue", callback_data="done_with_cc")],
-    ])
+    return _MODIFY_CC
 
 
 def message_type_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📌 Use Preset Message", callback_data="use_preset")],
-        [InlineKeyboardButton("✍️ Write Custom Message", callback_data="use_custom")],
-    ])
+    return _MESSAGE_TYPE
 
 
 def preview_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✏️ Edit", callback_data="preview_edit")],
-        [InlineKeyboardButton("📧 Send", callback_data="send_email_confirm")],
-    ])
+    return _PREVIEW
 
 
 def edit_options_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✏️ Edit Subject", callback_data="edit_subject")],
-        [InlineKeyboardButton("✏️ Edit Body", callback_data="edit_body")],
-        [InlineKeyboardButton("📧 Send Email", callback_data="send_email_confirm")],
-    ])
+    return _EDIT_OPTIONS
 
 
 def date_type_keyboard(multi_day: bool = True) -> InlineKeyboardMarkup:
-    if multi_day:
-        return InlineKeyboardMarkup([
-            [InlineKeyboardButton("📅 Select Date Range", callback_data="date_select_range")],
-            [InlineKeyboardButton("📅 Single Day", callback_data="date_select_single")],
-        ])
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📅 Select Date", callback_data="date_select_single")],
-    ])
+    return _DATE_TYPE_MULTI if multi_day else _DATE_TYPE_SINGLE
 
 
 def reason_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📝 Personal Reasons", callback_data="reason_personal")],
-        [InlineKeyboardButton("✍️ Custom Reason", callback_data="reason_custom")],
-        [InlineKeyboardButton("⏭️ Skip Reason", callback_data="reason_skip")],
-    ])
+    return _REASON
 
 
 def post_send_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📧 Send Another", callback_data="send_another")],
-        [InlineKeyboardButton("🏠 Home", callback_data="back_to_home")],
-    ])
+    return _POST_SEND
+
+
+def schedule_keyboard(has_date: bool = False) -> InlineKeyboardMarkup:
+    return _SCHEDULE_WITH_DATE if has_date else _SCHEDULE
+
+
+def scheduled_list_keyboard(schedule_ids: list[int]) -> InlineKeyboardMarkup:
+    """One cancel button per upcoming email, plus Home."""
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(f"❌ Cancel #{i}", callback_data=f"sched_cancel_{i}")]
+         for i in schedule_ids]
+        + [[InlineKeyboardButton("🏠 Home", callback_data="back_to_home")]]
+    )
+
+
+# ── Config-derived keyboards ──────────────────────────────────────────────────
+
+def group_keyboard() -> InlineKeyboardMarkup:
+    return _cached("groups", lambda: InlineKeyboardMarkup([
+        [InlineKeyboardButton(group["name"], callback_data=f"group_{key}")]
+        for key, group in config.RECEIVER_GROUPS.items()
+    ]))
+
+
+def preset_keyboard() -> InlineKeyboardMarkup:
+    return _cached("presets", lambda: InlineKeyboardMarkup([
+        [InlineKeyboardButton(msg["subject"], callback_data=f"preset_{key}")]
+        for key, msg in config.PRESET_MESSAGES.items()
+    ]))
+
+
+def bulk_recipients_keyboard(selected: frozenset[str] | set[str] = frozenset()) -> InlineKeyboardMarkup:
+    """Group toggles (✅ when selected) plus list entry; cached only unselected."""
+    def build() -> InlineKeyboardMarkup:
+        rows = [
+            [InlineKeyboardButton(
+                f"✅ {group['name']}" if key in selected else group["name"],
+                callback_data=f"bulk_group_{key}",
+            )]
+            for key, group in config.RECEIVER_GROUPS.items()
+        ]
+        rows += [
+            [InlineKeyboardButton("📋 Paste or Upload Addresses", callback_data="bulk_paste")],
+            [InlineKeyboardButton("➡️ Continue", callback_data="bulk_continue")],
+            [InlineKeyboardButton("🏠 Home", callback_data="back_to_home")],
+        ]
+        return InlineKeyboardMarkup(rows)
+
+    return build() if selected else _cached("bulk_recipients", build)
@@ -1,31 +1,147 @@
-"""Fill in date/reason placeholders in preset message bodies."""
-from app.config import PRESET_MESSAGES
+"""Compile preset bodies into segment lists and render them with one join.
 
+A preset body is literal text with ``[name]`` placeholders.  Each known
+placeholder has a type (which user input it needs) and a formatter that
+turns ``user_data`` into its text.  Bodies are compiled once per config
+version; unknown placeholders, or a mismatch with a preset's optional
+``"placeholders"`` declaration, raise :class:`TemplateError` at compile time.
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable
 
-def build_preset_body(preset_key: str, user_data: dict) -> str:
-    """Return the preset body with all placeholders replaced."""
-    preset = PRESET_MESSAGES[preset_key]
+from app import config
+
+_PLACEHOLDER_RE = re.compile(r"\[([a-z_]+)\]")
+
+# Placeholder types — what the conversation has to collect before rendering
+DATE_RANGE = "date_range"   # a single day or a start/end range
+DATE = "date"               # exactly one day
+TEXT = "text"               # free text (optional)
+
+
+class TemplateError(ValueError):
+    """Raised when a preset body cannot be compiled."""
+
+
+@dataclass(frozen=True)
+class Placeholder:
+    name: str
+    type: str
+    format: Callable[[dict], str]
+    # When the rendered value is empty, also drop one space rendered before it
+    absorbs_space: bool = False
+
+
+def _format_dates(user_data: dict) -> str:
+    date_end = user_data.get("date_end", "")
+    if date_end:
+        return f"{user_data.get('date_start', '')} to {date_end}"
+    return user_data.get("date_single", "")
+
+
+def _format_date(user_data: dict) -> str:
+    return user_data.get("date_single", "")
+
+
+def _format_reason(user_data: dict) -> str:
+    reason = user_data.get("leave_reason", "")
+    # Insert with a leading separator for readability
+    return f" due to {reason}" if reason else ""
+
+
+PLACEHOLDERS: dict[str, Placeholder] = {
+    "dates": Placeholder("dates", DATE_RANGE, _format_dates),
+    "date": Placeholder("date", DATE, _format_date),
+    "reason": Placeholder("reason", TEXT, _format_reason, absorbs_space=True),
+}
+
+
+@dataclass(frozen=True)
+class CompiledPreset:
+    key: str
+    subject: str
+    segments: tuple[str | Placeholder, ...]
+    placeholders: frozenset[str]
+
+    @property
+    def needs_dates(self) -> bool:
+        return any(PLACEHOLDERS[name].type in (DATE_RANGE, DATE) for name in self.placeholders)
+
+    @property
+    def multi_day(self) -> bool:
+        """True if the preset accepts a date range, not just a single day."""
+        return any(PLACEHOLDERS[name].type == DATE_RANGE for name in self.placeholders)
+
+    @property
+    def needs_reason(self) -> bool:
+        return "reason" in self.placeholders
+
+    def render(self, user_data: dict) -> str:
+        parts: list[str] = []
+        for seg in self.segments:
+            if isinstance(seg, str):
+                parts.append(seg)
+                continue
+            value = seg.format(user_data)
+            if value:
+                parts.append(value)
+            elif seg.absorbs_space and parts and parts[-1].endswith(" "):
+                parts[-1] = parts[-1][:-1]
+        return "".join(parts)
+
+
+def compile_preset(key: str, preset: dict) -> CompiledPreset:
+    """Split one preset body into literal text and placeholder slots."""
     body: str = preset["body"]
+    segments: list[str | Placeholder] = []
+    found: set[str] = set()
+    pos = 0
+    for match in _PLACEHOLDER_RE.finditer(body):
+        name = match.group(1)
+        placeholder = PLACEHOLDERS.get(name)
+        if placeholder is None:
+            raise TemplateError(f"Preset {key!r}: unknown placeholder [{name}]")
+        found.add(name)
+        if match.start() > pos:
+            segments.append(body[pos:match.start()])
+        segments.append(placeholder)
+        pos = match.end()
+    if body[pos:]:
+        segments.append(body[pos:])
+
+    declared = preset.get("placeholders")
+    if declared is not None:
+        missing = set(declared) - found
+        extra = found - set(declared)
+        if missing or extra:
+            raise TemplateError(
+                f"Preset {key!r}: placeholders missing {sorted(missing)}, "
+                f"undeclared {sorted(extra)}"
+            )
+    return CompiledPreset(key, preset["subject"], tuple(segments), frozenset(found))
+
+
+def compile_presets(presets: dict) -> dict[str, CompiledPreset]:
+    return {key: compile_preset(key, preset) for key, preset in presets.items()}
+
+
+_compiled: tuple[int, dict[str, CompiledPreset]] = (
+    config.config_version(),
+    compile_presets(config.PRESET_MESSAGES),   # fail fast at startup
+)
+
+
+def compiled_presets() -> dict[str, CompiledPreset]:
+    """All presets, recompiled only when the config version changes."""
+    global _compiled
+    version = config.config_version()
+    if _compiled[0] != version:
+        _compiled = (version, compile_presets(config.PRESET_MESSAGES))
+    return _compiled[1]
+
 
-    date_start: str = user_data.get("date_start", "")
-    date_end: str = user_data.get("date_end", "")
-    date_single: str = user_data.get("date_single", "")
-    reason: str = user_data.get("leave_reason", "")
-
-    # ── Date substitution ─────────────────────────────────────────────────────
-    if preset_key in ("leave_request", "wfh"):
-        if date_end:
-            body = body.replace("[dates]", f"{date_start} to {date_end}")
-        else:
-            body = body.replace("[dates]", date_single)
-    elif preset_key in ("half_day", "half_day_leave_wfh"):
-        body = body.replace("[date]", date_single)
-
-    # ── Reason substitution ───────────────────────────────────────────────────
-    if reason:
-        # Insert with a leading separator for readability
-        body = body.replace("[reason]", f" due to {reason}")
-    else:
-        body = body.replace(" [reason]", "").replace("[reason]", "")
-
-    return body
+def get_preset(preset_key: str | None) -> CompiledPreset | None:
+    if not preset_key:
+        return None
+    return compiled_presets().get(preset_key)
@@ -1,21 +1,59 @@
 """Build the email preview text shown to users."""
+from app.attachments import format_size
+from app.tracing import traced
 
 
+@traced("build_preview")
 def build_preview(
     receiver: str,
     cc_list: list[str],
     subject: str,
     body: str,
+    attachments: list[dict] | None = None,
 ) -> str:
+    if attachments is None:
+        attachments = []
+
     cc_text = (
         "\n".join(f"• {email}" for email in cc_list)
         if cc_list
         else "No CC recipients"
     )
+    files_text = (
+        "**Attachments:**\n"
+        + "".join(f"• `{a['name']}` ({format_size(a['size'])})\n" for a in attachments)
+        if attachments
+        else ""
+    )
     return (
         f"📧 **EMAIL PREVIEW** 📧\n\n"
         f"**To:** {receiver}\n"
         f"**CC:** {cc_text}\n"
+        f"**Subject:** {subject}\n"
+        f"{files_text}\n"
+        f"**Message:**\n"
+        f"─────────────────\n"
+        f"{body}\n"
+        f"─────────────────"
+    )
+
+
+@traced("build_preview")
+def build_bulk_preview(
+    recipients: list[dict],
+    subject: str,
+    body: str,
+    shown: int = 5,
+) -> str:
+    """Preview for a bulk send; ``{field}`` placeholders are shown unmerged."""
+    listed = "\n".join(f"• {r['to']}" for r in recipients[:shown])
+    if len(recipients) > shown:
+        listed += f"\n• … and {len(recipients) - shown} more"
+    fields = sorted({name for r in recipients for name in r["fields"]})
+    return (
+        f"📨 **BULK PREVIEW** 📨\n\n"
+        f"**To ({len(recipients)}):**\n{listed or 'No recipients'}\n"
+        f"**Merge fields:** {', '.join('{' + f + '}' for f in fields) or 'None'}\n"
         f"**Subject:** {subject}\n\n"
         f"**Message:**\n"
         f"─────────────────\n"
@@ -0,0 +1,144 @@
+"""Flask app serving the Telegram webhook (imported by ``app.py`` and ``wsgi.py``).
+
+Kept for sync WSGI servers; :mod:`app.asgi` is the async equivalent.
+Importing it builds nothing process-bound, so it is safe to preload in a
+gunicorn master; each worker builds its bot on first use, or in
+:func:`warm_up` (called from ``gunicorn.conf.py``) before taking requests.
+"""
+import asyncio
+import logging
+import threading
+
+from flask import Flask, request, abort
+
+from app.bot import get_application
+from app.config import WEBHOOK_SECRET, BOT_RUNTIME, INLINE_REPLIES
+from app.content import content_watcher
+from app.runtime import BotRuntime
+from app.dedup import deduplicator
+from app.metrics import CONTENT_TYPE, UPDATES, WEBHOOK_SECONDS, render
+from app.profiling import admin_endpoint
+from app.recorder import recorder
+from app.status import health_status
+from app.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+flask_app = Flask(__name__)
+
+_runtime: BotRuntime | None = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> BotRuntime | None:
+    """This worker's long-lived runtime, or ``None`` with ``BOT_RUNTIME=per_request``."""
+    global _runtime
+    if BOT_RUNTIME != "background":
+        return None
+    application = get_application()
+    if _runtime is None or _runtime.application is not application:
+        with _runtime_lock:
+            if _runtime is None or _runtime.application is not application:
+                _runtime = BotRuntime(application)
+    return _runtime
+
+
+def warm_up() -> None:
+    """Build the bot and start its runtime now rather than on the first update."""
+    try:
+        get_application()
+        runtime = get_runtime()
+        if runtime is not None:
+            runtime.start()
+    except Exception:
+        logger.exception("Bot warm-up failed; retrying on the first update")
+
+
+def run_async(coro):
+    """Run an async coroutine safely from a sync Flask route."""
+    try:
+        loop = asyncio.get_event_loop()
+        if loop.is_closed():
+            raise RuntimeError("closed")
+        return loop.run_until_complete(coro)
+    except RuntimeError:
+        return asyncio.run(coro)
+
+
+@flask_app.route(f"/webhook/{WEBHOOK_SECRET}", methods=["POST"])
+def webhook():
+    """Receive updates from Telegram via webhook."""
+    with WEBHOOK_SECONDS.labels("flask").time():
+        return _webhook()
+
+
+def _webhook():
+    if request.content_type != "application/json":
+        abort(415)
+
+    data = request.get_json(force=True)
+    if not data:
+        UPDATES.labels("rejected").inc()
+        abort(400)
+
+    # Acknowledge redeliveries straight away, without building an Update
+    update_id = data.get("update_id")
+    if isinstance(update_id, int) and deduplicator.seen(update_id):
+        UPDATES.labels("duplicate").inc()
+        return "OK", 200
+    try:
+        return _hand_off(data)
+    except BaseException:
+        # Not handed off: let Telegram's redelivery through instead of acking it
+        if isinstance(update_id, int):
+            deduplicator.forget(update_id)
+        raise
+
+
+def _hand_off(data: dict):
+    UPDATES.labels("accepted").inc()
+    recorder.arrived(data)
+
+    runtime = get_runtime()
+    if runtime is not None:
+        if INLINE_REPLIES:
+            body = runtime.submit_inline(data)
+            return (body, 200) if body is not None else ("OK", 200)
+        runtime.submit(data)
+        return "OK", 200
+
+    ptb_app = get_application()
+    # ``async with`` skips post_init; of its services only the content
+    # watcher (a thread) outlives the request.  Scheduling is refused.
+    content_watcher.start()
+
+    async def process():
+        update = tracer.decode(data, ptb_app.bot)
+        async with ptb_app:
+            await ptb_app.process_update(update)
+
+    run_async(process())
+    return "OK", 200
+
+
+@flask_app.route("/health", methods=["GET"])
+def health():
+    return health_status(get_application()), 200
+
+
+@flask_app.route("/metrics", methods=["GET"])
+def metrics():
+    return render(health_status(get_application())), 200, {"Content-Type": CONTENT_TYPE}
+
+
+@flask_app.route("/debug/profile", methods=["GET", "POST"])
+def debug_profile():
+    params = request.args.to_dict()
+    token = request.headers.get("X-Admin-Token") or params.pop("token", "")
+    status, body, headers = admin_endpoint(request.method, params, token)
+    return body, status, headers
+
+
+@flask_app.route("/", methods=["GET"])
+def index():
+    return {"message": "Email Telegram Bot is running!"}, 200
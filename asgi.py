@@ -0,0 +1,8 @@
+"""ASGI entry point: ``uvicorn asgi:app``."""
+from app.boot import boot, configure_logging
+
+configure_logging()
+
+from app.asgi import app  # noqa: E402
+
+boot.mark("imported")
@@ -0,0 +1,171 @@
+"""A local stand-in for the Telegram Bot API, as a plain ASGI app.
+
+It answers every method the bot uses with a plausible result, records the
+calls, and timestamps the bot's replies in each chat — which is how the load
+generator measures end-to-end reply latency.
+
+``getFile`` works for any ``file_id``; one ending in ``-<n>`` is a file of
+*n* bytes (64 KB otherwise), served from ``/file/bot<token>/files/<id>``.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+_BOT = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+_DEFAULT_FILE_SIZE = 64 * 1024
+
+# Calls the user does not see as a reply in the chat: a callback handler
+# answers its query (stopping the button's spinner) before it does any work
+NOT_A_REPLY = frozenset({"answerCallbackQuery"})
+
+
+def file_size(file_id: str) -> int:
+    _, _, size = file_id.rpartition("-")
+    return int(size) if size.isdigit() else _DEFAULT_FILE_SIZE
+
+
+def file_bytes(file_id: str) -> bytes:
+    """The deterministic contents served for *file_id*."""
+    pattern = file_id.encode() + b"\n"
+    size = file_size(file_id)
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+def _message(chat_id: int, message_id: int, text: str = "") -> dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": _BOT,
+        "text": text or "…",
+    }
+
+
+def _chat_of(data: dict) -> int | None:
+    """The chat a call is for; callback query ids are ``"<chat>:<n>"``."""
+    if "chat_id" in data:
+        try:
+            return int(data["chat_id"])
+        except (TypeError, ValueError):
+            return None
+    query_id = str(data.get("callback_query_id", ""))
+    chat, _, _ = query_id.partition(":")
+    return int(chat) if chat.lstrip("-").isdigit() else None
+
+
+class FakeTelegram:
+    """ASGI app serving ``/bot<token>/<method>``."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._replies: dict[int, list[float]] = {}
+        self._waiters: dict[int, list[tuple[int, asyncio.Future]]] = {}
+        self._message_ids = 1000
+
+    def replies(self, chat_id: int) -> int:
+        """How many replies the bot has made in *chat_id* so far."""
+        return len(self._replies.get(chat_id, ()))
+
+    def reply_at(self, chat_id: int, n: int) -> asyncio.Future:
+        """A future resolved with the time of the *n*-th reply in *chat_id*."""
+        future = asyncio.get_running_loop().create_future()
+        times = self._replies.get(chat_id, [])
+        if len(times) >= n:
+            future.set_result(times[n - 1])
+        else:
+            self._waiters.setdefault(chat_id, []).append((n, future))
+        return future
+
+    def _record(self, method: str, data: dict) -> None:
+        self.calls[method] += 1
+        chat_id = _chat_of(data)
+        if chat_id is None or method in NOT_A_REPLY:
+            return
+        times = self._replies.setdefault(chat_id, [])
+        times.append(time.perf_counter())
+        waiting = []
+        for n, future in self._waiters.pop(chat_id, []):
+            if len(times) < n:
+                waiting.append((n, future))
+            elif not future.done():
+                future.set_result(times[n - 1])
+        if waiting:
+            self._waiters[chat_id] = waiting
+
+    def _result(self, method: str, data: dict):
+        if method == "getMe":
+            return _BOT
+        if method == "getUpdates":
+            return []
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = _chat_of(data) or 0
+            message_id = data.get("message_id")
+            if message_id is None:
+                self._message_ids += 1
+                message_id = self._message_ids
+            return _message(chat_id, int(message_id), data.get("text", ""))
+        if method == "getFile":
+            file_id = str(data.get("file_id", ""))
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": file_size(file_id),
+                    "file_path": f"files/{file_id}"}
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        return True
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["path"].startswith("/file/"):
+            await self._download(scope, send)
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        content_type = dict(scope["headers"]).get(b"content-type", b"").decode()
+        if "json" in content_type:
+            data = json.loads(body or b"{}")
+        else:
+            data = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        for key in ("chat_id", "message_id"):
+            if isinstance(data.get(key), str) and data[key].lstrip("-").isdigit():
+                data[key] = int(data[key])
+
+        method = scope["path"].rsplit("/", 1)[-1]
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._record(method, data)
+        payload = json.dumps({"ok": True, "result": self._result(method, data)}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _download(self, scope, send) -> None:
+        self.calls["download"] += 1
+        body = file_bytes(scope["path"].rsplit("/", 1)[-1])
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/octet-stream"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,239 @@
+"""Synthetic update streams, replayed against a webhook like real users.
+
+Each virtual user owns one chat and walks through scripted flows — full
+send-email conversations and lighter chatter — sending one update at a time
+and waiting for the bot's reply before the next, as a person would.  Two
+latencies are recorded per update: the webhook acknowledgement, and the
+reply (the bot's first reply in that chat, possibly an inline one in the
+webhook response).  A callback's ``answerCallbackQuery`` is not its reply:
+the bot answers the query before running the step's handler.  After a send
+the user also waits for the email's status report before going on.
+"""
+import asyncio
+import itertools
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+from bench.fake_telegram import NOT_A_REPLY, FakeTelegram, file_size
+
+# (kind, value) steps; "{n}" is replaced with a per-flow counter
+FLOWS: dict[str, list[tuple[str, str]]] = {
+    "custom": [
+        ("text", "hi"),
+        ("callback", "send_email"),
+        ("callback", "select_group"),
+        ("callback", "group_bench"),
+        ("callback", "done_with_cc"),
+        ("callback", "use_custom"),
+        ("text", "Bench subject {n}"),
+        ("text", "Load test body for flow {n}."),
+        ("callback", "send_email_confirm"),
+    ],
+    "preset": [
+        ("text", "hi"),
+        ("callback", "send_email"),
+        ("callback", "manual_entry"),
+        ("text", "receiver@example.com"),
+        ("callback", "skip_cc"),
+        ("callback", "use_preset"),
+        ("callback", "preset_leave_request"),
+        ("callback", "date_select_single"),
+        ("text", "2026-02-15"),
+        ("callback", "reason_skip"),
+        ("callback", "send_email_confirm"),
+    ],
+    # Not in the default mix; value of a "document" step is its file_id
+    "attachment": [
+        ("text", "hi"),
+        ("callback", "send_email"),
+        ("callback", "manual_entry"),
+        ("text", "receiver@example.com"),
+        ("callback", "skip_cc"),
+        ("callback", "use_custom"),
+        ("text", "Bench subject {n}"),
+        ("text", "Attachment body for flow {n}."),
+        ("callback", "attach_file"),
+        ("document", "bench-{n}-300000"),
+        ("callback", "send_email_confirm"),
+    ],
+    "chatter": [
+        ("text", "hi"),
+        ("callback", "help"),
+        ("text", "hello"),
+    ],
+}
+
+# Flows that end with one email sent
+SENDS_EMAIL = {"custom", "preset", "attachment"}
+
+DEFAULT_MIX = {"custom": 2, "preset": 2, "chatter": 1}
+
+# Steps whose email's outcome is reported in one more message, sent by the
+# mail dispatcher later; it must not pass for the next step's reply
+REPORTED = {"send_email_confirm"}
+
+
+class UpdateFactory:
+    """Builds Telegram update payloads with unique, increasing ids."""
+
+    def __init__(self) -> None:
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def make(self, chat_id: int, kind: str, value: str) -> dict:
+        update_id = next(self._update_ids)
+        user = {"id": chat_id, "is_bot": False, "first_name": f"Bench{chat_id}"}
+        chat = {"id": chat_id, "type": "private"}
+        if kind == "text":
+            return {
+                "update_id": update_id,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": user,
+                    "text": value,
+                },
+            }
+        if kind == "document":
+            return {
+                "update_id": update_id,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": user,
+                    "document": {
+                        "file_id": value,
+                        "file_unique_id": value,
+                        "file_name": f"{value}.bin",
+                        "file_size": file_size(value),
+                    },
+                },
+            }
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                # The fake API maps answerCallbackQuery back to the chat with this
+                "id": f"{chat_id}:{update_id}",
+                "chat_instance": str(chat_id),
+                "from": user,
+                "data": value,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                    "text": "…",
+                },
+            },
+        }
+
+
+@dataclass
+class LoadStats:
+    ack: list[float] = field(default_factory=list)
+    reply: list[float] = field(default_factory=list)
+    updates: int = 0
+    flows: int = 0
+    email_flows: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    started: float = 0.0
+    finished: float = 0.0
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """p50/p95/p99 in milliseconds."""
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49] * 1000, "p95": cuts[94] * 1000, "p99": cuts[98] * 1000}
+
+
+class LoadGenerator:
+    def __init__(
+        self,
+        url: str,
+        fake: FakeTelegram,
+        *,
+        users: int = 20,
+        flows_per_user: int = 3,
+        mix: dict[str, int] = DEFAULT_MIX,
+        reply_timeout: float = 10.0,
+        seed: int = 1,
+    ) -> None:
+        self.url = url
+        self.fake = fake
+        self.users = users
+        self.flows_per_user = flows_per_user
+        self.mix = mix
+        self.reply_timeout = reply_timeout
+        self.random = random.Random(seed)
+        self.factory = UpdateFactory()
+        self.stats = LoadStats()
+        self._flow_ids = itertools.count(1)
+
+    def _pick(self) -> str:
+        names = list(self.mix)
+        return self.random.choices(names, weights=[self.mix[n] for n in names])[0]
+
+    async def run(self) -> LoadStats:
+        # Decide every user's flows up front so runs with one seed are comparable
+        plans = [[self._pick() for _ in range(self.flows_per_user)] for _ in range(self.users)]
+        limits = httpx.Limits(max_connections=self.users, max_keepalive_connections=self.users)
+        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+            self.stats.started = time.perf_counter()
+            await asyncio.gather(*(
+                self._user(client, 100_000 + index, plan) for index, plan in enumerate(plans)
+            ))
+            self.stats.finished = time.perf_counter()
+        return self.stats
+
+    async def _user(self, client: httpx.AsyncClient, chat_id: int, plan: list[str]) -> None:
+        for name in plan:
+            n = next(self._flow_ids)
+            for kind, value in FLOWS[name]:
+                await self._step(client, chat_id, kind, value.format(n=n))
+            self.stats.flows += 1
+            self.stats.email_flows += name in SENDS_EMAIL
+
+    async def _step(self, client: httpx.AsyncClient, chat_id: int, kind: str, value: str) -> None:
+        update = self.factory.make(chat_id, kind, value)
+        seen = self.fake.replies(chat_id)
+        started = time.perf_counter()
+        try:
+            response = await client.post(self.url, json=update)
+        except httpx.HTTPError:
+            self.stats.errors += 1
+            return
+        acked = time.perf_counter()
+        self.stats.updates += 1
+        self.stats.ack.append(acked - started)
+        if response.status_code != 200:
+            self.stats.errors += 1
+            return
+        expected = seen + 1 + (value in REPORTED)
+        replied = None
+        if response.headers.get("content-type", "").startswith("application/json"):
+            # Inline reply: the response itself is one of the bot's replies,
+            # unless it only answers the callback query
+            if response.json().get("method") not in NOT_A_REPLY:
+                expected -= 1
+                if self.fake.replies(chat_id) == seen:
+                    replied = acked
+        try:
+            if replied is None:
+                replied = await asyncio.wait_for(
+                    self.fake.reply_at(chat_id, seen + 1), self.reply_timeout
+                )
+            self.stats.reply.append(replied - started)
+            if expected > seen:
+                await asyncio.wait_for(self.fake.reply_at(chat_id, expected), self.reply_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
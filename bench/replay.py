@@ -0,0 +1,244 @@
+"""Replay recorded webhook traffic against a local bot and report on it.
+
+    python -m bench.replay data/recordings/*.jsonl                # real time
+    python -m bench.replay rec/*.jsonl --speed 10                 # 10× faster
+    python -m bench.replay rec/*.jsonl --speed max --json a.json  # flat out
+    python -m bench.replay rec/*.jsonl --speed max --baseline a.json
+
+Recordings come from a server run with ``RECORD_UPDATES=1`` (see
+:mod:`app.recorder`).  Updates from every file are merged by arrival time
+and posted to the webhook of a bot started exactly like ``bench.run`` does —
+against the fake Bot API and the SMTP sink — keeping their original spacing
+divided by ``--speed``.  Each chat's updates are posted one after another,
+so per-chat order holds even at ``max``.
+
+The bot under test records too; its processing latencies (arrival →
+handlers done) are what the report's ``latency`` and ``queue`` rows are
+built from.  ``--json`` / ``--baseline`` work as in ``bench.run``.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from bench.loadgen import percentiles
+from bench.run import MODES, SECRET, bot_server, report, stand_ins
+
+
+def load(paths: list[str]) -> list[dict]:
+    """Every recorded line from *paths*, oldest arrival first."""
+    entries, skipped = [], 0
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    skipped += 1     # a line cut short by a crash or rotation
+                    continue
+                if isinstance(entry, dict) and isinstance(entry.get("update"), dict):
+                    entries.append(entry)
+    if skipped:
+        print(f"skipped {skipped} unreadable line(s)", file=sys.stderr)
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+def chat_of(update: dict) -> int | str:
+    """The chat an update belongs to, for keeping per-chat order."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if value.get("from"):
+            return value["from"]["id"]
+    return f"update-{update.get('update_id')}"
+
+
+class Replayer:
+    def __init__(self, base_url: str, entries: list[dict], speed: float | None) -> None:
+        self.url = f"{base_url}/webhook/{SECRET}"
+        self.entries = entries
+        self.speed = speed
+        self.ack: list[float] = []
+        self.lag: list[float] = []
+        self.accepted = 0
+        self.errors = 0
+
+    async def run(self) -> float:
+        """Post everything; returns the seconds it took."""
+        chats: dict[int | str, list[dict]] = defaultdict(list)
+        for entry in self.entries:
+            chats[chat_of(entry["update"])].append(entry)
+        origin = self.entries[0]["ts"] if self.entries else 0.0
+        limits = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                self._chat(client, chat_entries, origin, started) for chat_entries in chats.values()
+            ))
+            return time.perf_counter() - started
+
+    async def _chat(self, client, entries: list[dict], origin: float, started: float) -> None:
+        for entry in entries:
+            if self.speed:
+                due = started + (entry["ts"] - origin) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.lag.append(max(0.0, -delay))
+            sent = time.perf_counter()
+            try:
+                response = await client.post(self.url, json=entry["update"])
+            except httpx.HTTPError:
+                self.errors += 1
+                continue
+            self.ack.append(time.perf_counter() - sent)
+            if response.status_code == 200:
+                self.accepted += 1
+            else:
+                self.errors += 1
+
+
+def _server_lines(data_dir: str) -> list[dict]:
+    lines = []
+    for path in Path(data_dir, "recordings").glob("*.jsonl*"):
+        with open(path, encoding="utf-8") as file:
+            lines += [json.loads(line) for line in file if line.endswith("\n")]
+    return lines
+
+
+async def _wait_processed(data_dir: str, count: int, timeout: float) -> list[dict]:
+    deadline = time.perf_counter() + timeout
+    while True:
+        lines = _server_lines(data_dir)
+        if len(lines) >= count or time.perf_counter() > deadline:
+            return lines
+        await asyncio.sleep(0.2)
+
+
+async def _wait_quiet(sink, quiet: float, timeout: float) -> None:
+    """Wait until no email has arrived for *quiet* seconds."""
+    deadline = time.perf_counter() + timeout
+    seen, since = sink.messages, time.perf_counter()
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+        if sink.messages != seen:
+            seen, since = sink.messages, time.perf_counter()
+        elif time.perf_counter() - since >= quiet:
+            return
+
+
+async def main(args) -> int:
+    entries = load(args.paths)
+    if not entries:
+        print("nothing to replay", file=sys.stderr)
+        return 2
+    speed = None if args.speed == "max" else float(args.speed)
+    span = entries[-1]["ts"] - entries[0]["ts"]
+    print(
+        f"→ {len(entries)} updates recorded over {span:.1f}s, "
+        f"replaying at {args.speed}{'' if speed is None else '×'} on {args.mode} …",
+        file=sys.stderr,
+    )
+
+    async with stand_ins(args.api_latency / 1000) as (fake, api_port, sink):
+        server_env = {
+            "RECORD_UPDATES": "1",
+            "RECORD_REDACT": "0",
+            # Recorded group taps need the configured groups, not the bench one
+            "RECEIVER_GROUPS": None,
+        }
+        async with bot_server(
+            args.mode,
+            api_port,
+            sink.port,
+            workers=args.workers,
+            flood_control=args.flood_control,
+            env=server_env,
+        ) as (base_url, data_dir):
+            replayer = Replayer(base_url, entries, speed)
+            elapsed = await replayer.run()
+            processed = await _wait_processed(data_dir, replayer.accepted, args.timeout)
+            await _wait_quiet(sink, args.settle, args.timeout)
+
+    finished = [line["ts"] + line["latency_ms"] / 1000 for line in processed]
+    window = max(finished) - min(line["ts"] for line in processed) if processed else 0.0
+    mail_window = (sink.last_at - sink.first_at) if sink.messages > 1 else 0.0
+    result = {
+        "mode": f"{args.mode}@{args.speed}",
+        "updates": len(entries),
+        "posted_in_s": round(elapsed, 3),
+        "updates_per_sec": len(processed) / window if window > 0 else 0.0,
+        "ack_ms": percentiles(replayer.ack),
+        "latency_ms": percentiles([line["latency_ms"] / 1000 for line in processed]),
+        "queue_ms": percentiles([line["queue_ms"] / 1000 for line in processed]),
+        "schedule_lag_ms": percentiles(replayer.lag),
+        "processed": len(processed),
+        "handler_failures": sum(not line["ok"] for line in processed),
+        "emails": sink.messages,
+        "emails_per_sec": sink.messages / mail_window if mail_window > 0 else 0.0,
+        "bot_api_calls": dict(fake.calls.most_common()),
+        "errors": replayer.errors,
+        "timeouts": max(0, replayer.accepted - len(processed)),
+    }
+    print_report(result)
+    return report([result], args)
+
+
+def print_report(r: dict) -> None:
+    print(f"{r['mode']}: {r['processed']}/{r['updates']} updates processed, "
+          f"posted in {r['posted_in_s']:.1f}s")
+    print(f"  {'':<16} {'p50':>8} {'p95':>8} {'p99':>8}   (ms)")
+    for key, label in (("ack_ms", "webhook ack"), ("queue_ms", "queued"),
+                       ("latency_ms", "processed"), ("schedule_lag_ms", "behind schedule")):
+        p = r[key]
+        print(f"  {label:<16} {p['p50']:>8.1f} {p['p95']:>8.1f} {p['p99']:>8.1f}")
+    print(f"  throughput       {r['updates_per_sec']:.1f} updates/s, "
+          f"{r['emails']} emails at {r['emails_per_sec']:.1f}/s")
+    print(f"  errors {r['errors']}, timeouts {r['timeouts']}, "
+          f"handler failures {r['handler_failures']}")
+    calls = ", ".join(f"{method} {count}" for method, count in r["bot_api_calls"].items())
+    print(f"  Bot API calls: {calls or 'none'}")
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.replay", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument("paths", nargs="+", help="recording files (updates-*.jsonl[.N])")
+    parser.add_argument("--speed", default="1",
+                        help='playback speed: 1 (real time), N (N× faster) or "max"')
+    parser.add_argument("--mode", default="asgi", choices=list(MODES))
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="ms the fake Bot API waits before answering")
+    parser.add_argument("--flood-control", action="store_true",
+                        help="keep outbound flood control on (off by default)")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds to wait for processing and emails to finish")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds without a new email before the run counts as done")
+    parser.add_argument("--json", help="write the result to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed regression vs the baseline (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    if args.speed != "max":
+        try:
+            if float(args.speed) <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error('--speed must be a positive number or "max"')
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,308 @@
+"""Run the load benchmark against each serving mode and compare them.
+
+    python -m bench.run                                 # all modes, defaults
+    python -m bench.run --modes asgi,flask --users 50   # a subset, more load
+    python -m bench.run --json out.json                 # keep the numbers
+    python -m bench.run --baseline out.json             # fail on regression
+
+Everything runs on this machine: a fake Bot API (:mod:`bench.fake_telegram`)
+and an SMTP sink (:mod:`bench.smtp_sink`) in this process, and the bot as a
+real server subprocess — uvicorn or gunicorn, exactly as deployed — pointed
+at both through ``TELEGRAM_API_URL`` and ``SMTP_HOST``.  Each mode gets
+fresh SQLite files in a temporary directory; the server's own log goes
+there too and is printed only if it fails to start.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+from bench.fake_telegram import FakeTelegram
+from bench.loadgen import LoadGenerator, percentiles
+from bench.smtp_sink import SMTPSink
+
+ROOT = Path(__file__).resolve().parent.parent
+SECRET = "bench"
+SINK_ADDRESSES = {"receiver": "team@example.com", "cc": ["lead@example.com"]}
+
+# name -> (command, extra environment); "{port}" and "{workers}" are filled in
+MODES: dict[str, tuple[list[str], dict[str, str]]] = {
+    "asgi": (
+        [sys.executable, "-m", "uvicorn", "asgi:app",
+         "--port", "{port}", "--workers", "{workers}", "--log-level", "warning"],
+        {},
+    ),
+    "asgi-inline": (
+        [sys.executable, "-m", "uvicorn", "asgi:app",
+         "--port", "{port}", "--workers", "{workers}", "--log-level", "warning"],
+        {"INLINE_REPLIES": "1"},
+    ),
+    "flask": (
+        [sys.executable, "-m", "gunicorn", "wsgi:flask_app",
+         "-b", "127.0.0.1:{port}", "-w", "{workers}", "--threads", "8", "--log-level", "warning"],
+        {"BOT_RUNTIME": "background"},
+    ),
+    # Legacy mode shares one Application between requests, so it only works
+    # with gunicorn's default single-threaded sync workers
+    "flask-per-request": (
+        [sys.executable, "-m", "gunicorn", "wsgi:flask_app",
+         "-b", "127.0.0.1:{port}", "-w", "{workers}", "--threads", "1", "--log-level", "warning"],
+        {"BOT_RUNTIME": "per_request"},
+    ),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _server_env(api_port: int, smtp_port: int, data_dir: str, flood_control: bool) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}/bot",
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_HOST": "",
+        "EMAIL_ADDRESS": "bench@example.com",
+        "EMAIL_PASSWORD": "bench",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_STARTTLS": "0",
+        "FLOOD_CONTROL": "1" if flood_control else "0",
+        "RECEIVER_GROUPS": json.dumps({"bench": {"name": "Bench", **SINK_ADDRESSES}}),
+        "CONTENT_FILE": "",
+        "OUTBOX_DB_PATH": f"{data_dir}/outbox.sqlite3",
+        "SCHEDULE_DB_PATH": f"{data_dir}/schedule.sqlite3",
+        "POLL_OFFSET_DB_PATH": f"{data_dir}/polling.sqlite3",
+        "STATE_DB_PATH": f"{data_dir}/bot_state.sqlite3",
+        "DEDUP_DB_PATH": f"{data_dir}/updates.sqlite3",
+        "RECORD_DIR": f"{data_dir}/recordings",
+    })
+    return env
+
+
+async def _wait_healthy(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become healthy")
+
+
+def _stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+@asynccontextmanager
+async def stand_ins(api_latency: float = 0.0):
+    """Run the fake Bot API and the SMTP sink; yields ``(fake, api_port, sink)``."""
+    fake = FakeTelegram(latency=api_latency)
+    api_port = _free_port()
+    api = uvicorn.Server(uvicorn.Config(fake, port=api_port, log_level="warning", lifespan="off"))
+    api_task = asyncio.create_task(api.serve())
+    sink = SMTPSink()
+    await sink.start()
+    while not api.started:
+        await asyncio.sleep(0.05)
+    try:
+        yield fake, api_port, sink
+    finally:
+        api.should_exit = True
+        await api_task
+        await sink.stop()
+
+
+@asynccontextmanager
+async def bot_server(
+    mode: str,
+    api_port: int,
+    smtp_port: int,
+    *,
+    workers: int = 1,
+    flood_control: bool = False,
+    env: dict[str, str] | None = None,
+):
+    """Run the bot in *mode* until the block exits; yields ``(base_url, data_dir)``.
+
+    *env* is applied last, so it may override anything (``None`` values
+    remove a variable).
+    """
+    command, mode_env = MODES[mode]
+    port = _free_port()
+    command = [part.format(port=port, workers=workers) for part in command]
+    with tempfile.TemporaryDirectory(prefix="mailbot-bench-") as data_dir:
+        server_env = _server_env(api_port, smtp_port, data_dir, flood_control) | mode_env
+        for key, value in (env or {}).items():
+            if value is None:
+                server_env.pop(key, None)
+            else:
+                server_env[key] = value
+        log_path = Path(data_dir) / "server.log"
+        with open(log_path, "wb") as log:
+            process = subprocess.Popen(
+                command, cwd=ROOT, env=server_env, stdout=log, stderr=subprocess.STDOUT
+            )
+        try:
+            try:
+                await _wait_healthy(f"http://127.0.0.1:{port}/health", process)
+            except RuntimeError:
+                sys.stderr.write(log_path.read_text(errors="replace")[-4000:])
+                raise
+            yield f"http://127.0.0.1:{port}", data_dir
+        finally:
+            _stop(process)
+
+
+async def run_mode(mode: str, fake: FakeTelegram, api_port: int, sink: SMTPSink, args) -> dict:
+    sink.reset()
+    fake.calls.clear()
+    async with bot_server(
+        mode, api_port, sink.port, workers=args.workers, flood_control=args.flood_control
+    ) as (base_url, _):
+        load = LoadGenerator(
+            f"{base_url}/webhook/{SECRET}",
+            fake,
+            users=args.users,
+            flows_per_user=args.flows,
+            reply_timeout=args.reply_timeout,
+            seed=args.seed,
+        )
+        stats = await load.run()
+        delivered = await sink.wait_for(stats.email_flows, args.mail_timeout)
+
+    elapsed = stats.finished - stats.started
+    mail_window = (sink.last_at or stats.started) - stats.started
+    return {
+        "mode": mode,
+        "updates": stats.updates,
+        "updates_per_sec": stats.updates / elapsed if elapsed else 0.0,
+        "ack_ms": percentiles(stats.ack),
+        "reply_ms": percentiles(stats.reply),
+        "emails_expected": stats.email_flows,
+        "emails": sink.messages,
+        "emails_per_sec": sink.messages / mail_window if mail_window > 0 else 0.0,
+        "smtp_sessions": sink.sessions,
+        "errors": stats.errors,
+        "timeouts": stats.timeouts + (0 if delivered else stats.email_flows - sink.messages),
+        "bot_api_calls": sum(fake.calls.values()),
+    }
+
+
+def print_table(results: list[dict]) -> None:
+    header = (
+        f"{'mode':<18} {'upd/s':>7} {'ack p50':>8} {'p95':>7} {'p99':>7} "
+        f"{'reply p50':>10} {'p95':>7} {'p99':>7} {'emails':>9} {'mail/s':>7} {'err':>4} {'t/o':>4}"
+    )
+    print(header)
+    print("─" * len(header))
+    for r in results:
+        ack, reply = r["ack_ms"], r["reply_ms"]
+        print(
+            f"{r['mode']:<18} {r['updates_per_sec']:>7.1f} "
+            f"{ack['p50']:>8.1f} {ack['p95']:>7.1f} {ack['p99']:>7.1f} "
+            f"{reply['p50']:>10.1f} {reply['p95']:>7.1f} {reply['p99']:>7.1f} "
+            f"{r['emails']:>4}/{r['emails_expected']:<4} {r['emails_per_sec']:>7.1f} "
+            f"{r['errors']:>4} {r['timeouts']:>4}"
+        )
+    print("(latencies in ms; reply = update sent → bot's first reply in that chat)")
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """Regressions against a previous ``--json`` file, one line each."""
+    baseline = {r["mode"]: r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    problems = []
+    for r in results:
+        old = baseline.get(r["mode"])
+        if old is None:
+            continue
+        for key in sorted(k for k in r if k.endswith("_ms") and k in old):
+            if r[key]["p95"] > old[key]["p95"] * (1 + tolerance):
+                problems.append(
+                    f"{r['mode']}: {key} p95 {r[key]['p95']:.1f} > {old[key]['p95']:.1f} "
+                    f"(+{tolerance:.0%} allowed)"
+                )
+        if r["updates_per_sec"] < old["updates_per_sec"] * (1 - tolerance):
+            problems.append(
+                f"{r['mode']}: updates/s {r['updates_per_sec']:.1f} < "
+                f"{old['updates_per_sec']:.1f} (-{tolerance:.0%} allowed)"
+            )
+        if r["errors"] + r["timeouts"] > old["errors"] + old["timeouts"]:
+            problems.append(f"{r['mode']}: more errors/timeouts than the baseline")
+    return problems
+
+
+async def main(args) -> int:
+    results = []
+    async with stand_ins(args.api_latency / 1000) as (fake, api_port, sink):
+        for mode in args.modes:
+            print(f"→ {mode} …", file=sys.stderr)
+            results.append(await run_mode(mode, fake, api_port, sink, args))
+
+    print_table(results)
+    return report(results, args)
+
+
+def report(results: list[dict], args) -> int:
+    """Save ``--json`` and check ``--baseline``; the process exit code."""
+    if args.json:
+        Path(args.json).write_text(json.dumps({"config": vars(args), "results": results}, indent=2))
+    if args.baseline:
+        problems = compare(results, args.baseline, args.tolerance)
+        for line in problems:
+            print(f"REGRESSION {line}")
+        return 1 if problems else 0
+    return 0
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.split("\n")[0])
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"comma-separated, from: {', '.join(MODES)}")
+    parser.add_argument("--users", type=int, default=20, help="concurrent chats")
+    parser.add_argument("--flows", type=int, default=3, help="flows per chat")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="ms the fake Bot API waits before answering")
+    parser.add_argument("--flood-control", action="store_true",
+                        help="keep outbound flood control on (off by default)")
+    parser.add_argument("--reply-timeout", type=float, default=10.0)
+    parser.add_argument("--mail-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed regression vs the baseline (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
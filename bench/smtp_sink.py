@@ -0,0 +1,98 @@
+"""A local SMTP server that accepts and counts every message.
+
+Speaks just enough ESMTP for :mod:`smtplib`: EHLO with ``AUTH PLAIN
+LOGIN`` advertised (any credentials are accepted), MAIL/RCPT/DATA, RSET,
+NOOP and QUIT.  No STARTTLS — run the bot with ``SMTP_STARTTLS=0``.
+With ``keep=True`` each message's DATA is kept, as sent on the wire.
+"""
+import asyncio
+import time
+
+
+class SMTPSink:
+    def __init__(self, keep: bool = False) -> None:
+        self.keep = keep
+        self.received: list[bytes] = []
+        self.messages = 0
+        self.sessions = 0
+        self.first_at: float | None = None
+        self.last_at: float | None = None
+        self._server: asyncio.base_events.Server | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        self.port = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._session, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Pooled sessions from the bot stay open; end them from our side
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+    def drop_sessions(self) -> None:
+        """Close every open session from our side, as an idle-timeout would."""
+        for writer in list(self._writers):
+            writer.close()
+
+    def reset(self) -> None:
+        self.received.clear()
+        self.messages = self.sessions = 0
+        self.first_at = self.last_at = None
+
+    async def wait_for(self, count: int, timeout: float) -> bool:
+        """Wait until *count* messages have arrived; ``False`` on timeout."""
+        deadline = time.perf_counter() + timeout
+        while self.messages < count:
+            if time.perf_counter() > deadline:
+                return False
+            await asyncio.sleep(0.02)
+        return True
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.sessions += 1
+        self._writers.add(writer)
+
+        async def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        try:
+            await reply("220 bench-sink ESMTP")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command = line.decode(errors="replace").strip().upper()
+                if command.startswith(("EHLO", "HELO")):
+                    writer.write(b"250-bench-sink\r\n250-AUTH PLAIN LOGIN\r\n")
+                    await reply("250 8BITMIME")
+                elif command.startswith("AUTH"):
+                    await reply("235 2.7.0 Authentication successful")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = bytearray()
+                    while (line := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        if self.keep:
+                            data += line
+                    if self.keep:
+                        self.received.append(bytes(data))
+                    now = time.perf_counter()
+                    self.first_at = self.first_at or now
+                    self.last_at = now
+                    self.messages += 1
+                    await reply("250 2.0.0 Ok: queued")
+                elif command == "QUIT":
+                    await reply("221 2.0.0 Bye")
+                    return
+                else:
+                    await reply("250 2.0.0 Ok")
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
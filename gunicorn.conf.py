@@ -0,0 +1,23 @@
+"""Gunicorn settings, read automatically when gunicorn starts in this directory.
+
+The app is imported once in the master and forked into the workers, which
+share those modules' memory and skip the import on every (re)spawn.  Each
+worker then builds its own bot — HTTP clients, database connections, event
+loop — before it accepts a request.  ``GUNICORN_PRELOAD=0`` imports in each
+worker instead.
+"""
+import importlib
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    # httpx imports httpcore only when it builds its first client, i.e. in each
+    # worker; importing it in the master shares it with every forked worker
+    importlib.import_module("httpcore")
+
+
+def post_worker_init(worker):
+    from app.web import warm_up
+    warm_up()
@@ -0,0 +1,207 @@
+"""SMTPPool and the streamed send, against the in-process bench SMTP sink."""
+import asyncio
+import io
+import smtplib
+import socket
+import threading
+import time
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+from app.utils.email_sender import SMTPPool, _sendmail_streamed, _streamed_message
+from bench.smtp_sink import SMTPSink
+
+SENDER = "bot@example.com"
+RECIPIENTS = ["to@example.com", "cc@example.com"]
+
+
+@pytest.fixture
+def sink():
+    """A running :class:`SMTPSink` on its own event loop thread."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = SMTPSink(keep=True)
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    server.loop = loop
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def make_pool(sink: SMTPSink, **kwargs) -> SMTPPool:
+    kwargs.setdefault("max_size", 2)
+    kwargs.setdefault("max_idle", 60.0)
+    return SMTPPool(
+        "127.0.0.1", sink.port, "user", "secret", starttls=False, timeout=5, **kwargs
+    )
+
+
+def send(pool: SMTPPool, text: str = "hello") -> None:
+    with pool.connection() as server:
+        server.sendmail(SENDER, RECIPIENTS, f"Subject: test\r\n\r\n{text}\r\n")
+
+
+def test_sessions_are_reused(sink):
+    pool = make_pool(sink)
+    for _ in range(3):
+        send(pool)
+    assert sink.messages == 3
+    assert sink.sessions == 1
+    assert pool.stats()["connects"] == 1
+    assert pool.stats()["reuses"] == 2
+    pool.close()
+
+
+def test_failed_noop_discards_the_session(sink, monkeypatch):
+    pool = make_pool(sink)
+    send(pool)
+    server, _ = pool._idle[-1]
+    monkeypatch.setattr(server, "noop", lambda: (421, b"closing"))
+    send(pool)
+    stats = pool.stats()
+    assert stats["discarded_stale"] == 1
+    assert stats["connects"] == 2
+    assert sink.messages == 2
+    pool.close()
+
+
+def test_sessions_idle_past_max_idle_are_replaced(sink):
+    pool = make_pool(sink, max_idle=0.05)
+    send(pool)
+    time.sleep(0.1)
+    send(pool)
+    stats = pool.stats()
+    assert stats["discarded_stale"] == 1
+    assert stats["reuses"] == 0
+    assert stats["connects"] == 2
+    pool.close()
+
+
+def test_reconnects_after_the_server_drops(sink):
+    pool = make_pool(sink)
+    send(pool)
+    sink.loop.call_soon_threadsafe(sink.drop_sessions)
+    time.sleep(0.1)
+    send(pool)
+    stats = pool.stats()
+    assert stats["discarded_stale"] == 1
+    assert stats["connects"] == 2
+    assert sink.messages == 2
+    pool.close()
+
+
+def test_max_size_caps_open_sessions(sink):
+    pool = make_pool(sink, max_size=2)
+    release = threading.Event()
+    borrowed = threading.Barrier(3)
+
+    def hold():
+        with pool.connection():
+            borrowed.wait(5)
+            release.wait(5)
+
+    holders = [threading.Thread(target=hold) for _ in range(2)]
+    for holder in holders:
+        holder.start()
+    borrowed.wait(5)
+
+    third = threading.Thread(target=send, args=(pool,))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive()   # blocked until a session is released
+    assert pool.stats()["in_use"] == 2
+
+    release.set()
+    for thread in [*holders, third]:
+        thread.join(5)
+    assert sink.messages == 1
+    assert sink.sessions == 2
+    assert pool.stats()["in_use"] == 0
+    pool.close()
+
+
+def test_reply_errors_keep_the_session(sink):
+    pool = make_pool(sink)
+    send(pool)
+    with pytest.raises(smtplib.SMTPDataError):
+        with pool.connection():
+            raise smtplib.SMTPDataError(554, b"rejected")
+    send(pool)
+    stats = pool.stats()
+    assert stats["discarded_broken"] == 0
+    assert stats["connects"] == 1
+    pool.close()
+
+
+def test_socket_errors_discard_the_session(sink):
+    pool = make_pool(sink)
+    with pytest.raises(socket.timeout):
+        with pool.connection():
+            raise socket.timeout("timed out")
+    send(pool)
+    stats = pool.stats()
+    assert stats["discarded_broken"] == 1
+    assert stats["connects"] == 2
+    pool.close()
+
+
+class _Session:
+    def __init__(self, connected: bool = True) -> None:
+        self.sock = object() if connected else None
+
+
+@pytest.mark.parametrize(
+    ("exc", "connected", "broken"),
+    [
+        (smtplib.SMTPDataError(554, b"rejected"), True, False),
+        (smtplib.SMTPRecipientsRefused({"x@example.com": (550, b"no")}), True, False),
+        (smtplib.SMTPNotSupportedError("no AUTH"), True, False),
+        (smtplib.SMTPServerDisconnected("gone"), True, True),
+        (ConnectionResetError(), True, True),
+        (socket.timeout("timed out"), True, True),
+        (smtplib.SMTPDataError(421, b"closing"), False, True),
+        (ValueError("mid-message"), False, True),
+    ],
+)
+def test_is_broken(exc, connected, broken):
+    assert SMTPPool._is_broken(_Session(connected), exc) is broken
+
+
+def _message(boundary: str) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg["From"] = SENDER
+    msg["To"] = RECIPIENTS[0]
+    msg["Subject"] = "Streamed"
+    msg.set_boundary(boundary)
+    msg.attach(MIMEText("First line\n.leading dot\nlast line", "plain"))
+    return msg
+
+
+def test_streamed_send_matches_sendmail(sink):
+    content = bytes(range(256)) * 1000   # spans several base64 read chunks
+    pool = make_pool(sink)
+    with pool.connection() as server:
+        streamed = _streamed_message(
+            _message("==bench=="), [("data.bin", "application/octet-stream", io.BytesIO(content))]
+        )
+        _sendmail_streamed(server, SENDER, RECIPIENTS, streamed)
+
+        # The same message with the attachment encoded in memory
+        msg = _message("==bench==")
+        part = MIMEBase("application", "octet-stream")
+        part.add_header("Content-Disposition", "attachment", filename="data.bin")
+        part.set_payload(content)
+        encoders.encode_base64(part)
+        msg.attach(part)
+        server.sendmail(SENDER, RECIPIENTS, msg.as_string())
+    pool.close()
+
+    assert sink.messages == 2
+    assert sink.received[0] == sink.received[1]